@@ -20,7 +20,10 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterEnum,
                        QgsProcessingParameterAuthConfig,
                        QgsAuthMethodConfig,
-                       QgsMapLayerType)
+                       QgsDataSourceUri,
+                       QgsMapLayerType,
+                       QgsProject)
+import hashlib
 import mysql.connector
 
 class ClaimTrackerSyncTenuresTool(QgsProcessingAlgorithm):
@@ -28,6 +31,7 @@ class ClaimTrackerSyncTenuresTool(QgsProcessingAlgorithm):
     TABLE_NAME = "TABLE_NAME"
     JURISDICTION = "JURISDICTION"
     AUTH_CONFIG = "AUTH_CONFIG"
+    CHUNK_SIZE = 1000 # tenures per multi-row INSERT or DELETE statement
 
     JURISDICTION_FIELD_MAP = {
         "YK":  "GRANT_NUM",
@@ -37,6 +41,35 @@ class ClaimTrackerSyncTenuresTool(QgsProcessingAlgorithm):
         "BC":  "TENURE_NUMBER_ID"
     }
 
+    _connections = {} # (auth config, host, database, user, password digest) -> connection kept open across runs of
+                      # the tool in a QGIS session
+
+    @classmethod
+    def _connect(cls, auth_config_id, host, db_name, user, pw, **kwargs):
+        """ reuse the connection of a previous run with the same credentials, reconnecting if the server has dropped
+            it """
+        key = (auth_config_id, host, db_name, user, hashlib.sha256((pw or "").encode()).hexdigest())
+        cnx = cls._connections.get(key)
+        if cnx is not None:
+            try:
+                cnx.ping(reconnect=True, attempts=1, delay=0)
+                return cnx
+            except mysql.connector.Error:
+                cls._connections.pop(key, None)
+        cnx = mysql.connector.connect(host=host, database=db_name, user=user, password=pw, connect_timeout=5, **kwargs)
+        cls._connections[key] = cnx
+        return cnx
+
+    @staticmethod
+    def _reads_table(layer, table):
+        """ whether a vector layer's data source is the claimtable (a MySQL layer or an OGR layername) """
+        if not table:
+            return False
+        uri = QgsDataSourceUri(layer.source())
+        if uri.table() == table or uri.param("layername") == table:
+            return True
+        return ("layername=" + table) in layer.source().split("|")[1:]
+
     def name(self): return "sync_tenures"
     def displayName(self): return "Add or Delete Tenures"
     def group(self): return "Claimtracker: Mineral Tenure Tracking"
@@ -55,6 +88,7 @@ class ClaimTrackerSyncTenuresTool(QgsProcessingAlgorithm):
 
         mode_index = self.parameterAsEnum(parameters, self.MODE, context)
         table = self.parameterAsString(parameters, self.TABLE_NAME, context)
+        self.table = table # layers reading this table are reloaded in postProcessAlgorithm
         jur = self.parameterAsString(parameters, self.JURISDICTION, context)
 
         auth_config_id = self.parameterAsString(parameters, self.AUTH_CONFIG, context)
@@ -81,25 +115,35 @@ class ClaimTrackerSyncTenuresTool(QgsProcessingAlgorithm):
             feedback.reportError(f"CRITICAL: Unknown jurisdiction '{jur}'. Cannot determine tenure ID field.")
             return {"STATUS": "Unknown Jurisdiction"}
 
-        parcels = [(str(f.attribute(tenure_field)),) for f in features]
+        parcels = list(dict.fromkeys(str(f.attribute(tenure_field)) for f in features)) # unique, in selection order
+        chunks = [parcels[i:i + self.CHUNK_SIZE] for i in range(0, len(parcels), self.CHUNK_SIZE)]
 
         try:
-            cnx = mysql.connector.connect(host=host, database=db_name, user=user, password=pw, connect_timeout=5)
+            cnx = self._connect(auth_config_id, host, db_name, user, pw)
             if cnx.is_connected():
                 cur = cnx.cursor()
 
                 if mode_index == 0:  # add mode
                     feedback.pushInfo(f"Adding {len(parcels)} claims...")
-                    query = f"INSERT IGNORE INTO {table} (RegTitleNumber) VALUES (%s)"
-                    cur.executemany(query, parcels)
-                    # set jurisdiction for new records only
-                    setjur = f"UPDATE {table} SET Jurisdiction = %s WHERE Jurisdiction IS NULL"
-                    cur.execute(setjur, (jur,))
+                    # one multi-row statement per chunk, with the jurisdiction set inline; existing rows keep their
+                    # jurisdiction unless it was never set
+                    for i, chunk in enumerate(chunks):
+                        if feedback.isCanceled():
+                            return {"STATUS": "Canceled"}
+                        values = ", ".join(["(%s, %s)"] * len(chunk))
+                        query = f"INSERT INTO {table} (RegTitleNumber, Jurisdiction) VALUES {values} " \
+                                "ON DUPLICATE KEY UPDATE Jurisdiction = COALESCE(Jurisdiction, VALUES(Jurisdiction))"
+                        cur.execute(query, [v for p in chunk for v in (p, jur)])
+                        feedback.setProgress(100 * (i + 1) / len(chunks))
 
                 else:  # delete mode
                     feedback.pushInfo(f"Deleting {len(parcels)} claims...")
-                    query = f"DELETE FROM {table} WHERE RegTitleNumber = %s"
-                    cur.executemany(query, parcels)
+                    for i, chunk in enumerate(chunks):
+                        if feedback.isCanceled():
+                            return {"STATUS": "Canceled"}
+                        query = f"DELETE FROM {table} WHERE RegTitleNumber IN ({', '.join(['%s'] * len(chunk))})"
+                        cur.execute(query, chunk)
+                        feedback.setProgress(100 * (i + 1) / len(chunks))
 
                 cnx.commit()
                 feedback.pushInfo(f"Successfully processed {len(parcels)} records in MySQL.")
@@ -107,23 +151,42 @@ class ClaimTrackerSyncTenuresTool(QgsProcessingAlgorithm):
         except Exception as e:
             feedback.reportError(f"DATABASE ERROR: {e}")
         finally:
-            if "cnx" in locals() and cnx.is_connected():
+            # the connection stays open for the next run (see _connect): a transaction that an error, a cancel or an
+            # early return left uncommitted is rolled back rather than carried into it
+            if "cur" in locals():
                 cur.close()
-                cnx.close()
+            if "cnx" in locals():
+                try:
+                    if cnx.in_transaction:
+                        cnx.rollback()
+                except mysql.connector.Error:
+                    pass # a dropped connection is replaced by the next _connect
 
         return {"STATUS": "Complete"}
 
     def postProcessAlgorithm(self, context, feedback):
         from qgis.utils import iface
-        from qgis.core import QgsMapLayerType
 
         feedback.pushInfo("Refreshing Viewport Symbology...")
         active_layer = iface.activeLayer()
         if active_layer:
             active_layer.removeSelection()
 
-        for layer in iface.mapCanvas().layers():
-            if layer.type() == QgsMapLayerType.VectorLayer:
+        # reload only the layers reading the edited claimtable, and repaint the canvas layers joined to them
+        table = getattr(self, "table", "")
+        canvas_layers = [l for l in iface.mapCanvas().layers() if l.type() == QgsMapLayerType.VectorLayer]
+        sources = [l for l in QgsProject.instance().mapLayers().values()
+                   if l.type() == QgsMapLayerType.VectorLayer and self._reads_table(l, table)]
+        if sources:
+            for layer in sources:
+                layer.dataProvider().forceReload()
+            for layer in canvas_layers:
+                if layer in sources or any(j.joinLayer() in sources for j in layer.vectorJoins()):
+                    layer.triggerRepaint()
+            feedback.pushInfo(f"Reloaded {len(sources)} layer(s) reading <{table}>.")
+        else:
+            feedback.pushInfo(f"No layer reads <{table}> directly, reloading every vector layer.")
+            for layer in canvas_layers:
                 layer.dataProvider().forceReload()
                 layer.triggerRepaint()
 
@@ -19,14 +19,19 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterString,
                        QgsProcessingParameterAuthConfig,
                        QgsAuthMethodConfig,
-                       QgsMapLayerType)
+                       QgsDataSourceUri,
+                       QgsMapLayerType,
+                       QgsProject)
+import hashlib
 import mysql.connector
+from mysql.connector.constants import ClientFlag
 
 class ClaimTrackerAssignProjectTool(QgsProcessingAlgorithm):
     PROJECT_NAME = "PROJECT_NAME"
     TABLE_NAME = "TABLE_NAME"
     JURISDICTION = "JURISDICTION"
     AUTH_CONFIG = "AUTH_CONFIG"
+    CHUNK_SIZE = 1000 # tenures per UPDATE statement
 
     JURISDICTION_FIELD_MAP = {
         "YK":  "GRANT_NUM",
@@ -36,6 +41,35 @@ class ClaimTrackerAssignProjectTool(QgsProcessingAlgorithm):
         "BC":  "TENURE_NUMBER_ID"
     }
 
+    _connections = {} # (auth config, host, database, user, password digest) -> connection kept open across runs of
+                      # the tool in a QGIS session
+
+    @classmethod
+    def _connect(cls, auth_config_id, host, db_name, user, pw, **kwargs):
+        """ reuse the connection of a previous run with the same credentials, reconnecting if the server has dropped
+            it """
+        key = (auth_config_id, host, db_name, user, hashlib.sha256((pw or "").encode()).hexdigest())
+        cnx = cls._connections.get(key)
+        if cnx is not None:
+            try:
+                cnx.ping(reconnect=True, attempts=1, delay=0)
+                return cnx
+            except mysql.connector.Error:
+                cls._connections.pop(key, None)
+        cnx = mysql.connector.connect(host=host, database=db_name, user=user, password=pw, connect_timeout=5, **kwargs)
+        cls._connections[key] = cnx
+        return cnx
+
+    @staticmethod
+    def _reads_table(layer, table):
+        """ whether a vector layer's data source is the claimtable (a MySQL layer or an OGR layername) """
+        if not table:
+            return False
+        uri = QgsDataSourceUri(layer.source())
+        if uri.table() == table or uri.param("layername") == table:
+            return True
+        return ("layername=" + table) in layer.source().split("|")[1:]
+
     def name(self): return "assign_tenures_to_project"
     def displayName(self): return "Assign Tenures to Project"
     def group(self): return "Claimtracker: Mineral Tenure Tracking"
@@ -54,6 +88,7 @@ class ClaimTrackerAssignProjectTool(QgsProcessingAlgorithm):
 
         project = self.parameterAsString(parameters, self.PROJECT_NAME, context)
         table = self.parameterAsString(parameters, self.TABLE_NAME, context)
+        self.table = table # layers reading this table are reloaded in postProcessAlgorithm
         jur = self.parameterAsString(parameters, self.JURISDICTION, context)
 
         auth_config_id = self.parameterAsString(parameters, self.AUTH_CONFIG, context)
@@ -80,57 +115,83 @@ class ClaimTrackerAssignProjectTool(QgsProcessingAlgorithm):
             feedback.reportError(f"CRITICAL: Unknown jurisdiction '{jur}'. Cannot determine tenure ID field.")
             return {"STATUS": "Unknown Jurisdiction"}
 
-        selected_ids = [str(f.attribute(tenure_field)) for f in features]
+        selected_ids = list(dict.fromkeys(str(f.attribute(tenure_field)) for f in features)) # unique
+        chunks = [selected_ids[i:i + self.CHUNK_SIZE] for i in range(0, len(selected_ids), self.CHUNK_SIZE)]
 
         try:
-            cnx = mysql.connector.connect(host=host, database=db_name, user=user, password=pw, connect_timeout=5)
+            # FOUND_ROWS: the row count of an UPDATE is the number of matched rows, including unchanged ones
+            cnx = self._connect(auth_config_id, host, db_name, user, pw, client_flags=[ClientFlag.FOUND_ROWS])
             cur = cnx.cursor()
 
-            # safety: check which of these IDs actually exist in the database
-            format_strings = ",".join(["%s"] * len(selected_ids))
-            check_query = f"SELECT RegTitleNumber FROM {table} WHERE RegTitleNumber IN ({format_strings})"
-            cur.execute(check_query, tuple(selected_ids))
-
-            existing_ids = [row[0] for row in cur.fetchall()]
-            missing_ids = list(set(selected_ids) - set(existing_ids))
+            # one set-based UPDATE per chunk, in a single transaction. the matched row count is the safety check, and
+            # only a chunk that comes back short is read again to name the claims that aren't in the table
+            existing = 0
+            missing_ids = []
+            for i, chunk in enumerate(chunks):
+                if feedback.isCanceled():
+                    return {"STATUS": "Canceled"}
+                placeholders = ", ".join(["%s"] * len(chunk))
+                update_query = f"UPDATE {table} SET ProjectName = %s WHERE RegTitleNumber IN ({placeholders})"
+                cur.execute(update_query, [project] + chunk)
+                existing += cur.rowcount
+                if cur.rowcount < len(chunk):
+                    cur.execute(f"SELECT RegTitleNumber FROM {table} WHERE RegTitleNumber IN ({placeholders})", chunk)
+                    found = {str(row[0]) for row in cur.fetchall()}
+                    missing_ids += [x for x in chunk if x not in found]
+                feedback.setProgress(100 * (i + 1) / len(chunks))
 
             if missing_ids:
-                feedback.reportError(f"SAFETY CHECK: {len(missing_ids)} claims are NOT in the database and will be skipped.")
+                feedback.reportError(f"SAFETY CHECK: {len(missing_ids)} claims are NOT in the database and were skipped.")
                 for m_id in missing_ids:
                     feedback.pushInfo(f"Missing ID: {m_id}")
 
-            if not existing_ids:
+            if not existing:
                 feedback.reportError("Aborting: None of the selected claims exist in the database. Use the 'Add' tool first.")
                 return {"STATUS": "Failed Safety Check"}
 
-            # only update the ones that exist
-            update_data = [(project, x) for x in existing_ids]
-            update_query = f"UPDATE {table} SET ProjectName = %s WHERE RegTitleNumber = %s"
-            cur.executemany(update_query, update_data)
             cnx.commit()
 
-            feedback.pushInfo(f"SUCCESS: Assigned {len(existing_ids)} claims to project '{project}'.")
+            feedback.pushInfo(f"SUCCESS: Assigned {existing} claims to project '{project}'.")
 
         except Exception as e:
             feedback.reportError(f"DATABASE ERROR: {e}")
         finally:
-            if "cnx" in locals() and cnx.is_connected():
+            # the connection stays open for the next run (see _connect): a transaction that an error, a cancel or an
+            # early return left uncommitted is rolled back rather than carried into it
+            if "cur" in locals():
                 cur.close()
-                cnx.close()
+            if "cnx" in locals():
+                try:
+                    if cnx.in_transaction:
+                        cnx.rollback()
+                except mysql.connector.Error:
+                    pass # a dropped connection is replaced by the next _connect
 
         return {"STATUS": "Complete"}
 
     def postProcessAlgorithm(self, context, feedback):
         from qgis.utils import iface
-        from qgis.core import QgsMapLayerType
 
         feedback.pushInfo("Refreshing Viewport Symbology...")
         active_layer = iface.activeLayer()
         if active_layer:
             active_layer.removeSelection()
 
-        for layer in iface.mapCanvas().layers():
-            if layer.type() == QgsMapLayerType.VectorLayer:
+        # reload only the layers reading the edited claimtable, and repaint the canvas layers joined to them
+        table = getattr(self, "table", "")
+        canvas_layers = [l for l in iface.mapCanvas().layers() if l.type() == QgsMapLayerType.VectorLayer]
+        sources = [l for l in QgsProject.instance().mapLayers().values()
+                   if l.type() == QgsMapLayerType.VectorLayer and self._reads_table(l, table)]
+        if sources:
+            for layer in sources:
+                layer.dataProvider().forceReload()
+            for layer in canvas_layers:
+                if layer in sources or any(j.joinLayer() in sources for j in layer.vectorJoins()):
+                    layer.triggerRepaint()
+            feedback.pushInfo(f"Reloaded {len(sources)} layer(s) reading <{table}>.")
+        else:
+            feedback.pushInfo(f"No layer reads <{table}> directly, reloading every vector layer.")
+            for layer in canvas_layers:
                 layer.dataProvider().forceReload()
                 layer.triggerRepaint()
 
@@ -17,17 +17,21 @@ import os
 import sys
 import argparse
 import configparser
+import json
 import logging
 import atexit
-import urllib
-import sqlalchemy
 from sqlalchemy import text, exc
 import pygsheets
-from claimtable import ClaimTable, TableDefinition, claimtables
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from claimtable import ClaimTable, TableDefinition, claimtables, geometry_cache, schema_catalog, tenure_cache
+from database import Database, DbDefinition
+from response_cache import ResponseCache
+import arcweb_data
+import metrics
+from tracing import tracer
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify
 from flask_wtf.csrf import CSRFProtect, generate_csrf
 from threading import Thread
-from scheduler import Scheduler
+from scheduler import RefreshTiers, Scheduler
 from datetime import datetime
 from cron_converter import Cron
 
@@ -38,32 +42,6 @@ csrf = CSRFProtect(app)
 version = "0.4.2"
 config_path = "claimtracker.conf"
 
-class DbDefinition:
-    user = ""
-    password = ""
-    address = ""
-    trusted_conn = False
-    driver = "{MySQL ODBC 9.2 Unicode Driver}" # modify as neccessary
-    database = ""
-    port = "3306" # default port
-
-    def connection_string(self):
-        if self.trusted_conn:
-            params = urllib.parse.quote_plus("DRIVER=" + self.driver + ";" +
-                                             "SERVER=" + self.address + ";" +
-                                             "PORT=" + self.port + ";" +
-                                             "DATABASE=" + self.database + ";" +
-                                             "Trusted_Connection=yes")
-            return "mysql+pyodbc:///?odbc_connect={}".format(params)
-        else:
-            params = urllib.parse.quote_plus("DRIVER=" + self.driver + ";" +
-                                             "SERVER=" + self.address + ";" +
-                                             "PORT=" + self.port + ";" +
-                                             "DATABASE=" + self.database + ";" +
-                                             "UID=" + self.user + ";" +
-                                             "PWD=" + self.password)
-        return "mysql+pyodbc:///?odbc_connect={}".format(params)
-
 class Configuration(configparser.RawConfigParser):
     """ implements a configuration parser for an INI-type of language, sets defaults and validates settings """
     def __init__(self):
@@ -102,6 +80,48 @@ class Configuration(configparser.RawConfigParser):
                   % self.get("Logging", "filename"), file=sys.stderr)
             exit()
         # Validate the database settings - how?
+        if not self.has_section("Database"):
+            self.add_section("Database")
+        if not self.has_option("Database", "connector") or \
+                self.get("Database", "connector") not in DbDefinition.connectors:
+            self.set("Database", "connector", "pyodbc")
+        # connection pool shared by all claimtables; size it to the number of tables that sync concurrently
+        for option, default in [("pool_size", "5"), ("max_overflow", "10"), ("pool_timeout", "30"),
+                                ("pool_recycle", "3600")]:
+            try:
+                if int(self.get("Database", option)) < 0:
+                    self.set("Database", option, default)
+            except:
+                self.set("Database", option, default)
+        # Validate the ArcGIS response cache settings (see response_cache.py)
+        if not self.has_section("Cache"):
+            self.add_section("Cache")
+        if not self.has_option("Cache", "mode") or self.get("Cache", "mode") not in ResponseCache.modes:
+            self.set("Cache", "mode", "off")
+        if not self.has_option("Cache", "directory"):
+            self.set("Cache", "directory", "cache")
+        for option, default in [("ttl", "86400"), ("max_mb", "256")]:
+            try:
+                if int(self.get("Cache", option)) <= 0:
+                    self.set("Cache", option, default)
+            except:
+                self.set("Cache", option, default)
+        if not self.has_option("Cache", "server"):
+            self.set("Cache", "server", "")
+        # Validate the tracing settings (see tracing.py)
+        if not self.has_section("Tracing"):
+            self.add_section("Tracing")
+        if not self.has_option("Tracing", "enabled") or self.get("Tracing", "enabled") not in ("True", "False"):
+            self.set("Tracing", "enabled", "False")
+        if not self.has_option("Tracing", "directory"):
+            self.set("Tracing", "directory", "reports")
+        if not self.has_option("Tracing", "profile_table"):
+            self.set("Tracing", "profile_table", "")
+        try:
+            if int(self.get("Tracing", "max_reports")) <= 0:
+                self.set("Tracing", "max_reports", "100")
+        except:
+            self.set("Tracing", "max_reports", "100")
         # Validate the credential settings
         if not self.has_section("Credentials"):
             self.add_section("Credentials")
@@ -114,6 +134,32 @@ class Configuration(configparser.RawConfigParser):
             self.set("Tables", "config_suffix", "__cnfg")
         if not self.has_option("Tables", "compact_suffix"):
             self.set("Tables", "compact_suffix", "__cmpct")
+        if not self.has_option("Tables", "refresh_suffix"):
+            self.set("Tables", "refresh_suffix", "__rfsh")
+        try:
+            if int(self.get("Tables", "tenure_cache_max_age")) < 0:
+                self.set("Tables", "tenure_cache_max_age", "43200")
+        except:
+            self.set("Tables", "tenure_cache_max_age", "43200")
+        try:
+            RefreshTiers.parse(self.get("Tables", "refresh_tiers"))
+        except:
+            self.set("Tables", "refresh_tiers", "")
+        # Validate the geometry settings (see claimtable.GeometryCache)
+        if not self.has_section("Geometry"):
+            self.add_section("Geometry")
+        if not self.has_option("Geometry", "enabled") or self.get("Geometry", "enabled") not in ("True", "False"):
+            self.set("Geometry", "enabled", "False")
+        try:
+            if float(self.get("Geometry", "max_allowable_offset")) < 0:
+                self.set("Geometry", "max_allowable_offset", "0.0001")
+        except:
+            self.set("Geometry", "max_allowable_offset", "0.0001")
+        try:
+            if int(self.get("Geometry", "geometry_precision")) < 0:
+                self.set("Geometry", "geometry_precision", "6")
+        except:
+            self.set("Geometry", "geometry_precision", "6")
 
     def load(self, filename):
         """ reads the configuration file if it exists """
@@ -134,32 +180,18 @@ configuration = Configuration()
 configuration.validate() # this sets the defaults before the main execution
 
 # shared among functions - initialize these later
-db_engine = None
+database = None
 suffix = {}
 
 @app.route("/", methods=["GET", "POST"])
 @app.route("/<string:table_name>", methods=["GET", "POST"])
 def index(table_name=None):
     """ mapped index URL to the index function """
-    tables = []
-    table_urls = {}
-    table_properties = {}
+    tables = claimtables.titles()
+    selected_table = None
     selected_url = None
+    selected_properties = {}
 
-    global claimtables
-    for c in claimtables:
-        tables.append(c.title)
-        table_urls[c.title] = c.sheet1.url
-        # want the raw data from c.config_df, and then we can write_config if there are changes
-        table_properties[c.title] = {
-            "ColumnOrder": c.config_df["ColumnOrder"].iloc[0],
-            "AccessList": c.config_df["AccessList"].iloc[0],
-            "UpdateSched": c.config_df["UpdateSched"].iloc[0],
-            "EmailSched": c.config_df["EmailSched"].iloc[0],
-            "Prune": str(c.config_df["Prune"].iloc[0] == 1),
-            "Compact": str(c.config_df["Compact"].iloc[0] == 1),
-            "CompactColumnOrder": c.config_df["CompactColumnOrder"].iloc[0]
-        }
     if request.method == "POST":
         selected_table = request.form.get("table_select")
         if selected_table:
@@ -169,22 +201,23 @@ def index(table_name=None):
             selected_table = table_name
         elif tables:
             selected_table = tables[0]
-        if selected_table:
-            selected_url = table_urls.get(selected_table) + "?rm=minimal"
-            selected_properties = table_properties.get(selected_table, {})
+        snapshot = claimtables.snapshot(selected_table) if selected_table else None
+        if snapshot:
+            selected_url = snapshot.url + "?rm=minimal"
+            selected_properties = snapshot.properties
     return render_template("__layout.html", tables=tables, selected_table=selected_table, \
                            selected_url=selected_url, property_values=selected_properties, \
                            csrf_token=generate_csrf())
 
 def is_valid_column_order(column_order_string, table_name):
-    """ validates that all columns in a semicolon-delimited string exist in the SQL table """
+    """ validates that all columns in a semicolon-delimited string exist in the SQL table, using the cached schema """
     try:
         columns = [c.strip() for c in column_order_string.split(";") if c.strip()]
         if len(columns) < 2:
             return False, "column order must have at least 2 columns"
-        with db_engine.connect() as conn:
-            result = conn.execute(text("SHOW COLUMNS FROM " + table_name))
-            valid_columns = {row[0] for row in result}
+        valid_columns = schema_catalog.columns(table_name)
+        if valid_columns is None:
+            return False, "table <" + table_name + "> does not exist"
         invalid = [c for c in columns if c not in valid_columns]
         if invalid:
             return False, "unknown column(s): " + ", ".join(invalid)
@@ -240,9 +273,9 @@ def update_properties():
         "CompactColumnOrder": [data.get("CompactColumnOrder")]
     }
     try:
-        for c in claimtables:
-            if c.title == table_name:
-                c.update_config(new_properties)
+        c = claimtables.get(table_name)
+        if c:
+            c.update_config(new_properties)
     except Exception as e:
         logging.error("Error updating properties for table <%s>", table_name)
         logging.error(e)
@@ -257,22 +290,81 @@ def update_table():
     if not table_name:
         table_name = "untitled"
 
-    global claimtables
     try:
-        for c in claimtables:
-            if c.title == table_name:
-                logging.info("Manual update triggered for <%s>", table_name)
-                # process each jurisdiction for the selected table
-                for jurisdiction in c.supported_jurisdictions:
-                    c.update(TableDefinition(), jurisdiction)
-                c.compaction()
-                return jsonify({"success": True, "message": "Manual update completed."})
-        return jsonify({"success": False, "error": str("Table not found <%s>", table_name)})
+        c = claimtables.get(table_name)
+        if c:
+            logging.info("Manual update triggered for <%s>", table_name)
+            # process each jurisdiction for the selected table
+            for jurisdiction in c.supported_jurisdictions:
+                c.update(TableDefinition(), jurisdiction, resume=False) # a new run, never a stale resume
+            c.compaction()
+            return jsonify({"success": True, "message": "Manual update completed."})
+        return jsonify({"success": False, "error": "Table not found <%s>" % table_name})
     except Exception as e:
         logging.error("Manual update failed!")
         logging.error(e)
         return jsonify({"success": False, "error": str(e)})
 
+@app.route("/progress", methods=["GET"])
+def update_progress():
+    """ per-batch progress of the running (or last) update of a table, and the checkpointed batches of its refresh
+        runs by jurisdiction """
+    table_name = request.args.get("table_name", "untitled")
+    c = claimtables.get(table_name)
+    if not c:
+        return jsonify({"success": False, "error": "Table not found <%s>" % table_name})
+    return jsonify({"success": True, "progress": dict(c.update_progress), "checkpoints": c.refresh_status()})
+
+@app.route("/geojson/<string:table_name>", methods=["GET"])
+def geojson(table_name):
+    """ a claimtable with its tenure polygons as GeoJSON, for loading into QGIS as a layer (see GeometryCache) """
+    if not geometry_cache.enabled:
+        return jsonify({"success": False, "error": "Geometry is not enabled"})
+    c = claimtables.get(table_name)
+    if not c:
+        return jsonify({"success": False, "error": "Table not found <%s>" % table_name})
+    try:
+        return Response(json.dumps(geometry_cache.feature_collection(c.db, c.title), default=str),
+                        mimetype="application/geo+json")
+    except exc.SQLAlchemyError as e:
+        logging.error("Unable to read the geometry of <%s>", table_name)
+        logging.error(e)
+        return jsonify({"success": False, "error": str(e)})
+
+@app.route("/health", methods=["GET"])
+def health():
+    """ circuit breaker state and ArcGIS request latency per jurisdiction """
+    status = arcweb_data.health()
+    degraded = [j for j, h in status.items() if h["state"] != "closed"]
+    return jsonify({"success": True, "healthy": not degraded, "degraded": degraded, "jurisdictions": status})
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """ counters and latency histograms in the Prometheus text format (see metrics.py) """
+    if database is not None:
+        metrics.db_pool_checked_out.set(database.stats()["checked_out"])
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/reports", methods=["GET"])
+def reports():
+    """ summaries of the stored per-run timing reports, newest first """
+    return jsonify({"success": True, "enabled": tracer.enabled, "reports": tracer.reports()})
+
+@app.route("/reports/<string:report_name>", methods=["GET"])
+def report(report_name):
+    """ a per-run timing report """
+    r = tracer.report(report_name)
+    if r is None:
+        return jsonify({"success": False, "error": "Report not found <%s>" % report_name})
+    return jsonify({"success": True, "report": r})
+
+@app.route("/pool", methods=["GET"])
+def pool_stats():
+    """ connection pool occupancy, checkout counts and wait times """
+    if database is None:
+        return jsonify({"success": False, "error": "database not connected"})
+    return jsonify({"success": True, "pool": database.stats()})
+
 @app.route("/new", methods=["GET", "POST"])
 def new():
     """ mapped new (claimtable) URL to the new function """
@@ -282,13 +374,11 @@ def new():
         table_name = "untitled"
     logging.info("New table - connecting with google sheets")
 
-    global claimtables
     try:
         gc = pygsheets.authorize(service_file=configuration.get("Credentials","file"))
         sheet = gc.sheet.create(table_name)
-        c = ClaimTable(db_engine, suffix, gc, sheet, load_config=False)
-        c.new()
-        claimtables.append(c)
+        c = ClaimTable(database, suffix, gc, sheet, load_config=False)
+        c.new() # registers the table on success
         return jsonify({"success": True, "table_name": table_name, "redirect_url": url_for("index")})
     except Exception as e:
         logging.error("Error creating table: %s", e)
@@ -303,12 +393,10 @@ def rename():
     if not table_name:
         table_name = "untitled"
 
-    global claimtables
     try:
-        for c in claimtables:
-            if c.title == table_name:
-                c.rename(new_title)
-                break
+        c = claimtables.get(table_name)
+        if c:
+            c.rename(new_title)
         return jsonify({"success": True, "table_name": table_name, "redirect_url": url_for("index")})
     except Exception as e:
         logging.error("Error renaming table: %s", e)
@@ -323,13 +411,10 @@ def delete():
         table_name = "untitled"
     logging.info("Deleting table <%s>", table_name)
 
-    global claimtables
     try:
-        for c in claimtables:
-            if c.title == table_name:
-                c.destroy()
-                break
-        claimtables = [c for c in claimtables if c.title != table_name]
+        c = claimtables.get(table_name)
+        if c:
+            c.destroy() # also removes the table from the registry
         return jsonify({"success": True, "table_name": table_name, "redirect_url": url_for("index")})
     except Exception as e:
         logging.error("Error deleting table: %s", e)
@@ -351,7 +436,7 @@ def cleanup_on_exit():
         except Exception as e:
             logging.error("Error deleting table <%s> during cleanup: %s", c.title, e)
     try:
-        db_engine.dispose()
+        database.dispose()
     except Exception as e:
         logging.error("Error disposing database engine during cleanup: %s", e)
     logging.info("Claimtracker process terminated")
@@ -370,35 +455,71 @@ if __name__ == "__main__":
 
     scheduler = Scheduler(configuration)
 
+    try:
+        tracer.configure(enabled=configuration.get("Tracing", "enabled") == "True",
+                         directory=configuration.get("Tracing", "directory"),
+                         profile_table=configuration.get("Tracing", "profile_table"),
+                         max_reports=int(configuration.get("Tracing", "max_reports")))
+    except OSError as e:
+        logging.error("Could not create the tracing report directory, tracing disabled")
+        logging.error(e)
+        tracer.enabled = False
+
+    if configuration.get("Cache", "mode") != "off":
+        try:
+            arcweb_data.cache = ResponseCache(configuration.get("Cache", "directory"),
+                                              mode=configuration.get("Cache", "mode"),
+                                              ttl=int(configuration.get("Cache", "ttl")),
+                                              max_bytes=int(configuration.get("Cache", "max_mb")) * 2**20,
+                                              server=configuration.get("Cache", "server"))
+            logging.info("ArcGIS response cache <%s> in %s mode", configuration.get("Cache", "directory"),
+                         configuration.get("Cache", "mode"))
+        except OSError as e:
+            logging.error("Could not open the ArcGIS response cache, continuing without it")
+            logging.error(e)
+
+    tenure_cache.max_age = int(configuration.get("Tables", "tenure_cache_max_age"))
+    geometry_cache.enabled = configuration.get("Geometry", "enabled") == "True"
+    geometry_cache.max_allowable_offset = float(configuration.get("Geometry", "max_allowable_offset"))
+    geometry_cache.geometry_precision = int(configuration.get("Geometry", "geometry_precision"))
+
     db = DbDefinition()
     db.address = configuration.get("Database","address")
     db.port = configuration.get("Database", "port")
     db.database = configuration.get("Database", "database")
     db.user = configuration.get("Database", "user")
     db.password = configuration.get("Database", "password")
+    db.connector = configuration.get("Database", "connector")
     try:
-        db_engine = sqlalchemy.create_engine(db.connection_string(), pool_pre_ping=True, pool_recycle=3600, \
-                                             connect_args={"timeout": 10})
-        with db_engine.connect() as conn:
+        database = Database(db.connection_string(),
+                            pool_size=int(configuration.get("Database", "pool_size")),
+                            max_overflow=int(configuration.get("Database", "max_overflow")),
+                            pool_timeout=int(configuration.get("Database", "pool_timeout")),
+                            pool_recycle=int(configuration.get("Database", "pool_recycle")),
+                            connect_args=db.connect_args())
+        with database.read() as conn:
             tables_raw = conn.execute(text("SHOW TABLES"))
             if  tables_raw is None:
                 logging.info("No tables in database!")
                 # TODO: we have to exit here, because creating a new table requires _Parcels_Template
                 pass
-            # '_Parcels_Template' and '_Config_Template' are hard-coded, non-rw
-            tables = [t[0] for t in tables_raw if t[0] not in ("_Parcels_Template", "_Config_Template")]
+            # '_Parcels_Template', '_Config_Template' and the shared tenure caches are hard-coded, non-rw
+            tables = [t[0] for t in tables_raw if t[0] not in ("_Parcels_Template", "_Config_Template",
+                                                               tenure_cache.TABLE, geometry_cache.TABLE)]
             suffix = {
                     "config": configuration.get("Tables","config_suffix"),
-                    "compact": configuration.get("Tables","compact_suffix")
+                    "compact": configuration.get("Tables","compact_suffix"),
+                    "refresh": configuration.get("Tables","refresh_suffix")
             }
             # Remove the supplementary tables from the list
             i = 0
             while i < len(tables):
-                if tables[i].endswith(suffix["config"]) or tables[i].endswith(suffix["compact"]):
+                if tables[i].endswith((suffix["config"], suffix["compact"], suffix["refresh"])):
                     tables.pop(i)
                 else:
                     i = i + 1
             logging.debug("Found tables: %s", tables)
+        schema_catalog.load(database)
         logging.info("Generating table list from database <%s>", db.database)
     except exc.SQLAlchemyError as e:
         logging.critical("FATAL: Error fetching data")
@@ -436,20 +557,21 @@ if __name__ == "__main__":
         try:
             logging.debug("Creating google spreadsheet <%s>", t)
             sheet = gc.sheet.create(t)
-            claimtables.append(ClaimTable(db_engine, suffix, gc, sheet))
+            claimtables.publish(ClaimTable(database, suffix, gc, sheet))
         except Exception as e:
             logging.error("Error creating spreadsheet <%s>", t)
             logging.error(e)
             logging.error(e.args)
 
     logging.info("Loading table data for %s tables into google sheets", str(len(tables)))
-    for c in claimtables:
-        try:
-            c.load()
-            logging.debug("Worksheet url for table <%s> : %s", c.title, c.sheet1.url)
-        except Exception as e:
-            logging.critical("FATAL: %s", e)
-            sys.exit(1)
+    with tracer.span("startup"):
+        for c in claimtables:
+            try:
+                c.load()
+                logging.debug("Worksheet url for table <%s> : %s", c.title, c.sheet1.url)
+            except Exception as e:
+                logging.critical("FATAL: %s", e)
+                sys.exit(1)
 
     logging.info("Launching the scheduling thread")
     scheduler.start()
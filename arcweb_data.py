@@ -2,7 +2,9 @@
 # Updated (c) 2026 Welcome North Capital Corp.
 # This file provides convenience functions for retrieving tenure data for NWT, YK, BC and NV using
 # ArcGIS web REST APIs provided by the jurisdictions.
-# The get_data_XX functions take a list of tenure IDs, and return a list of dict objects standardized to:
+# Each jurisdiction is described once in the registry below (see Jurisdiction); new jurisdictions are added with
+# register(Jurisdiction(...)) and need no code of their own. The get_data_XX jurisdictions take a list of tenure IDs,
+# and yield one list per batch of dict objects standardized to:
 #   RegDate (datetime): registration date
 #   Owner (string): owner information
 #   Area_ha (float): area in hectares
@@ -16,124 +18,277 @@
 # to not overload the servers. Queries are made directly via requests with a 30 second socket-level timeout
 # rather than via restapi, which does not support reliable timeout control.
 #
-# For large data sets it may be preferable to break data sets in a wrapper function and handle saving/output
-# of data in batches as well, otherwise the final returned list will be very large.
+# With a response cache configured (see response_cache.py), each batch's response is stored on disk keyed by the
+# layer and the IN-list, so a failed refresh resumes from the batches already retrieved and a refresh can be replayed
+# offline.
+#
+# Requests to each host go through a circuit breaker (see health.py): after 3 consecutive failures the host's
+# remaining batches fail immediately with CircuitOpen, and a single probe is let through every 5 minutes until the
+# host recovers. Only failures of the host count (connection errors, timeouts and HTTP 5xx); an error reply to a
+# query, such as a malformed IN-list, fails that query alone.
+#
+# Results are generated batch by batch, so callers can store each batch while the next one is in flight (see
+# prefetch) rather than holding every result for a jurisdiction in memory.
+#
+# When a refresh covers a large share of a jurisdiction's layer, thousands of keyed IN queries cost more than reading
+# the whole layer: Jurisdiction.fetch compares the estimated cost of both strategies (see fetch_strategy) and may
+# instead page through the layer by objectId ranges, on a few parallel requests, keeping only the wanted tenures.
+#
+# Responses are requested gzip-compressed, and FeatureServer layers (NV) are queried in the protocol buffer format
+# (f=pbf, decoded by pbf.py), which is less than half the size of the JSON. A layer whose server rejects f=pbf with
+# HTTP 400 or returns a body that doesn't decode as a protocol buffer is queried as JSON from then on; a JSON error
+# reply is an ordinary query error. Transferred bytes and decode time are
+# reported per host and format (metrics.arcgis_response_bytes and arcgis_decode_seconds).
+#
+# Tenure polygons are only fetched when geometry is enabled (see Jurisdiction.geometries and get_geometry_slice),
+# in WGS 84 and generalized by the server, for claimtable.GeometryCache.
 import logging
+import pandas as pd
+import queue
 import requests
 import restapi
-from datetime import datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dateutil import tz
 import time
+from health import BreakerRegistry, CircuitOpen
+import metrics
+import pbf
+from tracing import tracer
+from urllib.parse import urlsplit
+
+BATCH_SIZE = 25 # tenure IDs per query
+cache = None # response_cache.ResponseCache used by get_data_slice, set by the application when caching is enabled
+breakers = BreakerRegistry(failure_threshold=3, reset_timeout=300) # one circuit breaker per ArcGIS host
+
+# layer snapshots (see fetch_strategy)
+PAGE_SIZE = 1000 # features per snapshot page, the default maxRecordCount of ArcGIS Server
+PAGE_WORKERS = 4 # snapshot pages fetched in parallel
+REQUEST_COST = 0.5 # estimated seconds of latency per query, not counting the throttle delay
+ROW_COST = 0.0005 # estimated seconds per returned feature (transfer and decoding)
+
+HEADERS = {"Accept-Encoding": "gzip, deflate"} # sent with every query, whatever the requests defaults
+_json_only = set() # layer URLs whose server refused f=pbf, queried as JSON for the rest of the session
+
+GEOMETRY_SR = 4326 # spatial reference of fetched tenure polygons (see get_geometry_slice)
 
-def get_data_NWT(tenure_list):
-    """ get tenure data from the Northwest Territories ArcGIS REST API """
-    url = "https://www.apps.geomatics.gov.nt.ca/arcgis/rest/services/"
-    service_url = "https://www.apps.geomatics.gov.nt.ca/arcgis/rest/services/GNWT/Economy_LCC/MapServer"
-    layer = "Active Mineral Claims"
-    tenure_filter_col = "CLAIM_NUM"
-    cols = ["ANNIV_DT", "AREA_HA", "CANCEL_DT", "CLAIM_NAME", "CLAIM_NUM", "CLAIM_STAT", "DISTRICT", "GROUND_OPEN_DATE",
-            "GROUP_NUMBER", "ISSUE_DT", "LAND_CLAIM_AREA", "OWNERS"]
-    data = get_data(url, service_url, layer, tenure_list, tenure_filter_col, cols)
-    result = []
-    for d in data:
-        result.append({
-            "RegDate": datetime.fromtimestamp(d["ISSUE_DT"]/1000)
-                if d["ISSUE_DT"] and d["ISSUE_DT"] > 0 else datetime(1970, 1, 1),
-            "Owner": d["OWNERS"],
-            "Area_ha": d["AREA_HA"],
-            "ParcelName": d["CLAIM_NAME"],
-            "RegTitleNumber": d["CLAIM_NUM"],
-            "NextDueDate": datetime.fromtimestamp(d["ANNIV_DT"]/1000)
-                if d["ANNIV_DT"] and d["ANNIV_DT"] > 0 else datetime(1970, 1, 1)
-        })
-    return result
-
-def get_data_YK(tenure_list):
-    """ get tenure data from the Yukon ArcGIS REST API """
-    url = "https://mapservices.gov.yk.ca/arcgis/rest/services/"
-    service_url = "https://mapservices.gov.yk.ca/arcgis/rest/services/GeoYukon/GY_Mining/MapServer"
-    layer = "Quartz Claims - 50k"
-    tenure_filter_col = "GRANT_NUMBER"
-    cols = ["CLAIM_LABEL", "DISTRICT_NAME", "EXPIRY_DATE", "GRANT_NUMBER", "OWNER_NAME", "RECORDED_DATE",
-            "STAKING_DATE", "SHAPE.AREA"]
-    data = get_data(url, service_url, layer, tenure_list, tenure_filter_col, cols)
-    result = []
-    for d in data:
-        result.append({
-            "RegDate": datetime.fromtimestamp(d["RECORDED_DATE"] / 1000)
-                if d["RECORDED_DATE"] > 0 else datetime(1970, 1, 1) + timedelta(seconds=d["RECORDED_DATE"]/1000),
-            "Owner": d["OWNER_NAME"],
-            "Area_ha": d["SHAPE.AREA"]/10000,
-            "ParcelName": d["CLAIM_LABEL"],
-            "RegTitleNumber": d["GRANT_NUMBER"],
-            "NextDueDate": datetime.fromtimestamp(d["EXPIRY_DATE"] / 1000)
-                if d["EXPIRY_DATE"] > 0 else datetime(1970, 1, 1) + timedelta(seconds=d["EXPIRY_DATE"]/1000)
-        })
-    return result
-
-def get_data_NV(tenure_list):
-    """ get tenure data from the Nevada Division of Minerals ArcGIS REST API """
-    url = 'https://services.arcgis.com/CXYUMoYknZtf5Qr3/ArcGIS/rest/services/'
-    service_url = "https://services.arcgis.com/CXYUMoYknZtf5Qr3/ArcGIS/rest/services/ArcOnlineNvStateClaims/FeatureServer"
-    layer = 'Claim Point Listings'
-    tenure_filter_col = "SERIALNUMB"
-    cols = ["CLAIMANT", "CLAIMNAME", "LOCDATE", "SERIALNUMB"]
-    data = get_data(url, service_url, layer, tenure_list, tenure_filter_col, cols)
-    result = []
-    for d in data:
-        result.append({
-            "RegDate": datetime.fromtimestamp(d["LOCDATE"] / 1000)
-                if d["LOCDATE"] > 0 else datetime(1970, 1, 1) + timedelta(seconds=d["LOCDATE"]/1000),
-            "Owner": d["CLAIMANT"],
-            "Area_ha": None,
-            "ParcelName": d["CLAIMNAME"],
-            "RegTitleNumber": d["SERIALNUMB"],
-            "NextDueDate": None
-        })
-    return result
-
-def get_data_BC(tenure_list):
-    """ get tenure data from the British Columbia ArcGIS REST API """
-    url = 'https://maps.gov.bc.ca/arcserver/rest/services/whse/'
-    service_url = 'https://maps.gov.bc.ca/arcgis/rest/services/whse/bcgw_pub_whse_mineral_tenure/MapServer'
-    layer = 42
-    tenure_filter_col = "TENURE_NUMBER_ID"
-    cols = ["AREA_IN_HECTARES", "CLAIM_NAME", "ISSUE_DATE", "GOOD_TO_DATE", "OWNER_NAME", "TENURE_NUMBER_ID"]
-    data = get_data(url, service_url, layer, tenure_list, tenure_filter_col, cols)
-    result = []
-    for d in data:
-        result.append({
-            "RegDate": datetime.fromtimestamp(d["ISSUE_DATE"] / 1000)
-                if d["ISSUE_DATE"] > 0 else datetime(1970, 1, 1) + timedelta(seconds=d["ISSUE_DATE"]/1000),
-            "Owner": d["OWNER_NAME"],
-            "Area_ha": d["AREA_IN_HECTARES"],
-            "ParcelName": d["CLAIM_NAME"],
-            "RegTitleNumber": str(d["TENURE_NUMBER_ID"]),
-            "NextDueDate": datetime.fromtimestamp(d["GOOD_TO_DATE"] / 1000)
-                if d["GOOD_TO_DATE"] > 0 else datetime(1970, 1, 1) + timedelta(seconds=d["GOOD_TO_DATE"]/1000),
-        })
-    return result
-
-def get_data_NU(tenure_list):
-    """ get tenure data from the Nunavut ArcGIS REST API """
-    url = 'https://data.aadnc-aandc.gc.ca/geomatics/rest/services/Donnees_Ouvertes-Open_Data/'
-    service_url = 'https://data.aadnc-aandc.gc.ca/geomatics/rest/services/Donnees_Ouvertes-Open_Data/Claim_minier_NU_Mineral_Claim/MapServer'
-    layer = 0
-    tenure_filter_col = "CLAIM_NUM"
-    cols = ["AREA_HA", "CLAIM_NUM", "CLAIM_NAME", "ISSUE_DATE", "ANNIV_DT", "OWNERS"]
-    data = get_data(url, service_url, layer, tenure_list, tenure_filter_col, cols)
-    result = []
-    for d in data:
-        result.append({
-            "RegDate": datetime.fromtimestamp(d["ISSUE_DATE"] / 1000)
-                if d["ISSUE_DATE"] > 0 else datetime(1970, 1, 1) + timedelta(seconds=d["ISSUE_DATE"]/1000),
-            "Owner": d["OWNERS"],
-            "Area_ha": d["AREA_HA"],
-            "ParcelName": d["CLAIM_NAME"],
-            "RegTitleNumber": d["CLAIM_NUM"],
-            "NextDueDate": datetime.fromtimestamp(d["ANNIV_DT"] / 1000)
-                if d["ANNIV_DT"] > 0 else datetime(1970, 1, 1) + timedelta(seconds=d["ANNIV_DT"]/1000),
-        })
-    return result
+RECORD_KEYS = ["RegDate", "Owner", "Area_ha", "ParcelName", "RegTitleNumber", "NextDueDate"]
+
+def _epoch_ms_to_local(series, default=None):
+    """ convert a column of epoch milliseconds (negative before 1970) to naive local datetimes in a single pass,
+        matching datetime.fromtimestamp; missing values become default, as do non-positive ones when it is set """
+    ms = pd.to_numeric(series, errors="coerce")
+    dates = pd.to_datetime(ms, unit="ms", utc=True).dt.tz_convert(tz.tzlocal()).dt.tz_localize(None)
+    if default is not None:
+        dates = dates.mask(ms.isna() | (ms <= 0), pd.Timestamp(default))
+    return dates
+
+class Jurisdiction:
+    """ declarative description of a jurisdiction's tenure layer: where it is served from, the key column used to
+        filter it, and how its attributes map onto the standard record (fields maps record keys to source columns,
+        None where the jurisdiction does not provide the item). calling the jurisdiction with a list of tenure IDs
+        yields normalized batches, the same as the get_data_XX functions always have """
+    def __init__(self, name, url, service_url, layer, key_col, fields, date_cols=(), area_scale=1, date_default=None):
+        self.name = name
+        self.url = url
+        self.service_url = service_url
+        self.layer = layer
+        self.key_col = key_col
+        self.fields = fields
+        self.date_cols = tuple(date_cols) # record keys holding epoch milliseconds
+        self.area_scale = area_scale # multiplier converting the source area to hectares
+        self.date_default = date_default # stored in place of a missing or non-positive date, if set
+
+    def out_cols(self):
+        """ source columns to request from the layer """
+        return sorted({c for c in self.fields.values() if c} | {self.key_col})
+
+    def normalize(self, attributes):
+        """ convert a batch of attribute dicts to standard records, one column at a time """
+        if not attributes:
+            return []
+        src = pd.DataFrame(attributes)
+        out = pd.DataFrame(index=src.index)
+        for key in RECORD_KEYS:
+            col = self.fields.get(key)
+            if not col or col not in src:
+                out[key] = None
+            elif key in self.date_cols:
+                out[key] = _epoch_ms_to_local(src[col], self.date_default)
+            elif key == "Area_ha":
+                out[key] = pd.to_numeric(src[col], errors="coerce") * self.area_scale
+            elif key == "RegTitleNumber":
+                out[key] = src[col].astype(str)
+            else:
+                out[key] = src[col]
+        return out.astype(object).where(out.notna(), None).to_dict("records")
+
+    def __call__(self, tenure_list):
+        for data in get_data(self.url, self.service_url, self.layer, tenure_list, self.key_col, self.out_cols()):
+            yield self.normalize(data)
+
+    def health(self):
+        """ circuit breaker state and request latency of the jurisdiction's host """
+        host = urlsplit(_query_url(self.service_url)).netloc
+        return dict(host=host, **breakers.get(host).status())
+
+    def fetch(self, batches, strategy=None):
+        """ fetch a planned list of (batch number, tenure IDs) batches, yielding (batch number, records, error) for
+            each; a batch that still fails after get_data_slice's retries is yielded with its exception rather than
+            raised, so the batches after it are still fetched (see ClaimTable.update). strategy is "keyed" (IN
+            queries), "snapshot" (page through the whole layer) or None to pick the cheaper one """
+        batches = list(batches)
+        if not batches:
+            return
+        layer_url = _cached_layer_url(self.url, self.service_url, self.layer)
+        if strategy is None:
+            strategy = fetch_strategy(layer_url, sum(len(ids) for _, ids in batches))
+        if strategy == "snapshot":
+            try:
+                records = self.snapshot(layer_url, {t for _, ids in batches for t in ids})
+            except Exception as e:
+                logging.warning("Snapshot of <%s> failed, falling back to keyed queries: %s", self.name, e)
+            else:
+                for batch, ids in batches:
+                    metrics.arcgis_batches.inc(jurisdiction=self.name, outcome="ok")
+                    yield batch, [records[t] for t in ids if t in records], None
+                return
+        throttle = _throttled()
+        breaker = _breaker(_query_url(layer_url))
+        for i, (batch, tenure_list) in enumerate(batches):
+            # while the host's breaker is open the remaining batches fail fast (CircuitOpen), without the delay
+            if throttle and i and breaker.state() == "closed":
+                time.sleep(0.5)
+            start = time.perf_counter()
+            try:
+                records = self.normalize(get_data_slice(layer_url, tenure_list, self.key_col, self.out_cols()))
+            except Exception as e:
+                metrics.arcgis_batches.inc(jurisdiction=self.name,
+                                           outcome="circuit_open" if isinstance(e, CircuitOpen) else "error")
+                yield batch, None, e
+                continue
+            metrics.arcgis_batch_seconds.observe(time.perf_counter() - start, jurisdiction=self.name)
+            metrics.arcgis_batches.inc(jurisdiction=self.name, outcome="ok")
+            yield batch, records, None
+
+    def geometries(self, batches, max_allowable_offset=None, geometry_precision=None):
+        """ fetch the polygons of a planned list of (batch number, tenure IDs) batches, yielding (batch number,
+            {tenure ID: ArcGIS JSON geometry}, error) for each, with the same throttling and error handling as
+            fetch """
+        batches = list(batches)
+        if not batches:
+            return
+        layer_url = _cached_layer_url(self.url, self.service_url, self.layer)
+        throttle = _throttled()
+        breaker = _breaker(_query_url(layer_url))
+        for i, (batch, tenure_list) in enumerate(batches):
+            if throttle and i and breaker.state() == "closed":
+                time.sleep(0.5)
+            try:
+                shapes = get_geometry_slice(layer_url, tenure_list, self.key_col, max_allowable_offset,
+                                            geometry_precision)
+            except Exception as e:
+                yield batch, None, e
+                continue
+            yield batch, shapes, None
+
+    def snapshot(self, layer_url, wanted):
+        """ page through the whole layer by objectId ranges, PAGE_WORKERS pages at a time, and return the normalized
+            records of the wanted tenure IDs by RegTitleNumber """
+        start = time.perf_counter()
+        data = query(layer_url, {"where": "1=1", "returnIdsOnly": "true", "f": "json"})
+        oid_col = data.get("objectIdFieldName") or "OBJECTID"
+        oids = sorted(data.get("objectIds") or [])
+        ranges = [(oids[i], oids[min(i + PAGE_SIZE, len(oids)) - 1]) for i in range(0, len(oids), PAGE_SIZE)]
+        out_cols = ",".join(self.out_cols())
+
+        def page(first, last):
+            params = {"where": "%s >= %d AND %s <= %d" % (oid_col, first, oid_col, last), "outFields": out_cols,
+                      "returnGeometry": "false", "f": "json"}
+            data = query(layer_url, params)
+            if data.get("exceededTransferLimit") and first < last:
+                # the server's maxRecordCount is below PAGE_SIZE, split the range
+                middle = (first + last) // 2
+                return page(first, middle) + page(middle + 1, last)
+            return [f["attributes"] for f in data.get("features", [])]
+
+        def wanted_records(first, last):
+            return [r for r in self.normalize(page(first, last)) if r["RegTitleNumber"] in wanted]
+
+        span = tracer.current()
+        def traced_page(bounds):
+            tracer.attach(span)
+            return wanted_records(*bounds)
+
+        records = {}
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as pool:
+            for page_records in pool.map(traced_page, ranges):
+                for r in page_records:
+                    records[r["RegTitleNumber"]] = r
+        logging.debug("Snapshot of <%s>: %d pages, %d of %d wanted tenures found in %.1fs", self.name, len(ranges),
+                      len(records), len(wanted), time.perf_counter() - start)
+        metrics.arcgis_snapshots.inc(jurisdiction=self.name)
+        return records
+
+jurisdictions = {} # name -> Jurisdiction
+
+def register(jurisdiction):
+    """ add a jurisdiction to the registry (ClaimTable.supported_jurisdictions is built from it) """
+    jurisdictions[jurisdiction.name] = jurisdiction
+    return jurisdiction
+
+get_data_NWT = register(Jurisdiction(
+    "NWT",
+    url="https://www.apps.geomatics.gov.nt.ca/arcgis/rest/services/",
+    service_url="https://www.apps.geomatics.gov.nt.ca/arcgis/rest/services/GNWT/Economy_LCC/MapServer",
+    layer="Active Mineral Claims",
+    key_col="CLAIM_NUM",
+    fields={"RegDate": "ISSUE_DT", "Owner": "OWNERS", "Area_ha": "AREA_HA", "ParcelName": "CLAIM_NAME",
+            "RegTitleNumber": "CLAIM_NUM", "NextDueDate": "ANNIV_DT"},
+    date_cols=["RegDate", "NextDueDate"],
+    date_default=datetime(1970, 1, 1)))
+
+get_data_YK = register(Jurisdiction(
+    "YK",
+    url="https://mapservices.gov.yk.ca/arcgis/rest/services/",
+    service_url="https://mapservices.gov.yk.ca/arcgis/rest/services/GeoYukon/GY_Mining/MapServer",
+    layer="Quartz Claims - 50k",
+    key_col="GRANT_NUMBER",
+    fields={"RegDate": "RECORDED_DATE", "Owner": "OWNER_NAME", "Area_ha": "SHAPE.AREA", "ParcelName": "CLAIM_LABEL",
+            "RegTitleNumber": "GRANT_NUMBER", "NextDueDate": "EXPIRY_DATE"},
+    date_cols=["RegDate", "NextDueDate"],
+    area_scale=1/10000))
+
+get_data_NV = register(Jurisdiction(
+    "NV",
+    url="https://services.arcgis.com/CXYUMoYknZtf5Qr3/ArcGIS/rest/services/",
+    service_url="https://services.arcgis.com/CXYUMoYknZtf5Qr3/ArcGIS/rest/services/ArcOnlineNvStateClaims/FeatureServer",
+    layer="Claim Point Listings",
+    key_col="SERIALNUMB",
+    fields={"RegDate": "LOCDATE", "Owner": "CLAIMANT", "Area_ha": None, "ParcelName": "CLAIMNAME",
+            "RegTitleNumber": "SERIALNUMB", "NextDueDate": None},
+    date_cols=["RegDate"]))
+
+get_data_BC = register(Jurisdiction(
+    "BC",
+    url="https://maps.gov.bc.ca/arcserver/rest/services/whse/",
+    service_url="https://maps.gov.bc.ca/arcgis/rest/services/whse/bcgw_pub_whse_mineral_tenure/MapServer",
+    layer=42,
+    key_col="TENURE_NUMBER_ID",
+    fields={"RegDate": "ISSUE_DATE", "Owner": "OWNER_NAME", "Area_ha": "AREA_IN_HECTARES",
+            "ParcelName": "CLAIM_NAME", "RegTitleNumber": "TENURE_NUMBER_ID", "NextDueDate": "GOOD_TO_DATE"},
+    date_cols=["RegDate", "NextDueDate"]))
+
+get_data_NU = register(Jurisdiction(
+    "NU",
+    url="https://data.aadnc-aandc.gc.ca/geomatics/rest/services/Donnees_Ouvertes-Open_Data/",
+    service_url="https://data.aadnc-aandc.gc.ca/geomatics/rest/services/Donnees_Ouvertes-Open_Data/Claim_minier_NU_Mineral_Claim/MapServer",
+    layer=0,
+    key_col="CLAIM_NUM",
+    fields={"RegDate": "ISSUE_DATE", "Owner": "OWNERS", "Area_ha": "AREA_HA", "ParcelName": "CLAIM_NAME",
+            "RegTitleNumber": "CLAIM_NUM", "NextDueDate": "ANNIV_DT"},
+    date_cols=["RegDate", "NextDueDate"]))
 
 def _get_layer_url(base_url, service_url, layer):
     """ uses restapi to resolve the layer URL only — all actual queries bypass restapi """
@@ -154,20 +309,128 @@ def _get_layer_url(base_url, service_url, layer):
     lyr = svc.layer(layer)
     return lyr.url
 
-def get_data(base_url, service_url, layer, tenure_list, tenure_filter_col, out_cols=None, batch_size=25):
-    """ wrapper for get_data_slice that iterates data retrieval through a list of tenures, establishing
-        the layer URL once and reusing it across all batches, with a 500ms delay between requests in
-        order to not overload the server. """
-    layer_url = _get_layer_url(base_url, service_url, layer)
+def _throttled():
+    """ whether requests are spaced out; replays and local stand-in servers don't need to be throttled """
+    return cache is None or (cache.mode != "replay" and not cache.server)
+
+def _query_url(layer_url):
+    """ the URL queries for a layer are sent to, which is a local stand-in server if the cache names one """
+    return (cache.rewrite(layer_url) if cache is not None else layer_url) + "/query"
+
+def _breaker(url):
+    return breakers.get(urlsplit(url).netloc)
 
+def _resolve_layer_url(base_url, service_url, layer):
+    """ _get_layer_url behind the circuit breaker of the service's host """
+    breaker = _breaker(service_url)
+    breaker.allow()
+    start = time.perf_counter()
+    try:
+        layer_url = _get_layer_url(base_url, service_url, layer)
+    except Exception as e:
+        breaker.failure(e, time.perf_counter() - start)
+        tracer.account("http", time.perf_counter() - start)
+        raise
+    breaker.success(time.perf_counter() - start)
+    tracer.account("http", time.perf_counter() - start)
+    return layer_url
+
+def _cached_layer_url(base_url, service_url, layer):
+    """ the layer URL, resolved through the response cache when one is configured so that replays stay offline """
+    if cache is None:
+        return _resolve_layer_url(base_url, service_url, layer)
+    params = {"layer": str(layer)}
+    layer_url = cache.get(service_url, params)
+    if layer_url is None:
+        layer_url = _resolve_layer_url(base_url, service_url, layer)
+        cache.put(service_url, params, layer_url)
+    return layer_url
+
+def health():
+    """ circuit breaker state and request latency per jurisdiction """
+    return {name: j.health() for name, j in jurisdictions.items()}
+
+def fetch_strategy(layer_url, wanted):
+    """ "snapshot" if paging through the whole layer is estimated to be cheaper than keyed IN queries for the wanted
+        number of tenures, otherwise "keyed"; the layer's feature count is one extra (count-only) query, made only
+        when the tenures would fill more than a snapshot's worth of keyed queries """
+    keyed_requests = -(-wanted // BATCH_SIZE)
+    delay = 0.5 if _throttled() else 0.0
+    keyed = keyed_requests * (REQUEST_COST + delay) + wanted * ROW_COST
+    if keyed_requests <= 2:
+        return "keyed"
+    try:
+        count = query(layer_url, {"where": "1=1", "returnCountOnly": "true", "f": "json"})["count"]
+    except Exception as e:
+        logging.debug("Feature count unavailable for <%s>, using keyed queries: %s", layer_url, e)
+        return "keyed"
+    pages = -(-count // PAGE_SIZE)
+    snapshot = (1 + -(-pages // PAGE_WORKERS)) * REQUEST_COST + count * ROW_COST
+    return "snapshot" if snapshot < keyed else "keyed"
+
+def get_data(base_url, service_url, layer, tenure_list, tenure_filter_col, out_cols=None, batch_size=BATCH_SIZE):
+    """ generator wrapper for get_data_slice that iterates data retrieval through a list of tenures, establishing
+        the layer URL once and reusing it across all batches, yielding the attributes of each batch with a 500ms
+        delay between requests in order to not overload the server. """
+    layer_url = _cached_layer_url(base_url, service_url, layer)
+
+    throttle = _throttled()
     start = 0
-    results = list()
     while start < len(tenure_list):
         end = min(start + batch_size, len(tenure_list))
-        results += get_data_slice(layer_url, tenure_list[start:end], tenure_filter_col, out_cols)
+        yield get_data_slice(layer_url, tenure_list[start:end], tenure_filter_col, out_cols)
         start += batch_size
-        time.sleep(0.5)
-    return results
+        if throttle and start < len(tenure_list):
+            time.sleep(0.5)
+
+def prefetch(batches, depth=2):
+    """ runs a batch generator on a background thread, keeping up to depth batches ready, so that the consumer can
+        process one batch while the next is being fetched; exceptions raised by the generator are re-raised in the
+        consumer, and closing the consumer stops the producer """
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    span = tracer.current() # ArcGIS time on the producer thread is accounted to the consumer's spans
+
+    def produce():
+        tracer.attach(span)
+        try:
+            for batch in batches:
+                if not put(batch):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+def _in_clause(col, tenure_list):
+    """ col IN (...), numeric when every tenure ID is a number """
+    try:
+        return col + " IN (" + ','.join([str(int(t)) for t in tenure_list]) + ")"
+    except ValueError:
+        return col + " IN (" + ','.join(["'" + str(t) + "'" for t in tenure_list]) + ")"
 
 def get_data_slice(layer_url, tenure_list, tenure_filter_col, out_cols=None, max_retries=3):
     """ performs the query to retrieve the tenure information directly via requests,
@@ -177,29 +440,123 @@ def get_data_slice(layer_url, tenure_list, tenure_filter_col, out_cols=None, max
         out_cols = "*"
     else:
         out_cols = ",".join(out_cols)
-    try:
-        where = tenure_filter_col + " IN (" + ','.join([str(int(t)) for t in tenure_list]) + ")"
-    except ValueError:
-        where = tenure_filter_col + " IN (" + ','.join(["'" + str(t) + "'" for t in tenure_list]) + ")"
-
     params = {
-        "where": where,
+        "where": _in_clause(tenure_filter_col, tenure_list),
         "outFields": out_cols,
         "returnGeometry": "false",
         "f": "json"
     }
+    data = query(layer_url, params, max_retries, check=lambda data: "features" in data)
+    return [f["attributes"] for f in data["features"]]
+
+def get_geometry_slice(layer_url, tenure_list, tenure_filter_col, max_allowable_offset=None, geometry_precision=None,
+                       max_retries=3):
+    """ the polygons of a list of tenures in WGS 84, by tenure ID, generalized by the server to max_allowable_offset
+        degrees and rounded to geometry_precision decimals when those are set """
+    params = {
+        "where": _in_clause(tenure_filter_col, tenure_list),
+        "outFields": tenure_filter_col,
+        "returnGeometry": "true",
+        "outSR": GEOMETRY_SR,
+        "f": "json"
+    }
+    if max_allowable_offset:
+        params["maxAllowableOffset"] = max_allowable_offset
+    if geometry_precision is not None:
+        params["geometryPrecision"] = geometry_precision
+    data = query(layer_url, params, max_retries, check=lambda data: "features" in data)
+    return {str(f["attributes"][tenure_filter_col]): f.get("geometry") for f in data["features"]}
+
+def _host_failure(e):
+    """ whether a failed query says the host is unhealthy (connection error, timeout or HTTP 5xx), rather than the
+        query being refused or answered with an error """
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    return isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code >= 500
+
+def _uses_pbf(layer_url, params):
+    """ whether a query goes out as f=pbf: FeatureServer layers, for the JSON queries pbf.py can stand in for """
+    return params.get("f") == "json" and params.get("returnGeometry", "false") == "false" \
+        and "/FeatureServer/" in layer_url and layer_url not in _json_only
+
+def _decode(response, host, fmt):
+    """ the response as a dict, decoded from the given format; accounts its transferred bytes and decode time """
+    try:
+        transferred = response.raw.tell() # compressed bytes read off the socket
+    except Exception:
+        transferred = 0
+    metrics.arcgis_response_bytes.inc(transferred or len(response.content), host=host, format=fmt)
+    start = time.perf_counter()
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+    # JSON replies to f=pbf queries aren't always labelled as such (text/plain is common)
+    if fmt == "pbf" and not content_type.endswith("json") and not response.content.lstrip().startswith(b"{"):
+        try:
+            data = pbf.decode(response.content)
+        except ValueError as e:
+            raise pbf.Unsupported(e)
+    else:
+        data = response.json()
+        # servers usually reject an unsupported f=pbf with HTTP 200 and a JSON error reply; other JSON error replies
+        # fail the query like any other error reply
+        error = data.get("error") if fmt == "pbf" and isinstance(data, dict) else None
+        if isinstance(error, dict) and (error.get("code") == 400 or "format" in str(error).lower()):
+            raise pbf.Unsupported("f=pbf rejected: %s" % error.get("message", error))
+    metrics.arcgis_decode_seconds.observe(time.perf_counter() - start, host=host, format=fmt)
+    return data
+
+def query(layer_url, params, max_retries=3, check=None):
+    """ a layer query with retries, through the response cache and the host's circuit breaker; returns the decoded
+        response, which check (if given) has to accept """
+    query_url = _query_url(layer_url)
+    breaker = _breaker(query_url)
+    if cache is not None:
+        data = cache.get(layer_url + "/query", params)
+        if isinstance(data, list):
+            data = {"features": [{"attributes": a} for a in data]} # recorded when only the attributes were cached
+        if data is not None:
+            metrics.arcgis_requests.inc(host=breaker.host, outcome="cached")
+            return data
 
     for attempt in range(max_retries):
+        breaker.allow() # raises CircuitOpen while the host is known to be down
+        start = time.perf_counter()
         try:
-            response = requests.get(layer_url + "/query", params=params, timeout=30)
+            fmt = "pbf" if _uses_pbf(layer_url, params) else "json"
+            response = requests.get(query_url, params=dict(params, f=fmt), headers=HEADERS, timeout=30)
+            if fmt == "pbf" and response.status_code == 400:
+                raise pbf.Unsupported("f=pbf rejected with HTTP 400")
             response.raise_for_status()
             if not response.content:
                 raise ValueError("Empty response from ArcGIS server")
-            data = response.json()
-            if "features" not in data:
+            data = _decode(response, breaker.host, fmt)
+            if "error" in data or (check is not None and not check(data)):
                 raise ValueError(f"Unexpected response from ArcGIS: {data}")
-            return [f["attributes"] for f in data["features"]]
+            elapsed = time.perf_counter() - start
+            tracer.account("http", elapsed)
+            breaker.success(elapsed)
+            metrics.arcgis_requests.inc(host=breaker.host, outcome="ok")
+            metrics.arcgis_request_seconds.observe(elapsed, host=breaker.host)
+            if cache is not None:
+                cache.put(layer_url + "/query", params, data)
+            return data
+        except pbf.Unsupported as e:
+            # the server is up but can't do protocol buffers for this layer: not a failure, ask again for JSON
+            elapsed = time.perf_counter() - start
+            tracer.account("http", elapsed)
+            breaker.success(elapsed)
+            logging.warning("ArcGIS layer <%s> does not support f=pbf, using JSON: %s", layer_url, e)
+            _json_only.add(layer_url)
+            return query(layer_url, params, max_retries - attempt, check)
         except Exception as e:
+            elapsed = time.perf_counter() - start
+            tracer.account("http", elapsed)
+            metrics.arcgis_requests.inc(host=breaker.host, outcome="error")
+            metrics.arcgis_request_seconds.observe(elapsed, host=breaker.host)
+            if not _host_failure(e):
+                breaker.success(elapsed) # the host answered, the query itself is at fault
+            elif breaker.failure(e, elapsed):
+                logging.error("ArcGIS query failed, circuit open for <%s>: %s", breaker.host, e)
+                raise
             if attempt < max_retries - 1:
                 wait = 2 ** attempt  # 1s, 2s then fail
                 logging.warning("ArcGIS query failed (attempt %d of %d), retrying in %ds: %s",
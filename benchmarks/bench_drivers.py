@@ -0,0 +1,111 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Compares the database connectors (pyodbc, mysqlclient, PyMySQL) on the same claimtable: a full SELECT * read, a
+# streamed read through a server-side cursor, and an INSERT... ON DUPLICATE KEY UPDATE of every row into a scratch
+# copy of the table (once inserting, once updating). The scratch table is dropped afterwards.
+#
+# usage: python benchmarks/bench_drivers.py <claimtable> [-c claimtracker.conf] [-r repeats]
+import argparse
+import configparser
+import os
+import sys
+from time import perf_counter
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.dialects.mysql import insert
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from database import Database, DbDefinition
+
+def mysql_replace_into(table, conn, keys, data_iter):
+    """ the same upsert used by ClaimTable.update """
+    data = [dict(zip(keys, row)) for row in data_iter]
+    stmt = insert(table.table).values(data)
+    update_stmt = stmt.on_duplicate_key_update(**dict(zip(stmt.inserted.keys(), stmt.inserted.values())))
+    conn.execute(update_stmt)
+
+def timed(func, repeats):
+    """ best wall time of func over a number of repeats """
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = perf_counter()
+        result = func()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench_connector(db_def, table, repeats):
+    db = Database(db_def.connection_string(), pool_size=1, max_overflow=0, connect_args=db_def.connect_args())
+    scratch = table + "__bench"
+    results = {}
+    try:
+        def read():
+            with db.read() as conn:
+                return pd.read_sql(text("SELECT * FROM " + table), con=conn)
+        results["read"], df = timed(read, repeats)
+
+        def stream():
+            rows = 0
+            with db.read(stream=True) as conn:
+                for chunk in pd.read_sql(text("SELECT * FROM " + table), con=conn, chunksize=5000):
+                    rows += len(chunk)
+            return rows
+        results["stream"], _ = timed(stream, repeats)
+
+        with db.write() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS " + scratch))
+            conn.execute(text("CREATE TABLE " + scratch + " LIKE " + table))
+
+        def upsert():
+            with db.write() as conn:
+                df.to_sql(scratch, conn, index=False, if_exists="append", method=mysql_replace_into, chunksize=1000)
+        results["upsert_insert"], _ = timed(upsert, 1)
+        results["upsert_update"], _ = timed(upsert, repeats)
+        results["rows"] = len(df)
+    finally:
+        with db.write() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS " + scratch))
+        db.dispose()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("table", help="claimtable to read and upsert")
+    parser.add_argument("-c", "--config", help="claimtracker configuration file", default="claimtracker.conf")
+    parser.add_argument("-r", "--repeats", help="repeats per measurement (best is reported)", default=3, type=int)
+    parser.add_argument("--connectors", help="comma-separated connectors to compare",
+                        default=",".join(DbDefinition.connectors))
+    args = parser.parse_args()
+
+    configuration = configparser.RawConfigParser()
+    configuration.read(args.config)
+
+    print("%-12s %8s %10s %10s %14s %14s" % ("connector", "rows", "read (s)", "stream (s)", "insert (s)", "update (s)"))
+    for connector in args.connectors.split(","):
+        db_def = DbDefinition()
+        db_def.address = configuration.get("Database", "address")
+        db_def.port = configuration.get("Database", "port")
+        db_def.database = configuration.get("Database", "database")
+        db_def.user = configuration.get("Database", "user")
+        db_def.password = configuration.get("Database", "password")
+        db_def.connector = connector
+        try:
+            r = bench_connector(db_def, args.table, args.repeats)
+        except Exception as e:
+            print("%-12s skipped: %s" % (connector, e))
+            continue
+        print("%-12s %8d %10.3f %10.3f %14.3f %14.3f" % (connector, r["rows"], r["read"], r["stream"],
+                                                         r["upsert_insert"], r["upsert_update"]))
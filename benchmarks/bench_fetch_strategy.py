@@ -0,0 +1,77 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Compares the two ArcGIS fetch strategies of arcweb_data.Jurisdiction.fetch against the fake ArcGIS server of
+# fakes.py: keyed IN queries of BATCH_SIZE tenures, and a snapshot paging through the whole layer by objectId
+# ranges. A table holding a growing share of a layer's tenures is fetched both ways; wall time and requests are
+# reported with the strategy fetch_strategy would pick, so the crossover point can be read off the table. The
+# throttle delay between keyed queries is left out unless --throttle is given (the fake server would not need it).
+#
+# usage: python benchmarks/bench_fetch_strategy.py [-j YK] [--layer-size 20000] [--latency 0.1]
+#            [--coverage 0.005,0.01,0.02,0.05,0.1,0.25,0.5,1] [--throttle]
+import argparse
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import arcweb_data
+from response_cache import ResponseCache
+from fakes import FakeArcGIS, tenure_ids
+
+def fetch(jurisdiction, plan, strategy):
+    """ wall time, requests and records of one fetch of the plan """
+    requests = arcgis.requests
+    start = perf_counter()
+    records = sum(len(r) for _, r, error in jurisdiction.fetch(plan, strategy=strategy) if error is None)
+    return perf_counter() - start, arcgis.requests - requests, records
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-j", "--jurisdiction", help="jurisdiction whose fields and key are used", default="YK")
+    parser.add_argument("--layer-size", help="features in the fake layer", default=20000, type=int)
+    parser.add_argument("--latency", help="seconds added to every query", default=0.1, type=float)
+    parser.add_argument("--coverage", help="comma-separated shares of the layer held by the table",
+                        default="0.005,0.01,0.02,0.05,0.1,0.25,0.5,1")
+    parser.add_argument("--throttle", help="keep the 500 ms delay between keyed queries", action="store_true")
+    args = parser.parse_args()
+
+    arcgis = FakeArcGIS(arcweb_data.jurisdictions, latency=args.latency, layer_size=args.layer_size).start()
+    arcweb_data._get_layer_url = arcgis.layer_url
+    arcweb_data.cache = ResponseCache(tempfile.mkdtemp(prefix="claimtracker-bench-"), mode="off", server=arcgis.url)
+    if args.throttle:
+        arcweb_data._throttled = lambda: True
+    jurisdiction = arcweb_data.jurisdictions[args.jurisdiction]
+    layer_url = arcgis.layer_url(jurisdiction.url, jurisdiction.service_url, jurisdiction.layer)
+    layer = tenure_ids(args.jurisdiction, args.layer_size)
+
+    print("%9s %8s %10s %8s %12s %8s %8s" % ("coverage", "tenures", "keyed (s)", "queries", "snapshot (s)",
+                                              "queries", "picked"))
+    try:
+        for share in [float(c) for c in args.coverage.split(",")]:
+            # every k-th tenure of the layer, like a table spread over the whole jurisdiction
+            step = max(int(round(1 / share)), 1)
+            tenure_list = sorted(layer[::step])
+            size = arcweb_data.BATCH_SIZE
+            plan = [(i, tenure_list[s:s + size]) for i, s in enumerate(range(0, len(tenure_list), size))]
+            keyed = fetch(jurisdiction, plan, "keyed")
+            snapshot = fetch(jurisdiction, plan, "snapshot")
+            if keyed[2] != snapshot[2]:
+                print("records differ: keyed %d, snapshot %d" % (keyed[2], snapshot[2]))
+            picked = arcweb_data.fetch_strategy(layer_url, len(tenure_list))
+            print("%8.1f%% %8d %10.2f %8d %12.2f %8d %8s" % (share * 100, len(tenure_list), keyed[0], keyed[1],
+                                                            snapshot[0], snapshot[1], picked))
+    finally:
+        arcgis.stop()
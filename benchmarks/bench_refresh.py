@@ -0,0 +1,209 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# End-to-end benchmark of a claimtable's life cycle at several sizes, with the ArcGIS servers and Google Sheets
+# replaced by the local stand-ins in fakes.py: startup (creating the ClaimTable and loading it into the worksheets),
+# update of every jurisdiction, bulk_sync, compaction and prepare_email. For each size a scratch table bench_<size>
+# is seeded with synthetic tenures spread over the registered jurisdictions, and dropped afterwards. Wall time,
+# Google Sheets calls and request bytes, and ArcGIS requests are reported per phase.
+#
+# The database has to be MySQL 8 (the compaction query uses window functions and REGEXP_SUBSTR, and the upserts are
+# INSERT ... ON DUPLICATE KEY UPDATE), so point the [Database] section of the configuration at a scratch database;
+# _Parcels_Template and _Config_Template are created there if they don't exist.
+#
+# Results can be saved with --json and compared against a saved baseline with --compare; the exit status is 1 when
+# a phase is slower than the baseline by more than --threshold.
+#
+# usage: python benchmarks/bench_refresh.py [-c claimtracker.conf] [-n 1000,10000,100000] [--arcgis-latency s]
+#            [--sheets-latency s] [--json results.json] [--compare baseline.json] [--threshold 0.25]
+import argparse
+import configparser
+import json
+import logging
+import os
+import sys
+import tempfile
+from time import perf_counter
+import google.auth.credentials
+import pandas as pd
+import pygsheets
+from sqlalchemy import text
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import arcweb_data
+from claimtable import ClaimTable, TableDefinition, schema_catalog, tenure_cache
+from database import Database, DbDefinition
+from response_cache import ResponseCache
+from scheduler import Scheduler
+from fakes import FakeArcGIS, FakeSheetsHttp, synthetic_attributes, tenure_ids
+
+SUFFIX = {"config": "__cnfg", "compact": "__cmpct", "refresh": "__rfsh"}
+PHASES = ("startup", "update", "bulk_sync", "compaction", "prepare_email")
+COLUMN_ORDER = "ProjectName;Jurisdiction;RegTitleNumber;ParcelName;Owner;Area_ha;RegDate;NextDueDate;UpdateDate;" \
+               "Comments"
+COMPACT_ORDER = "ProjectName;Jurisdiction;ParcelNameFrom;ParcelNameTo;RegTitleFrom;RegTitleTo;Owner;RegDate;" \
+                "NextDueDate;UpdateDate;Comments"
+TEMPLATES = [
+    "CREATE TABLE IF NOT EXISTS _Parcels_Template (RegTitleNumber VARCHAR(64) NOT NULL PRIMARY KEY, "
+    "ParcelName VARCHAR(255), Owner VARCHAR(255), ProjectName VARCHAR(255), Jurisdiction VARCHAR(16), Comments TEXT, "
+    "Area_ha DOUBLE, RegDate DATETIME, NextDueDate DATETIME, UpdateDate DATETIME)",
+    "CREATE TABLE IF NOT EXISTS _Config_Template (id INT NOT NULL AUTO_INCREMENT PRIMARY KEY, ColumnOrder TEXT, "
+    "CompactColumnOrder TEXT, AccessList TEXT, UpdateSched VARCHAR(64), EmailSched VARCHAR(64), Prune TINYINT, "
+    "Compact TINYINT)"
+]
+
+def seed(db, title, size):
+    """ creates the scratch table and its configuration, filled with size synthetic tenures """
+    with db.write() as conn:
+        for q in TEMPLATES:
+            conn.execute(text(q))
+        for q in ("DROP TABLE IF EXISTS " + title, "CREATE TABLE " + title + " LIKE _Parcels_Template",
+                  "DROP TABLE IF EXISTS " + title + SUFFIX["config"],
+                  "CREATE TABLE " + title + SUFFIX["config"] + " LIKE _Config_Template"):
+            conn.execute(text(q))
+        conn.execute(text("INSERT INTO " + title + SUFFIX["config"] + " (id, ColumnOrder, CompactColumnOrder, "
+                          "AccessList, UpdateSched, EmailSched, Prune, Compact) VALUES (1, :order, :compact_order, "
+                          "'', '* * 31 1 1', '* * 31 1 1', 0, 1)"),
+                     {"order": COLUMN_ORDER, "compact_order": COMPACT_ORDER})
+
+    names = list(arcweb_data.jurisdictions)
+    now_ms = int(pd.Timestamp.now().timestamp() * 1000)
+    frames = []
+    for i, name in enumerate(names):
+        j = arcweb_data.jurisdictions[name]
+        count = size // len(names) + (1 if i < size % len(names) else 0)
+        records = j.normalize([synthetic_attributes(j, t, now_ms) for t in tenure_ids(name, count)])
+        df = pd.DataFrame(records)
+        df["Jurisdiction"] = name
+        df["ProjectName"] = ["Project %d" % (k // 250) for k in range(count)]
+        df["UpdateDate"] = pd.Timestamp.now().floor("s")
+        frames.append(df)
+    with db.write() as conn:
+        pd.concat(frames).to_sql(title, conn, index=False, if_exists="append", chunksize=1000)
+    schema_catalog.refresh(title, title + SUFFIX["config"])
+
+def drop(db, title):
+    with db.write() as conn:
+        for s in [""] + list(SUFFIX.values()):
+            conn.execute(text("DROP TABLE IF EXISTS " + title + s))
+
+def run(db, gc, sheets_http, arcgis, configuration, size):
+    """ times each phase for one table size; returns {phase: {"seconds", "sheets_calls", "sheets_bytes",
+        "arcgis_requests"}} """
+    title = "bench_%d" % size
+    results = {}
+    seed(db, title, size)
+
+    def measure(phase, func):
+        sheets_http.reset_counters()
+        requests = arcgis.requests
+        start = perf_counter()
+        value = func()
+        seconds = perf_counter() - start
+        calls, sent = sheets_http.totals()
+        results[phase] = {"seconds": round(seconds, 3), "sheets_calls": calls, "sheets_bytes": sent,
+                          "arcgis_requests": arcgis.requests - requests}
+        return value
+
+    try:
+        def startup():
+            c = ClaimTable(db, SUFFIX, gc, gc.sheet.create(title))
+            c.load()
+            return c
+        c = measure("startup", startup)
+
+        def update():
+            for name in arcweb_data.jurisdictions:
+                c.update(TableDefinition(), name, resume=False)
+        measure("update", update)
+        measure("bulk_sync", c.bulk_sync)
+        measure("compaction", c.compaction)
+        measure("prepare_email", lambda: Scheduler(configuration).prepare_email(c))
+        c.delete()
+    finally:
+        drop(db, title)
+    return results
+
+def regressions(results, baseline, threshold):
+    """ (size, phase, seconds, baseline seconds) of every phase slower than the baseline by more than threshold """
+    slower = []
+    for size, phases in results.items():
+        for phase, r in phases.items():
+            base = baseline.get(size, {}).get(phase)
+            if base and r["seconds"] > base["seconds"] * (1 + threshold):
+                slower.append((size, phase, r["seconds"], base["seconds"]))
+    return slower
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", help="claimtracker configuration file", default="claimtracker.conf")
+    parser.add_argument("-n", "--sizes", help="comma-separated table sizes (tenures)", default="1000,10000,100000")
+    parser.add_argument("--arcgis-latency", help="seconds added to every ArcGIS query", default=0.05, type=float)
+    parser.add_argument("--sheets-latency", help="seconds added to every Google API call", default=0.0, type=float)
+    parser.add_argument("--json", help="write the results to a JSON file")
+    parser.add_argument("--compare", help="baseline JSON file (from --json) to compare against")
+    parser.add_argument("--threshold", help="allowed slowdown against the baseline", default=0.25, type=float)
+    args = parser.parse_args()
+    config_path = os.path.abspath(args.config)
+    json_path = os.path.abspath(args.json) if args.json else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    os.chdir(ROOT) # compaction_new.sql and the email template are opened relative to the working directory
+    logging.basicConfig(level=logging.WARNING)
+
+    configuration = configparser.RawConfigParser()
+    configuration.read(config_path)
+    db_def = DbDefinition()
+    db_def.address = configuration.get("Database", "address")
+    db_def.port = configuration.get("Database", "port")
+    db_def.database = configuration.get("Database", "database")
+    db_def.user = configuration.get("Database", "user")
+    db_def.password = configuration.get("Database", "password")
+    db_def.connector = configuration.get("Database", "connector", fallback="pymysql")
+    db = Database(db_def.connection_string(), connect_args=db_def.connect_args())
+    schema_catalog.load(db)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    arcgis = FakeArcGIS(arcweb_data.jurisdictions, latency=args.arcgis_latency, layer_size=max(sizes)).start()
+    arcweb_data._get_layer_url = arcgis.layer_url
+    # every ArcGIS host is redirected to the fake server, which also turns off the request throttling
+    arcweb_data.cache = ResponseCache(tempfile.mkdtemp(prefix="claimtracker-bench-"), mode="off", server=arcgis.url)
+    tenure_cache.max_age = 0 # every update goes to the (fake) network
+    sheets_http = FakeSheetsHttp(latency=args.sheets_latency)
+    gc = pygsheets.client.Client(google.auth.credentials.AnonymousCredentials(), http=sheets_http)
+
+    results = {}
+    try:
+        for size in sizes:
+            results[str(size)] = run(db, gc, sheets_http, arcgis, configuration, size)
+    finally:
+        arcgis.stop()
+        db.dispose()
+
+    print("%8s %-14s %10s %12s %14s %10s" % ("tenures", "phase", "time (s)", "sheets calls", "sheets bytes",
+                                             "arcgis"))
+    for size, phases in results.items():
+        for phase in PHASES:
+            r = phases[phase]
+            print("%8s %-14s %10.3f %12d %14d %10d" % (size, phase, r["seconds"], r["sheets_calls"],
+                                                       r["sheets_bytes"], r["arcgis_requests"]))
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=1)
+    if compare_path:
+        with open(compare_path, "r") as f:
+            slower = regressions(results, json.load(f), args.threshold)
+        for size, phase, seconds, base in slower:
+            print("REGRESSION: %s tenures, %s: %.3f s (baseline %.3f s)" % (size, phase, seconds, base))
+        sys.exit(1 if slower else 0)
@@ -0,0 +1,99 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Micro-benchmark of the worksheet values serializer (sheets.dataframe_values) against the previous path, which was
+# astype(object).fillna("").infer_objects() followed by the conversion inside pygsheets' set_dataframe. Both run on
+# a synthetic claimtable-shaped frame (12 columns by default: dates, floats, ints and strings with missing values);
+# wall time and peak traced allocations are reported, and the two payloads are checked to be equivalent. (The
+# previous path wrote midnight datetimes as "YYYY-MM-DD 00:00:00" or "YYYY-MM-DD" depending on whether the column
+# happened to contain NaT; sheets.py always uses the column-level pandas format, so the check ignores that suffix.)
+#
+# usage: python benchmarks/bench_serializer.py [-n rows] [-r repeats]
+import argparse
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import sheets
+
+def synthetic_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    def dates(null_share):
+        d = pd.Series(pd.to_datetime("2020-01-01") + pd.to_timedelta(rng.integers(0, 5000, rows), unit="D"))
+        return d.mask(rng.random(rows) < null_share)
+    def strings(prefix, null_share):
+        s = pd.Series([prefix + str(i) for i in rng.integers(0, 100000, rows)], dtype=object)
+        return s.mask(rng.random(rows) < null_share, None)
+    return pd.DataFrame({
+        "RegTitleNumber": strings("YC", 0.0),
+        "ParcelName": strings("CLAIM ", 0.05),
+        "Owner": strings("Owner ", 0.1),
+        "ProjectName": strings("Project ", 0.3),
+        "Jurisdiction": pd.Series(rng.choice(["YK", "NWT", "BC", "NU", "NV"], rows), dtype=object),
+        "Comments": strings("comment ", 0.8),
+        "Area_ha": pd.Series(rng.random(rows) * 25).mask(rng.random(rows) < 0.1),
+        "Hectares": pd.Series(rng.random(rows) * 500).mask(rng.random(rows) < 0.5),
+        "Sequence": pd.Series(rng.integers(0, 10**6, rows)),
+        "RegDate": dates(0.02),
+        "NextDueDate": dates(0.1),
+        "UpdateDate": dates(0.0)
+    })
+
+def previous_path(df):
+    """ _write_dataframe before sheets.py, plus the conversion set_dataframe then applied (with nan="NaN") """
+    df = df.astype(object).fillna("").infer_objects(copy=False)
+    for col in df.select_dtypes("Int64"):
+        df[col] = df[col].astype("unicode").replace("<NA>", "NaN")
+    df = df.fillna("NaN")
+    values = df.astype("unicode").values.tolist()
+    values.insert(0, df.columns.tolist())
+    return values
+
+def equivalent(a, b):
+    """ compare two payloads, treating "YYYY-MM-DD 00:00:00" and "YYYY-MM-DD" as the same cell """
+    def normalize(cell):
+        return cell[:-9] if cell.endswith(" 00:00:00") else cell
+    return len(a) == len(b) and all([normalize(x) for x in r] == [normalize(y) for y in s] for r, s in zip(a, b))
+
+def measure(func, df, repeats):
+    best = None
+    for _ in range(repeats):
+        start = perf_counter()
+        func(df)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    result = func(df)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", help="rows in the synthetic frame", default=50000, type=int)
+    parser.add_argument("-r", "--repeats", help="repeats per measurement (best is reported)", default=5, type=int)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.rows)
+    print("frame: %d rows x %d columns" % df.shape)
+    print("%-10s %10s %14s" % ("path", "time (s)", "peak (MiB)"))
+    t_old, m_old, v_old = measure(previous_path, df, args.repeats)
+    print("%-10s %10.3f %14.1f" % ("previous", t_old, m_old / 2**20))
+    t_new, m_new, v_new = measure(sheets.dataframe_values, df, args.repeats)
+    print("%-10s %10.3f %14.1f" % ("sheets", t_new, m_new / 2**20))
+    print("speedup: %.2fx, equivalent payload: %s" % (t_old / t_new, equivalent(v_old, v_new)))
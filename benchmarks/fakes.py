@@ -0,0 +1,410 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Local stand-ins for the external services, used by bench_refresh.py and bench_fetch_strategy.py:
+#   FakeArcGIS: an HTTP server answering ArcGIS /query requests for every jurisdiction in the arcweb_data registry
+#       from a synthetic layer of configurable size, after a configurable latency
+#   FakeSheetsHttp: an httplib2-compatible transport for a real pygsheets.Client that emulates the parts of the
+#       Google Sheets and Drive REST APIs the application uses, keeping the cell values in memory and recording the
+#       number of calls and request bytes per endpoint
+import gzip
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+import httplib2
+
+YEAR_MS = 365 * 86400 * 1000
+
+def tenure_ids(jurisdiction, count, offset=0):
+    """ synthetic tenure IDs for a jurisdiction; numeric for all but Yukon, like the real registries """
+    if jurisdiction == "YK":
+        return ["YC%06d" % i for i in range(offset, offset + count)]
+    base = {"NWT": 10**6, "NU": 2 * 10**6, "NV": 3 * 10**6, "BC": 4 * 10**6}.get(jurisdiction, 5 * 10**6)
+    return [str(base + i) for i in range(offset, offset + count)]
+
+def synthetic_attributes(jurisdiction, tenure_id, now_ms):
+    """ the ArcGIS attributes of one tenure, stable for a given ID """
+    h = int(hashlib.md5(str(tenure_id).encode("utf-8")).hexdigest()[:8], 16)
+    fields = jurisdiction.fields
+    values = {
+        "RegDate": now_ms - (1 + h % 20) * YEAR_MS,
+        "Owner": "Owner %d" % (h % 50),
+        "Area_ha": (1 + h % 500) / 10 / jurisdiction.area_scale,
+        "ParcelName": "CLAIM %d" % (h % 100000),
+        "NextDueDate": now_ms + (h % 730 - 30) * 86400 * 1000
+    }
+    attributes = {col: values[key] for key, col in fields.items() if col and key in values}
+    attributes[jurisdiction.key_col] = int(tenure_id) if str(tenure_id).isdigit() else tenure_id
+    return attributes
+
+class FakeArcGIS:
+    """ serves /query for the layers of the given jurisdictions (name -> arcweb_data.Jurisdiction), by URL path; each
+        layer holds layer_size features (tenure_ids(name, layer_size), objectIds from 1) and answers keyed IN
+        queries (with square polygons when geometry is asked for), objectId range queries, count-only and IDs-only
+        queries, returning at most max_record_count features per response like a real server. FeatureServer layers
+        also answer f=pbf unless pbf is False, and responses are gzip-compressed when the client accepts it """
+    def __init__(self, jurisdictions, latency=0.0, layer_size=100000, max_record_count=1000, host="127.0.0.1",
+                 port=0, pbf=True):
+        self.latency = latency
+        self.pbf = pbf
+        self.layer_size = layer_size
+        self.max_record_count = max_record_count
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.layers = {}
+        for j in jurisdictions.values():
+            path = urlsplit(j.service_url).path + "/" + str(j.layer)
+            ids = tenure_ids(j.name, layer_size)
+            self.layers[path] = (j, ids, {t: i for i, t in enumerate(ids)})
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                layer_path = unquote(parts.path)
+                if not layer_path.endswith("/query") or layer_path[:-len("/query")] not in fake.layers:
+                    self.send_error(404)
+                    return
+                j, layer_ids, positions = fake.layers[layer_path[:-len("/query")]]
+                query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                if fake.latency:
+                    time.sleep(fake.latency)
+                with fake._lock:
+                    fake.requests += 1
+                result = fake.answer(j, layer_ids, positions, query)
+                if query.get("f") == "pbf" and fake.pbf and "/FeatureServer/" in layer_path:
+                    self.respond(encode_pbf(result), "application/x-protobuf")
+                elif query.get("f") == "pbf": # what servers without protocol buffer support answer
+                    self.send_error(400, "Invalid format")
+                else:
+                    self.respond(json.dumps(result).encode("utf-8"))
+
+            def respond(self, body, content_type="application/json"):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, 1)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = "http://%s:%d" % self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def answer(self, j, layer_ids, index, query):
+        """ the JSON response to a layer query; index maps the layer's tenure IDs to their positions """
+        where = query.get("where", "")
+        match = re.search(r"IN \((.*)\)", where)
+        if match:
+            wanted = (v.strip("'") for v in match.group(1).split(","))
+            positions = sorted(index[t] for t in wanted if t in index)
+        else:
+            match = re.search(r"OBJECTID >= (\d+) AND OBJECTID <= (\d+)", where)
+            first, last = (int(match.group(1)), int(match.group(2))) if match else (1, len(layer_ids))
+            positions = range(max(first, 1) - 1, min(last, len(layer_ids)))
+        if query.get("returnCountOnly") == "true":
+            return {"count": len(positions)}
+        if query.get("returnIdsOnly") == "true":
+            return {"objectIdFieldName": "OBJECTID", "objectIds": [i + 1 for i in positions]}
+        now_ms = int(time.time() * 1000)
+        if query.get("returnGeometry") == "true": # a 0.01 degree square per tenure, in rows of 1000
+            features = [{"attributes": {j.key_col: synthetic_attributes(j, layer_ids[i], now_ms)[j.key_col]},
+                         "geometry": {"rings": [[[x, y], [x, y + 0.01], [x + 0.01, y + 0.01], [x + 0.01, y], [x, y]]
+                                                for x, y in [(-135 + i % 1000 * 0.01, 60 + i // 1000 * 0.01)]]}}
+                        for i in positions[:self.max_record_count]]
+        else:
+            features = [{"attributes": synthetic_attributes(j, layer_ids[i], now_ms)}
+                        for i in positions[:self.max_record_count]]
+        result = {"features": features}
+        if len(positions) > self.max_record_count:
+            result["exceededTransferLimit"] = True
+        return result
+
+    def layer_url(self, base_url, service_url, layer):
+        """ drop-in for arcweb_data._get_layer_url, which would otherwise ask the real server through restapi """
+        return service_url + "/" + str(layer)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def _pb_varint(n):
+    out = bytearray()
+    while True:
+        b = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+def _pb_field(number, wire, payload):
+    """ one protobuf field; payload is an int for varints, bytes otherwise """
+    key = _pb_varint(number << 3 | wire)
+    if wire == 0:
+        return key + _pb_varint(payload)
+    if wire == 2:
+        return key + _pb_varint(len(payload)) + payload
+    return key + payload
+
+def _pb_value(v):
+    if v is None:
+        return b""
+    if isinstance(v, bool):
+        return _pb_field(9, 0, int(v))
+    if isinstance(v, int):
+        return _pb_field(8, 0, (v << 1) ^ (v >> 63))
+    if isinstance(v, float):
+        return _pb_field(3, 1, struct.pack("<d", v))
+    return _pb_field(1, 2, str(v).encode("utf-8"))
+
+def encode_pbf(result):
+    """ an f=json query result ("features", "count" or "objectIds") as an Esri FeatureCollectionPBuffer """
+    if "count" in result:
+        query_result = _pb_field(2, 2, _pb_field(1, 0, result["count"]))
+    elif "objectIds" in result:
+        ids = b"".join(_pb_varint(i) for i in result["objectIds"])
+        query_result = _pb_field(3, 2, _pb_field(1, 2, result["objectIdFieldName"].encode("utf-8")) +
+                                 _pb_field(3, 2, ids))
+    else:
+        names = list(result["features"][0]["attributes"]) if result["features"] else []
+        body = _pb_field(1, 2, b"OBJECTID")
+        if result.get("exceededTransferLimit"):
+            body += _pb_field(9, 0, 1)
+        body += b"".join(_pb_field(13, 2, _pb_field(1, 2, n.encode("utf-8"))) for n in names)
+        body += b"".join(_pb_field(15, 2, b"".join(_pb_field(1, 2, _pb_value(f["attributes"].get(n)))
+                                                   for n in names)) for f in result["features"])
+        query_result = _pb_field(1, 2, body)
+    return _pb_field(1, 2, b"3.0") + _pb_field(2, 2, query_result)
+
+_CELL = re.compile(r"^([A-Za-z]*)(\d*)$")
+
+def _cell(label, default_row=1, default_col=1):
+    """ (row, col) of an A1 cell label, 1-based; a missing row or column takes the default """
+    letters, digits = _CELL.match(label).groups()
+    col = 0
+    for c in letters.upper():
+        col = col * 26 + ord(c) - 64
+    return (int(digits) if digits else default_row, col or default_col)
+
+def _label(row, col):
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters + str(row)
+
+class FakeSpreadsheet:
+    def __init__(self, title):
+        self.id = uuid.uuid4().hex
+        self.title = title
+        self.sheets = {} # sheetId -> {"properties": ..., "grid": [[...], ...]}
+        self.next_sheet_id = 0
+        self.add_sheet({"title": "Sheet1"})
+
+    def add_sheet(self, properties):
+        props = {"sheetId": self.next_sheet_id, "title": "Sheet%d" % (self.next_sheet_id + 1),
+                 "index": len(self.sheets), "sheetType": "GRID",
+                 "gridProperties": {"rowCount": 1000, "columnCount": 26}}
+        grid = dict(props["gridProperties"], **properties.get("gridProperties", {}))
+        props.update(properties)
+        props["gridProperties"] = grid
+        self.sheets[props["sheetId"]] = {"properties": props, "grid": []}
+        self.next_sheet_id += 1
+        return props
+
+    def json(self):
+        return {
+            "spreadsheetId": self.id,
+            "properties": {"title": self.title, "locale": "en_US", "timeZone": "Etc/GMT", "defaultFormat": {}},
+            "sheets": [{"properties": s["properties"]} for s in self.sheets.values()],
+            "spreadsheetUrl": "https://docs.google.com/spreadsheets/d/" + self.id
+        }
+
+    def sheet_for(self, a1_range):
+        """ the sheet and cell range part of an A1 range (\"'Title'!A1:B2\", \"Title\" or \"A1:B2\") """
+        if "!" in a1_range:
+            title, cells = a1_range.rsplit("!", 1)
+        elif any(s["properties"]["title"] == a1_range.strip("'") for s in self.sheets.values()):
+            title, cells = a1_range, ""
+        else:
+            title, cells = None, a1_range
+        title = title.strip("'").replace("''", "'") if title else None
+        for s in self.sheets.values():
+            if title is None or s["properties"]["title"] == title:
+                return s, cells
+        raise KeyError(a1_range)
+
+    def write(self, a1_range, values):
+        sheet, cells = self.sheet_for(a1_range)
+        row, col = _cell(cells.split(":")[0]) if cells else (1, 1)
+        grid = sheet["grid"]
+        for i, values_row in enumerate(values):
+            r = row - 1 + i
+            while len(grid) <= r:
+                grid.append([])
+            target = grid[r]
+            end = col - 1 + len(values_row)
+            if len(target) < end:
+                target.extend([""] * (end - len(target)))
+            target[col - 1:end] = ["" if v is None else str(v) for v in values_row]
+        return sheet, row, col
+
+    def read(self, a1_range):
+        sheet, cells = self.sheet_for(a1_range)
+        start, end = (cells.split(":") + [""])[:2] if cells else ("A1", "ZZZ")
+        row, col = _cell(start)
+        gp = sheet["properties"]["gridProperties"]
+        end_row, end_col = _cell(end, gp["rowCount"], gp["columnCount"]) if end else (row, col)
+        values = [r[col - 1:end_col] for r in sheet["grid"][row - 1:end_row]]
+        while values and not any(values[-1]):
+            values.pop()
+        return [list(r) for r in values]
+
+class FakeSheetsHttp:
+    """ an httplib2.Http stand-in for pygsheets.Client(credentials, http=FakeSheetsHttp()) """
+    timeout = None
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.spreadsheets = {}
+        self.calls = Counter()
+        self.bytes_sent = Counter()
+        self._lock = threading.Lock()
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.bytes_sent.clear()
+
+    def totals(self):
+        with self._lock:
+            return sum(self.calls.values()), sum(self.bytes_sent.values())
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        parts = urlsplit(uri)
+        path = unquote(parts.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        payload = json.loads(body) if body else {}
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            endpoint, result = self._dispatch(method, path, query, payload)
+            self.calls[endpoint] += 1
+            self.bytes_sent[endpoint] += len(body or b"")
+        response = httplib2.Response({"status": "200", "content-type": "application/json; charset=UTF-8"})
+        return response, json.dumps(result).encode("utf-8")
+
+    def _dispatch(self, method, path, query, payload):
+        if path.startswith("/drive/"):
+            match = re.match(r"^/drive/v3/files/([^/]+)(/permissions)?$", path)
+            if match and match.group(2):
+                return "drive.permissions.create", {"id": uuid.uuid4().hex}
+            if match and method == "DELETE":
+                self.spreadsheets.pop(match.group(1), None)
+                return "drive.files.delete", {}
+            return "drive.files.list", {"files": [{"id": s.id, "name": s.title} for s in self.spreadsheets.values()]}
+
+        match = re.match(r"^/v4/spreadsheets/?([^/:]*)(?::(\w+))?"
+                         r"(?:/values(?::(\w+)|/(.+?)(?::(append|clear))?)?)?$", path)
+        if not match:
+            raise NotImplementedError(method + " " + path)
+        sid, action, values_batch, a1_range, values_action = match.groups()
+        if not sid:
+            s = FakeSpreadsheet(payload.get("properties", {}).get("title", "Untitled"))
+            self.spreadsheets[s.id] = s
+            return "spreadsheets.create", s.json()
+        s = self.spreadsheets[sid]
+        if action == "batchUpdate":
+            return "spreadsheets.batchUpdate", self._batch_update(s, payload.get("requests", []))
+        if values_batch == "batchUpdate":
+            for data in payload.get("data", []):
+                s.write(data["range"], data.get("values", []))
+            return "values.batchUpdate", {"spreadsheetId": sid}
+        if values_batch == "batchGet":
+            ranges = query.get("ranges", "")
+            return "values.batchGet", {"valueRanges": [{"range": ranges, "values": s.read(ranges)}]}
+        if a1_range is not None and values_action == "append":
+            return "values.append", self._append(s, a1_range, payload.get("values", []),
+                                                 query.get("insertDataOption", "INSERT_ROWS"))
+        if a1_range is not None and method == "PUT":
+            s.write(a1_range, payload.get("values", []))
+            return "values.update", {"spreadsheetId": sid, "updatedRange": a1_range}
+        if a1_range is not None:
+            return "values.get", {"range": a1_range, "majorDimension": "ROWS", "values": s.read(a1_range)}
+        return "spreadsheets.get", s.json()
+
+    def _batch_update(self, s, requests):
+        replies = []
+        for request in requests:
+            kind, body = next(iter(request.items()))
+            reply = {}
+            if kind == "addSheet":
+                reply = {"addSheet": {"properties": s.add_sheet(body.get("properties", {}))}}
+            elif kind == "deleteSheet":
+                s.sheets.pop(body["sheetId"], None)
+            elif kind == "updateSheetProperties":
+                props = body["properties"]
+                sheet = s.sheets[props.get("sheetId", 0)]
+                grid = dict(sheet["properties"]["gridProperties"], **props.get("gridProperties", {}))
+                sheet["properties"].update(props)
+                sheet["properties"]["gridProperties"] = grid
+            elif kind in ("deleteDimension", "insertDimension") and body["range"]["dimension"] == "ROWS":
+                r = body["range"]
+                sheet = s.sheets[r["sheetId"]]
+                count = r["endIndex"] - r["startIndex"]
+                if kind == "deleteDimension":
+                    del sheet["grid"][r["startIndex"]:r["endIndex"]]
+                    count = -count
+                else:
+                    sheet["grid"][r["startIndex"]:r["startIndex"]] = [[] for _ in range(count)]
+                sheet["properties"]["gridProperties"]["rowCount"] += count
+            replies.append(reply)
+        return {"spreadsheetId": s.id, "replies": replies}
+
+    def _append(self, s, a1_range, values, insert_option):
+        sheet, cells = s.sheet_for(a1_range)
+        title = sheet["properties"]["title"]
+        last = len(sheet["grid"])
+        while last and not any(sheet["grid"][last - 1]):
+            last -= 1
+        width = max([len(r) for r in values] + [1])
+        s.write(title + "!" + _label(last + 1, 1), values)
+        if insert_option == "INSERT_ROWS":
+            sheet["properties"]["gridProperties"]["rowCount"] += len(values)
+        return {
+            "spreadsheetId": s.id,
+            "tableRange": title + "!A1:" + _label(max(last, 1), width),
+            "updates": {"updatedRange": title + "!A%d:%s" % (last + 1, _label(last + len(values), width)),
+                        "updatedRows": len(values), "updatedColumns": width, "updatedCells": len(values) * width}
+        }
@@ -12,25 +12,402 @@
 # WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
 # COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+import hashlib
+import json
 import logging
 import pygsheets
 import pandas as pd
+import queue
+import re
 import sys
+from bisect import bisect_left
+from collections import namedtuple
+from contextlib import contextmanager
 from cron_converter import Cron
-from sqlalchemy import text, exc
+from sqlalchemy import bindparam, text, exc
 from sqlalchemy.dialects.mysql import insert
-from threading import Lock
+from threading import Lock, Thread
+from time import perf_counter
+from types import MappingProxyType
 import arcweb_data
-from datetime import datetime
+import metrics
+import sheets
+import tracing
+import wkb
+from datetime import datetime, timedelta
+
+# immutable view of a claimtable as presented to the web interface
+TableSnapshot = namedtuple("TableSnapshot", ["title", "url", "properties"])
+
+class ClaimTableRegistry:
+    """ a thread-safe registry of the loaded claimtables keyed by title; alongside each table it holds a precomputed,
+        immutable snapshot of the table properties, so that page loads and API routes are O(1) lookups which never
+        touch the configuration dataframes. snapshots are only rebuilt when a table is published or removed """
+    def __init__(self):
+        self._lock = Lock()
+        self._tables = {}
+        self._snapshots = {}
+
+    @staticmethod
+    def _snapshot(table):
+        """ build the snapshot from the raw values of the configuration dataframe """
+        df = table.config_df
+        properties = {
+            "ColumnOrder": df["ColumnOrder"].iloc[0],
+            "AccessList": df["AccessList"].iloc[0],
+            "UpdateSched": df["UpdateSched"].iloc[0],
+            "EmailSched": df["EmailSched"].iloc[0],
+            "Prune": str(df["Prune"].iloc[0] == 1),
+            "Compact": str(df["Compact"].iloc[0] == 1),
+            "CompactColumnOrder": df["CompactColumnOrder"].iloc[0]
+        }
+        return TableSnapshot(table.title, table.sheet1.url, MappingProxyType(properties))
+
+    def __iter__(self):
+        with self._lock:
+            tables = list(self._tables.values())
+        return iter(tables)
+
+    def __len__(self):
+        return len(self._tables)
+
+    def __contains__(self, title):
+        return title in self._tables
+
+    def titles(self):
+        """ the table titles in order of registration """
+        with self._lock:
+            return tuple(self._tables)
+
+    def get(self, title):
+        """ the ClaimTable registered under title, or None """
+        return self._tables.get(title)
+
+    def snapshot(self, title):
+        """ the TableSnapshot registered under title, or None """
+        return self._snapshots.get(title)
+
+    def publish(self, table, old_title=None):
+        """ register a table, or refresh its snapshot after a change; old_title re-keys a renamed table in place """
+        snapshot = self._snapshot(table)
+        with self._lock:
+            if old_title is not None and old_title != table.title and old_title in self._tables:
+                self._tables = {(table.title if t == old_title else t): c for t, c in self._tables.items()}
+                self._snapshots = {(table.title if t == old_title else t): s for t, s in self._snapshots.items()}
+            self._tables[table.title] = table
+            self._snapshots[table.title] = snapshot
+
+    def remove(self, title):
+        """ unregister a table, returning it (or None if the title is unknown) """
+        with self._lock:
+            self._snapshots.pop(title, None)
+            return self._tables.pop(title, None)
 
 global claimtables
-claimtables = []
+claimtables = ClaimTableRegistry()
+
+class SchemaCatalog:
+    """ a cache of the column names of every table in the database, loaded from information_schema in one query at
+        startup so that column-order validation never needs a database round trip. tables touched by DDL are either
+        refreshed directly by the code that issued it, or invalidated (e.g. from the binlog stream) and reloaded the
+        next time they are asked for """
+    DDL_PATTERN = re.compile(r"^\s*(?:CREATE|ALTER|DROP|RENAME|TRUNCATE)\s+(?:TEMPORARY\s+)?TABLES?\s+" +
+                             r"(?:IF\s+(?:NOT\s+)?EXISTS\s+)?`?(\w+)`?", re.IGNORECASE)
+    RENAME_PATTERN = re.compile(r"`?(\w+)`?\s+TO\s+`?(\w+)`?", re.IGNORECASE)
+
+    def __init__(self):
+        self._lock = Lock()
+        self._columns = {}
+        self._stale = set()
+        self.db = None
+
+    def _query(self, tables=None):
+        """ read the ordered column names for all tables, or for the given tables only """
+        query = "SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()"
+        params = {}
+        if tables:
+            names = [":t" + str(i) for i in range(len(tables))]
+            query += " AND TABLE_NAME IN (" + ", ".join(names) + ")"
+            params = {n[1:]: t for n, t in zip(names, tables)}
+        query += " ORDER BY TABLE_NAME, ORDINAL_POSITION"
+        columns = {}
+        with self.db.read() as conn:
+            for table_name, column_name in conn.execute(text(query), params):
+                columns.setdefault(table_name, []).append(column_name)
+        return {t: tuple(c) for t, c in columns.items()}
+
+    def load(self, db):
+        """ load the whole catalog in one query """
+        self.db = db
+        columns = self._query()
+        with self._lock:
+            self._columns = columns
+            self._stale = set()
+        logging.debug("Schema catalog loaded for %d tables", len(columns))
+
+    def refresh(self, *tables):
+        """ reload the columns of the given tables; tables that no longer exist are dropped from the catalog """
+        tables = [t for t in tables if t]
+        if not tables or self.db is None:
+            return
+        try:
+            columns = self._query(tables)
+        except exc.SQLAlchemyError as e:
+            logging.error("Unable to refresh the schema catalog for %s", tables)
+            logging.error(e)
+            self.invalidate(*tables)
+            return
+        with self._lock:
+            for t in tables:
+                self._stale.discard(t)
+                if t in columns:
+                    self._columns[t] = columns[t]
+                else:
+                    self._columns.pop(t, None)
+
+    def invalidate(self, *tables):
+        """ mark tables as stale, so that they are reloaded the next time they are asked for """
+        with self._lock:
+            self._stale.update(t for t in tables if t)
+
+    def columns(self, table):
+        """ the ordered column names of a table, or None if the table does not exist """
+        if table in self._stale:
+            self.refresh(table)
+        return self._columns.get(table)
+
+    @classmethod
+    def ddl_tables(cls, query):
+        """ the table names affected by a DDL statement (including rename targets), or an empty list """
+        match = cls.DDL_PATTERN.match(query or "")
+        if not match:
+            return []
+        tables = [match.group(1)]
+        for old, new in cls.RENAME_PATTERN.findall(query):
+            tables += [t for t in (old, new) if t.upper() != "RENAME" and t not in tables]
+        return tables
+
+global schema_catalog
+schema_catalog = SchemaCatalog()
+
+class TenureCache:
+    """ the last normalized ArcGIS record of every tenure, shared by all claimtables in the _Tenure_Cache table, keyed
+        by (Jurisdiction, RegTitleNumber) with the time it was fetched, the time its content last changed and a hash
+        of the content. ClaimTable.update reads through it: tenures fetched less than max_age seconds ago are served
+        from the table, only the others go to the network. a max_age of 0 turns the cache off (it is still written
+        when the geometry cache needs the ChangedAt dates) """
+    TABLE = "_Tenure_Cache"
+    DATE_KEYS = ("RegDate", "NextDueDate")
+    CHUNK = 1000 # IDs per lookup query
+
+    def __init__(self, max_age=0):
+        self.max_age = max_age
+        self._ready = False
+
+    def _ensure(self, conn):
+        if not self._ready:
+            conn.execute(text("CREATE TABLE IF NOT EXISTS " + self.TABLE + " (Jurisdiction VARCHAR(16) NOT NULL, "
+                              "RegTitleNumber VARCHAR(64) NOT NULL, Attributes JSON NOT NULL, ContentHash CHAR(40) "
+                              "NOT NULL, FetchedAt DATETIME NOT NULL, ChangedAt DATETIME NOT NULL, "
+                              "PRIMARY KEY (Jurisdiction, RegTitleNumber), INDEX FetchedAt (FetchedAt))"))
+            self._ready = True
+
+    def lookup(self, db, jurisdiction, tenure_ids, max_age=None):
+        """ RegTitleNumber -> record of the tenures that are in the cache and fresh; max_age can only shorten
+            self.max_age """
+        fresh = {}
+        max_age = self.max_age if max_age is None else min(max_age, self.max_age)
+        if not max_age: # only written through, for the geometry cache (see GeometryCache)
+            return fresh
+        cutoff = datetime.now() - timedelta(seconds=max_age)
+        query = text("SELECT RegTitleNumber, Attributes FROM " + self.TABLE + " WHERE Jurisdiction = :jurisdiction "
+                     "AND FetchedAt >= :cutoff AND RegTitleNumber IN :ids").bindparams(bindparam("ids", expanding=True))
+        try:
+            with db.write() as conn:
+                self._ensure(conn)
+            with db.read() as conn:
+                for start in range(0, len(tenure_ids), self.CHUNK):
+                    params = {"jurisdiction": jurisdiction, "cutoff": cutoff,
+                              "ids": tenure_ids[start:start + self.CHUNK]}
+                    for tenure_id, attributes in conn.execute(query, params):
+                        record = json.loads(attributes)
+                        for key in self.DATE_KEYS:
+                            if record.get(key) is not None:
+                                record[key] = pd.Timestamp(record[key])
+                        fresh[tenure_id] = record
+        except exc.SQLAlchemyError as e:
+            logging.error("Unable to read the tenure cache, fetching every tenure")
+            logging.error(e)
+            return {}
+        metrics.tenure_cache_tenures.inc(len(fresh), jurisdiction=jurisdiction, outcome="hit")
+        metrics.tenure_cache_tenures.inc(len(tenure_ids) - len(fresh), jurisdiction=jurisdiction, outcome="miss")
+        return fresh
+
+    def store(self, db, jurisdiction, records):
+        """ record a batch of freshly fetched tenures; ChangedAt only moves when the content hash changes """
+        if not records:
+            return
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        for record in records:
+            attributes = json.dumps(record, sort_keys=True, default=str)
+            rows.append({"jurisdiction": jurisdiction, "id": str(record["RegTitleNumber"]), "attributes": attributes,
+                         "hash": hashlib.sha1(attributes.encode("utf-8")).hexdigest(), "now": now})
+        try:
+            with db.write() as conn:
+                self._ensure(conn)
+                conn.execute(text("INSERT INTO " + self.TABLE + " (Jurisdiction, RegTitleNumber, Attributes, "
+                                  "ContentHash, FetchedAt, ChangedAt) VALUES (:jurisdiction, :id, :attributes, :hash, "
+                                  ":now, :now) ON DUPLICATE KEY UPDATE ChangedAt = IF(ContentHash = "
+                                  "VALUES(ContentHash), ChangedAt, VALUES(FetchedAt)), Attributes = "
+                                  "VALUES(Attributes), ContentHash = VALUES(ContentHash), FetchedAt = "
+                                  "VALUES(FetchedAt)"), rows)
+        except exc.SQLAlchemyError as e:
+            logging.error("Unable to write to the tenure cache")
+            logging.error(e)
+
+    def read_through(self, db, jurisdiction, fetch, max_age=None):
+        """ wrap a jurisdiction's fetch(batches) so that fresh tenures (see lookup) come from the cache and fetched
+            ones are stored; batches keep their numbers (see ClaimTable._refresh_plan) and fully cached batches make
+            no request at all """
+        def cached_fetch(batches):
+            batches = list(batches)
+            fresh = self.lookup(db, jurisdiction, [t for _, ids in batches for t in ids], max_age)
+            stale = [(batch, [t for t in ids if t not in fresh]) for batch, ids in batches]
+            fetched = fetch([(batch, ids) for batch, ids in stale if ids])
+            for (batch, ids), (_, missing) in zip(batches, stale):
+                records = [dict(fresh[t]) for t in ids if t in fresh]
+                error = None
+                if missing:
+                    _, tenure_data, error = next(fetched)
+                    if error is None:
+                        self.store(db, jurisdiction, tenure_data)
+                        records += tenure_data
+                yield batch, (records if error is None else None), error
+        return cached_fetch
+
+global tenure_cache
+tenure_cache = TenureCache()
+
+class GeometryCache:
+    """ the polygons (or points) of every tenure, as WKB in WGS 84 (see wkb.py), shared by all claimtables in the
+        _Tenure_Geometry table. geometries are only fetched when the tenure is new or when its attributes have
+        changed since (the ChangedAt of the tenure cache, which is kept up to date whenever geometry is enabled); the
+        server generalizes them to max_allowable_offset degrees and geometry_precision decimals. a tenure the server
+        has no geometry for is stored with a NULL geometry, so it isn't asked for again until it changes. off unless
+        enabled """
+    TABLE = "_Tenure_Geometry"
+    CHUNK = 1000 # IDs per lookup query
+
+    def __init__(self, enabled=False, max_allowable_offset=None, geometry_precision=None):
+        self.enabled = enabled
+        self.max_allowable_offset = max_allowable_offset
+        self.geometry_precision = geometry_precision
+        self._ready = False
+
+    def _ensure(self, conn):
+        if not self._ready:
+            conn.execute(text("CREATE TABLE IF NOT EXISTS " + self.TABLE + " (Jurisdiction VARCHAR(16) NOT NULL, "
+                              "RegTitleNumber VARCHAR(64) NOT NULL, Geometry LONGBLOB NULL, ChangedAt DATETIME "
+                              "NOT NULL, FetchedAt DATETIME NOT NULL, PRIMARY KEY (Jurisdiction, RegTitleNumber))"))
+            column = conn.execute(text("SHOW COLUMNS FROM " + self.TABLE + " LIKE 'Geometry'")).fetchone()
+            if column is not None and column[2] == "NO": # created before tenures without geometry were recorded
+                conn.execute(text("ALTER TABLE " + self.TABLE + " MODIFY Geometry LONGBLOB NULL"))
+            tenure_cache._ensure(conn)
+            self._ready = True
+
+    def stale(self, db, jurisdiction, tenure_ids):
+        """ RegTitleNumber -> edit date (the tenure cache's ChangedAt, None if it isn't cached) of the tenures whose
+            geometry is missing or older than their attributes """
+        query = text("SELECT t.RegTitleNumber, t.ChangedAt, g.ChangedAt FROM " + tenure_cache.TABLE + " t LEFT JOIN " +
+                     self.TABLE + " g ON g.Jurisdiction = t.Jurisdiction AND g.RegTitleNumber = t.RegTitleNumber "
+                     "WHERE t.Jurisdiction = :jurisdiction AND t.RegTitleNumber IN :ids "
+                     "UNION ALL SELECT g.RegTitleNumber, NULL, g.ChangedAt FROM " + self.TABLE + " g LEFT JOIN " +
+                     tenure_cache.TABLE + " t ON t.Jurisdiction = g.Jurisdiction AND t.RegTitleNumber = "
+                     "g.RegTitleNumber WHERE g.Jurisdiction = :jurisdiction AND g.RegTitleNumber IN :ids AND "
+                     "t.RegTitleNumber IS NULL").bindparams(bindparam("ids", expanding=True))
+        stale = dict.fromkeys(tenure_ids)
+        with db.write() as conn:
+            self._ensure(conn)
+        with db.read() as conn:
+            for start in range(0, len(tenure_ids), self.CHUNK):
+                params = {"jurisdiction": jurisdiction, "ids": tenure_ids[start:start + self.CHUNK]}
+                for tenure_id, changed, geometry_changed in conn.execute(query, params):
+                    if geometry_changed is not None and (changed is None or changed <= geometry_changed):
+                        stale.pop(tenure_id, None)
+                    else:
+                        stale[tenure_id] = changed
+        return stale
+
+    def refresh(self, db, jurisdiction, tenure_ids):
+        """ fetch and store the geometry of the given tenures that are stale; returns the number fetched """
+        try:
+            stale = self.stale(db, jurisdiction, [str(t) for t in tenure_ids])
+        except exc.SQLAlchemyError as e:
+            logging.error("Unable to read the geometry cache for %s", jurisdiction)
+            logging.error(e)
+            return 0
+        metrics.tenure_geometries.inc(len(tenure_ids) - len(stale), jurisdiction=jurisdiction, outcome="fresh")
+        if not stale:
+            return 0
+        ids = sorted(stale)
+        size = arcweb_data.BATCH_SIZE
+        plan = [(i, ids[start:start + size]) for i, start in enumerate(range(0, len(ids), size))]
+        fetched = 0
+        for batch, shapes, error in arcweb_data.jurisdictions[jurisdiction].geometries(plan,
+                                                                                       self.max_allowable_offset,
+                                                                                       self.geometry_precision):
+            if error is not None:
+                logging.error("Failed to retrieve the geometry of batch %d of %d (%s)", batch + 1, len(plan),
+                              jurisdiction)
+                logging.error(error)
+                metrics.tenure_geometries.inc(len(plan[batch][1]), jurisdiction=jurisdiction, outcome="failed")
+                continue
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            # tenures without a geometry (not returned, or of a type wkb.py doesn't convert) are stored as NULL
+            rows = [{"jurisdiction": jurisdiction, "id": tenure_id, "geometry": wkb.from_esri(shapes.get(tenure_id)),
+                     "changed": stale[tenure_id] or now, "now": now} for tenure_id in plan[batch][1]]
+            missing = sum(1 for r in rows if r["geometry"] is None)
+            metrics.tenure_geometries.inc(len(rows) - missing, jurisdiction=jurisdiction, outcome="fetched")
+            metrics.tenure_geometries.inc(missing, jurisdiction=jurisdiction, outcome="missing")
+            try:
+                with db.write() as conn:
+                    conn.execute(text("INSERT INTO " + self.TABLE + " (Jurisdiction, RegTitleNumber, Geometry, "
+                                      "ChangedAt, FetchedAt) VALUES (:jurisdiction, :id, :geometry, :changed, :now) "
+                                      "ON DUPLICATE KEY UPDATE Geometry = VALUES(Geometry), ChangedAt = "
+                                      "VALUES(ChangedAt), FetchedAt = VALUES(FetchedAt)"), rows)
+                fetched += len(rows)
+            except exc.SQLAlchemyError as e:
+                logging.error("Unable to write to the geometry cache")
+                logging.error(e)
+        return fetched
+
+    def feature_collection(self, db, table):
+        """ a claimtable as a GeoJSON FeatureCollection, its rows as properties and the cached polygons (null where
+            there is none yet) as geometries """
+        features = []
+        with db.write() as conn:
+            self._ensure(conn)
+        with db.read() as conn:
+            result = conn.execute(text("SELECT c.*, g.Geometry AS _Geometry FROM " + table + " c LEFT JOIN " +
+                                       self.TABLE + " g ON g.Jurisdiction = c.Jurisdiction AND g.RegTitleNumber = "
+                                       "c.RegTitleNumber"))
+            for row in result.mappings():
+                properties = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row.items()
+                              if k != "_Geometry"}
+                geometry = wkb.to_geojson(row["_Geometry"]) if row["_Geometry"] is not None else None
+                features.append({"type": "Feature", "id": properties.get("RegTitleNumber"), "geometry": geometry,
+                                 "properties": properties})
+        return {"type": "FeatureCollection", "features": features}
+
+global geometry_cache
+geometry_cache = GeometryCache()
 
 # TODO: legacy shit, get rid of this?
 class TableDefinition:
     name = ""
-    keyCol = ""
-    jurisdictionCol = ""
+    keyCol = "RegTitleNumber"
+    jurisdictionCol = "Jurisdiction"
     required_cols = ["RegDate",
                      "Owner",
                      "Area_ha",
@@ -42,45 +419,94 @@ class TableDefinition:
 class ClaimTable(pygsheets.Spreadsheet):
     """ the claimtable class is an extended class from pygsheets, with added functions to load Spreadsheet data from
         MySQL, update tenure expiry dates, modify rows on the Spreadsheet, and more... """
-    def __init__(self, engine, suffix, client, jsonsheet=None, id=None, load_config=True):
+    chunksize = 5000 # rows per chunk when streaming SQL tables to worksheets
+    refresh_attempts = 3 # fetches of a checkpointed batch before it is abandoned until the next run
+    def __init__(self, db, suffix, client, jsonsheet=None, id=None, load_config=True):
         super().__init__(client, jsonsheet, id)
-        self.engine = engine
+        self.db = db # shared database access layer (see database.py)
         self.suffix = suffix
         self.sheet1.title = self.title
         self.compact_wks = None # compacted worksheet placeholder
-        self.conn_lock = Lock() # per-table lock to prevent race conditions on the database connection
-        self.supported_jurisdictions = {"YK": arcweb_data.get_data_YK, "NWT": arcweb_data.get_data_NWT, \
-                                        "NU": arcweb_data.get_data_NU, "NV": arcweb_data.get_data_NV, \
-                                        "BC": arcweb_data.get_data_BC}
+        self.row_index = {} # RegTitleNumber -> row number on the primary worksheet
+        self.row_index_lock = Lock()
+        self.update_progress = {} # per-batch progress of the running (or last) update
+        self.supported_jurisdictions = dict(arcweb_data.jurisdictions) # name -> arcweb_data.Jurisdiction
         if load_config:
             self.load_config()
 
+    @contextmanager
+    def _sheets_call(self, call):
+        """ times and counts a Google Sheets API call (see metrics.py and tracing.py) """
+        with tracing.tracer.measure("sheets"), \
+                metrics.timer(metrics.sheets_api_seconds, metrics.sheets_api_calls, table=self.title, call=call):
+            yield
+
     def _write_dataframe(self, wks, df, start=(1,1), fit=True, copy_head=True):
-        """ writes a dataframe to a worksheet, replacing NaN and NaT with empty strings """
-        wks.set_dataframe(df.astype(object).fillna("").infer_objects(copy=False),
-                          start, encoding="utf-8", fit=fit, copy_head=copy_head)
+        """ writes a dataframe to a worksheet, replacing NaN and NaT with empty strings (see sheets.py) """
+        with self._sheets_call("update_values"):
+            sheets.write_dataframe(wks, df, start, fit=fit, copy_head=copy_head)
+
+    def _stream_table(self, wks, table, column_order, drop_columns=(), index=False):
+        """ streams a SQL table to a worksheet chunk by chunk through a server-side cursor, so that memory stays
+            bounded by the chunk size rather than the table size; the worksheet is sized once from a row count
+            taken in the same transaction, and each chunk is written to its own range below the header. with
+            index=True the RegTitleNumber-to-row index is rebuilt from the rows as they are written """
+        row_index = {}
+        with self.db.read(stream=True) as conn:
+            total = conn.execute(text("SELECT COUNT(*) FROM " + table)).scalar()
+            row = 1
+            chunks = iter(pd.read_sql(text("SELECT * FROM " + table), con=conn, chunksize=self.chunksize))
+            while True:
+                start = perf_counter()
+                with tracing.tracer.measure("db"): # rows fetched from a server-side cursor, not just the execute
+                    chunk = next(chunks, None)
+                metrics.sync_seconds.observe(perf_counter() - start, table=table, phase="read")
+                if chunk is None:
+                    break
+                chunk = chunk.drop(columns=[c for c in drop_columns if c in chunk.columns])
+                chunk = chunk[column_order + [c for c in chunk.columns if c not in column_order]]
+                start = perf_counter()
+                if row == 1:
+                    with self._sheets_call("resize"):
+                        wks.resize(rows=total + 1, cols=len(chunk.columns))
+                    self._write_dataframe(wks, chunk, start=(1, 1), fit=False, copy_head=True)
+                    row += 1
+                else:
+                    self._write_dataframe(wks, chunk, start=(row, 1), fit=False, copy_head=False)
+                metrics.sync_seconds.observe(perf_counter() - start, table=table, phase="write")
+                if index:
+                    row_index.update(zip(chunk["RegTitleNumber"].astype(str), range(row, row + len(chunk))))
+                row += len(chunk)
+        if row == 1:
+            # pandas yields no chunks for an empty result, so write the header by itself
+            with self.db.read() as conn:
+                df = pd.read_sql(text("SELECT * FROM " + table + " LIMIT 0"), con=conn)
+            df = df.drop(columns=[c for c in drop_columns if c in df.columns])
+            self._write_dataframe(wks, df[column_order + [c for c in df.columns if c not in column_order]])
+        if index:
+            with self.row_index_lock:
+                self.row_index = row_index
+        return max(row - 2, 0)
 
     def load_config(self):
         """ load the configuration SQL table that is linked to the claimtable, and update table-specific settings  """
         df = pd.DataFrame()
         query = "SELECT * FROM " + self.title + self.suffix["config"]
 
-        self.conn_lock.acquire()
         try:
-            with self.engine.connect() as conn:
+            with self.db.read() as conn:
                 df = pd.read_sql(text(query), con=conn)
         except exc.SQLAlchemyError as e:
             logging.error("Unable to read table <%s> into dataframe", self.title)
             logging.error(e)
-        finally:
-            self.conn_lock.release()
 
         # crontab-like schedule definitions for updating expiries and emailing the access_list
         now = datetime.now()
         # TODO: better exception handling
         if df.size > 0:
             try:
-                self.update_schedule = Cron(df["UpdateSched"].iloc[0]).schedule(now)
+                self.update_cron = Cron(df["UpdateSched"].iloc[0])
+                self.update_schedule = self.update_cron.schedule(now)
                 self.update_schedule_iter = self.update_schedule.next()
                 self.email_schedule = Cron(df["EmailSched"].iloc[0]).schedule(now)
                 self.email_schedule_iter = self.email_schedule.next()
@@ -108,7 +534,8 @@ class ClaimTable(pygsheets.Spreadsheet):
         else:
             # TODO: default settings need to be handled better
             # January 31 on a Monday will next be in 2033 (ie. the default, "* * 31 1 1")
-            self.update_schedule = Cron("* * 31 1 1").schedule(now)
+            self.update_cron = Cron("* * 31 1 1")
+            self.update_schedule = self.update_cron.schedule(now)
             self.update_schedule_iter = self.update_schedule.next()
             self.email_schedule = Cron("* * 31 1 1").schedule(now)
             self.email_schedule_iter = self.email_schedule.next()
@@ -151,26 +578,23 @@ class ClaimTable(pygsheets.Spreadsheet):
             conn.execute(text(sql), params)
 
         if not df.empty:
-            self.conn_lock.acquire()
             try:
-                with self.engine.connect() as conn:
+                with self.db.write() as conn:
                     df.to_sql(self.title + self.suffix["config"], conn, index=False, if_exists="append",
                               method=mysql_upsert_into)
             except exc.SQLAlchemyError as e:
                 logging.error("Unable to write configuration to table <%s>", self.title + self.suffix["config"])
                 logging.error(e)
-            finally:
-                self.conn_lock.release()
 
     def update_config(self, table_properties):
         self.config_df = pd.DataFrame(table_properties)
         self.write_config(self.config_df)
         self.load_config()
+        claimtables.publish(self)
 
     def new(self):
         """ generate a new table to store tenure data in the SQL database, and a table of associated configuration
             settings, by copying the column information from templates """
-        df = pd.DataFrame()
         success = False
         query = "DROP TABLE IF EXISTS " + self.title + ";" + \
                     "CREATE TABLE " + self.title + " LIKE _Parcels_Template;" + \
@@ -182,31 +606,32 @@ class ClaimTable(pygsheets.Spreadsheet):
                     "ALTER TABLE " + self.title + self.suffix["config"] + " AUTO_INCREMENT = 1"
         query = query.split(";")
 
-        self.conn_lock.acquire()
         try:
-            with self.engine.begin() as conn:
+            with self.db.write() as conn:
                 for q in query:
                     conn.execute(text(q))
-                query = "SELECT * FROM " + self.title
-                df = pd.read_sql(text(query), con=conn) # Put the columns into the dataframe
             success = True
         except exc.SQLAlchemyError as e:
             logging.error("Unable to create new table <%s>", self.title)
             logging.error(e)
-        finally:
-            self.conn_lock.release()
 
+        schema_catalog.refresh(self.title, self.title + self.suffix["config"])
         if not success:
             return
 
         self.load_config()
 
-        # re-order columns
-        df = df[self.column_order + [c for c in df.columns if c not in self.column_order]]
-        self._write_dataframe(self.sheet1, df)
+        # write the (empty) table, which puts the columns on the worksheet
+        try:
+            self._stream_table(self.sheet1, self.title, self.column_order, index=True)
+        except exc.SQLAlchemyError as e:
+            logging.error("Unable to read new table <%s>", self.title)
+            logging.error(e)
+            return
         # can't freeze rows when there's only one row
         # self.sheet1.frozen_rows = 1
         self.sheet1.link()
+        claimtables.publish(self)
 
     def rename(self, new_title):
         """ rename the SQL tables and the Claimtable worksheet titles """
@@ -214,35 +639,37 @@ class ClaimTable(pygsheets.Spreadsheet):
         new_title_config = new_title + self.suffix["config"]
         new_title_compact = new_title + self.suffix["compact"]
         query = "ALTER TABLE " + self.title + " RENAME TO " + new_title + ";" + \
-                "ALTER TABLE " + self.title + self.suffix["config"] + " RENAME TO " + new_title_config
+                "ALTER TABLE " + self.title + self.suffix["config"] + " RENAME TO " + new_title_config + ";" + \
+                "ALTER TABLE " + self._refresh_table() + " RENAME TO " + new_title + self.suffix["refresh"]
         query = query.split(";")
 
-        self.conn_lock.acquire()
         try:
-            with self.engine.begin() as conn:
+            with self.db.write() as conn:
+                self._ensure_refresh_table(conn)
                 for q in query:
                     conn.execute(text(q))
         except exc.SQLAlchemyError as e:
             logging.error("Unable to rename table <%s>", self.title)
             logging.error(e)
+            schema_catalog.invalidate(self.title, self.title + self.suffix["config"], new_title, new_title_config)
             return
-        finally:
-            self.conn_lock.release()
 
+        schema_catalog.refresh(self.title, self.title + self.suffix["config"], new_title, new_title_config)
         if self.compact_wks is not None:
-            self.conn_lock.acquire()
             query = "ALTER TABLE " + self.title + self.suffix["compact"] + " RENAME TO " + new_title_compact
             try:
-                with self.engine.begin() as conn:
+                with self.db.write() as conn:
                     conn.execute(text(query))
             except exc.SQLAlchemyError as e:
                 logging.error("Unable to rename table <%s>", self.title)
                 logging.error(e)
                 return
             finally:
-                self.conn_lock.release()
+                schema_catalog.refresh(self.title + self.suffix["compact"], new_title_compact)
 
+        old_title = self.title
         self.title = new_title
+        claimtables.publish(self, old_title=old_title)
 
     def destroy(self):
         """ drop the SQL table from the database, as well as the associated configuration and compacted tables, and
@@ -250,24 +677,132 @@ class ClaimTable(pygsheets.Spreadsheet):
         logging.debug("Destroying table <%s>", self.title)
         query = "DROP TABLE IF EXISTS " + self.title + ";" + \
                 "DROP TABLE IF EXISTS " + self.title + self.suffix["config"] + ";" + \
-                "DROP TABLE IF EXISTS " + self.title + self.suffix["compact"]
+                "DROP TABLE IF EXISTS " + self.title + self.suffix["compact"] + ";" + \
+                "DROP TABLE IF EXISTS " + self._refresh_table()
         query = query.split(";")
 
-        self.conn_lock.acquire()
         try:
-            with self.engine.begin() as conn:
+            with self.db.write() as conn:
                 for q in query:
                     conn.execute(text(q))
         except exc.SQLAlchemyError as e:
             logging.error("Unable to drop table <%s>", self.title)
             logging.error(e)
         finally:
-            self.conn_lock.release()
+            schema_catalog.refresh(self.title, self.title + self.suffix["config"], self.title + self.suffix["compact"])
 
+        claimtables.remove(self.title)
         self.delete()
 
-    def update(self, inTable: TableDefinition, jurisdiction: str, RegTitleNumber=None):
-        """ update the tenure information by polling the appropriate ArcGIS REST API (see arcweb_data.py) """
+    def _refresh_table(self):
+        """ name of the side table holding the per-batch checkpoints of refresh runs """
+        return self.title + self.suffix["refresh"]
+
+    def _ensure_refresh_table(self, conn):
+        conn.execute(text("CREATE TABLE IF NOT EXISTS " + self._refresh_table() + " (" +
+                          "Jurisdiction VARCHAR(16) NOT NULL, Batch INT NOT NULL, RunId VARCHAR(32) NOT NULL, " +
+                          "TenureIDs TEXT NOT NULL, Status VARCHAR(16) NOT NULL, RowsWritten INT NOT NULL DEFAULT 0, " +
+                          "Attempts INT NOT NULL DEFAULT 0, Error TEXT NULL, UpdateDate DATETIME NULL, " +
+                          "PRIMARY KEY (Jurisdiction, Batch))"))
+        if not conn.execute(text("SHOW COLUMNS FROM " + self._refresh_table() + " LIKE 'Attempts'")).fetchall():
+            # refresh tables created before batches had an attempt count (and could be abandoned)
+            conn.execute(text("ALTER TABLE " + self._refresh_table() + " MODIFY Status VARCHAR(16) NOT NULL, " +
+                              "ADD COLUMN Attempts INT NOT NULL DEFAULT 0 AFTER RowsWritten"))
+
+    def _refresh_plan(self, jurisdiction, tenure_list, resume=False):
+        """ the batches to fetch for a jurisdiction, as (batches, batches in the run, checkpointed): with resume, an
+            unfinished run recorded in the refresh table is resumed from its incomplete (pending or failed) batches,
+            otherwise a new run is recorded with every batch pending. batches abandoned after refresh_attempts
+            failures are left to the next run. if the refresh table can't be used the run is not checkpointed """
+        size = arcweb_data.BATCH_SIZE
+        plan = [(i, tenure_list[start:start + size]) for i, start in enumerate(range(0, len(tenure_list), size))]
+        try:
+            with self.db.write() as conn:
+                self._ensure_refresh_table(conn)
+                recorded = conn.execute(text("SELECT Batch, TenureIDs, Status, RunId FROM " + self._refresh_table() +
+                                             " WHERE Jurisdiction = :jurisdiction ORDER BY Batch"),
+                                        {"jurisdiction": jurisdiction}).fetchall()
+                outstanding = [(r[0], json.loads(r[1])) for r in recorded if r[2] in ("pending", "failed")]
+                if resume and outstanding:
+                    logging.info("Resuming refresh run %s of <%s> (%s) at batch %d: %d of %d batches outstanding",
+                                 recorded[0][3], self.title, jurisdiction, outstanding[0][0], len(outstanding),
+                                 len(recorded))
+                    return outstanding, len(recorded), True
+                conn.execute(text("DELETE FROM " + self._refresh_table() + " WHERE Jurisdiction = :jurisdiction"),
+                             {"jurisdiction": jurisdiction})
+                run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+                conn.execute(text("INSERT INTO " + self._refresh_table() +
+                                  " (Jurisdiction, Batch, RunId, TenureIDs, Status) VALUES " +
+                                  "(:jurisdiction, :batch, :run_id, :tenure_ids, 'pending')"),
+                             [{"jurisdiction": jurisdiction, "batch": i, "run_id": run_id,
+                               "tenure_ids": json.dumps(ids)} for i, ids in plan])
+        except exc.SQLAlchemyError as e:
+            logging.error("Unable to record the refresh run in table <%s>, continuing without checkpoints",
+                          self._refresh_table())
+            logging.error(e)
+            return plan, len(plan), False
+        return plan, len(plan), True
+
+    def _mark_batch(self, conn, jurisdiction, batch, status, rows=0, error=None):
+        """ record a batch's outcome; a batch failing for the refresh_attempts-th time is marked abandoned """
+        conn.execute(text("UPDATE " + self._refresh_table() + " SET Attempts = Attempts + 1, Status = " +
+                          "IF(:status = 'failed' AND Attempts >= :max_attempts, 'abandoned', :status), " +
+                          "RowsWritten = :rows, Error = :error, UpdateDate = NOW() " +
+                          "WHERE Jurisdiction = :jurisdiction AND Batch = :batch"),
+                     {"status": status, "rows": rows, "error": error, "jurisdiction": jurisdiction, "batch": batch,
+                      "max_attempts": self.refresh_attempts})
+
+    def _checkpoint(self, jurisdiction, batch, status, rows=0, error=None):
+        """ record the outcome of a batch in its own transaction """
+        try:
+            with self.db.write() as conn:
+                self._mark_batch(conn, jurisdiction, batch, status, rows, error)
+        except exc.SQLAlchemyError as e:
+            logging.error("Unable to checkpoint batch %d of <%s> (%s)", batch, self.title, jurisdiction)
+            logging.error(e)
+
+    def last_scheduled_update(self):
+        """ the latest occurrence of the table's UpdateSched before now """
+        return self.update_cron.schedule(datetime.now()).prev()
+
+    def incomplete_refreshes(self, since=None):
+        """ jurisdictions with a refresh run that has pending or failed batches, and that started at or after since
+            if it is given """
+        query = "SELECT DISTINCT Jurisdiction FROM " + self._refresh_table() + " WHERE Status IN ('pending', 'failed')"
+        params = {}
+        if since is not None:
+            query += " AND RunId >= :since" # run IDs are start times, %Y%m%d%H%M%S
+            params["since"] = since.strftime("%Y%m%d%H%M%S")
+        try:
+            with self.db.write() as conn:
+                self._ensure_refresh_table(conn)
+                rows = conn.execute(text(query), params).fetchall()
+        except exc.SQLAlchemyError as e:
+            logging.error("Unable to read refresh checkpoints from table <%s>", self._refresh_table())
+            logging.error(e)
+            return []
+        return [r[0] for r in rows if r[0] in self.supported_jurisdictions]
+
+    def refresh_status(self):
+        """ per-jurisdiction batch counts of the last refresh run, by status """
+        status = {}
+        try:
+            with self.db.read() as conn:
+                rows = conn.execute(text("SELECT Jurisdiction, RunId, Status, COUNT(*), SUM(RowsWritten) FROM " +
+                                         self._refresh_table() + " GROUP BY Jurisdiction, RunId, Status")).fetchall()
+        except exc.SQLAlchemyError:
+            return status # no refresh has been recorded yet
+        for jurisdiction, run_id, batch_status, count, rows_written in rows:
+            entry = status.setdefault(jurisdiction, {"run": run_id, "done": 0, "pending": 0, "failed": 0, "abandoned": 0,
+                                                     "rows": 0})
+            entry[batch_status] = count
+            entry["rows"] += int(rows_written or 0)
+        return status
+
+    def _upsert_tenures(self, jurisdiction, tenure_data, table_values, batch=None):
+        """ merge a batch of API records with the values only kept in the table (ProjectName, Comments), then prune
+            expired tenures and upsert the rest in a single transaction, which also checkpoints the batch as done if
+            it is given; returns the number of rows written, or None if the transaction failed """
 
         def mysql_replace_into(table, conn, keys, data_iter):
             """ custom to_sql method to INSERT... ON DUPLICATE KEY UPDATE... """
@@ -277,6 +812,77 @@ class ClaimTable(pygsheets.Spreadsheet):
                                                                   stmt.inserted.values())))
             conn.execute(update_stmt)
 
+        update_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        records = []
+        for t in tenure_data:
+            if t["RegTitleNumber"] not in table_values:
+                logging.warning("Received unexpected RegTitleNumber <%s> from API for table <%s>, skipping",
+                                t["RegTitleNumber"], self.title)
+                continue
+            t["ProjectName"], t["Comments"] = table_values[t["RegTitleNumber"]]
+            t["Jurisdiction"] = jurisdiction
+            t["UpdateDate"] = update_date
+            records.append(t)
+        df = pd.DataFrame(records)
+
+        # prune and upsert the batch in a single transaction
+        try:
+            with self.db.write() as conn:
+                if self.prune and not df.empty:
+                    expired = pd.to_datetime(df["NextDueDate"]) < datetime.now()
+                    if expired.any():
+                        logging.debug("Drop parcels <%s> where NextDueDate < datetime.now", \
+                                      ", ".join(df.loc[expired, "RegTitleNumber"].astype(str)))
+                        conn.execute(text("DELETE FROM " + self.title + " WHERE RegTitleNumber IN :ids") \
+                                     .bindparams(bindparam("ids", expanding=True)),
+                                     {"ids": df.loc[expired, "RegTitleNumber"].tolist()})
+                        df = df[~expired]
+                if not df.empty:
+                    df.to_sql(self.title, conn, index=False, if_exists="append", method=mysql_replace_into,
+                              chunksize=1000)
+                if batch is not None:
+                    self._mark_batch(conn, jurisdiction, batch, "done", len(df))
+        except exc.SQLAlchemyError as e:
+            logging.error("Error updating expiry dates for table <%s>", self.title)
+            logging.error(e)
+            return None
+        return len(df)
+
+    def tenure_ids(self, jurisdiction):
+        """ the RegTitleNumbers of the table's tenures in a jurisdiction """
+        with self.db.read() as conn:
+            rows = conn.execute(text("SELECT RegTitleNumber FROM " + self.title +
+                                     " WHERE Jurisdiction = :jurisdiction"), {"jurisdiction": jurisdiction}).fetchall()
+        return [str(r[0]) for r in rows]
+
+    def due_tenures(self, before, after=None):
+        """ jurisdiction -> RegTitleNumbers of the table's tenures with a NextDueDate before the given date (and not
+            before after, if given), read through the NextDueDate index """
+        query = "SELECT Jurisdiction, RegTitleNumber FROM " + self.title + " WHERE NextDueDate < :before"
+        params = {"before": before}
+        if after is not None:
+            query += " AND NextDueDate >= :after"
+            params["after"] = after
+        tenures = {}
+        with self.db.read() as conn:
+            for jurisdiction, tenure_id in conn.execute(text(query), params):
+                if jurisdiction:
+                    tenures.setdefault(jurisdiction, []).append(str(tenure_id))
+        return tenures
+
+    @tracing.traced("update")
+    def update(self, inTable: TableDefinition, jurisdiction: str, RegTitleNumber=None, progress=None, resume=False,
+               fetch=None, max_age=None):
+        """ update the tenure information by polling the appropriate ArcGIS REST API (see arcweb_data.py); batches are
+            upserted as they arrive while the next batch is fetched, and progress is published per batch in
+            self.update_progress and to the optional progress(jurisdiction, batches_done, batches_total, rows)
+            callback. full refreshes are checkpointed batch by batch in the refresh table: a batch that fails is
+            recorded and skipped, and with resume=True an unfinished run is resumed from its incomplete batches
+            instead of starting a new run (see Scheduler's retry pass).
+            RegTitleNumber (one ID or a list of IDs) limits the update to those tenures. fetch replaces the
+            jurisdiction's fetch(batches) with another source of (batch, records, error), see shared_refresh, and
+            max_age (seconds) shortens how old the tenures served from the tenure cache can be. returns the tenure IDs
+            of the batches that failed """
         if jurisdiction in self.supported_jurisdictions:
             data_func = self.supported_jurisdictions[jurisdiction]
         else:
@@ -290,167 +896,311 @@ class ClaimTable(pygsheets.Spreadsheet):
             inTable.jurisdictionCol = "Jurisdiction"
 
         rows = []
-        self.conn_lock.acquire()
+        query = "SELECT " + inTable.keyCol + ", ProjectName, Comments FROM " + inTable.name + \
+                " WHERE " + inTable.jurisdictionCol + " = :jurisdiction"
+        params = {"jurisdiction": jurisdiction}
+        statement = text(query)
+        if RegTitleNumber:
+            if isinstance(RegTitleNumber, (str, int)):
+                RegTitleNumber = [RegTitleNumber]
+            statement = text(query + " AND " + inTable.keyCol + " IN :RegTitleNumber").bindparams(
+                bindparam("RegTitleNumber", expanding=True))
+            params["RegTitleNumber"] = [str(t) for t in RegTitleNumber]
         try:
-            with self.engine.connect() as conn:
-                if not RegTitleNumber:
-                    result = conn.execute(text("SELECT " + inTable.keyCol + ", ProjectName, Comments FROM " + inTable.name + \
-                        " WHERE " + inTable.jurisdictionCol + "=\"" + jurisdiction + "\""))
-                else:
-                    result = conn.execute(text("SELECT " + inTable.keyCol + ", ProjectName, Comments FROM " + inTable.name + \
-                        " WHERE " + inTable.jurisdictionCol + "=\"" + jurisdiction + "\" AND RegTitleNumber=\"" + \
-                        str(RegTitleNumber) + "\""))
-                rows = result.fetchall()
+            with metrics.timer(metrics.update_phase_seconds, table=self.title, jurisdiction=jurisdiction,
+                               phase="select"), self.db.read() as conn:
+                rows = conn.execute(statement, params).fetchall()
         except exc.SQLAlchemyError as e:
             logging.error("Error retrieving tenure data from table <%s>", self.title)
             logging.error(e)
-        finally:
-            self.conn_lock.release()
+            return params.get("RegTitleNumber", [])
 
         # if the list is empty, do not pass go
         if not rows:
-            return
+            return []
 
-        tenure_list = []
-        project_list = []
-        comment_list = []
-        for r in rows:
-            tenure_list.append(r[0])
-            project_list.append(r[1])
-            comment_list.append(r[2])
+        tenure_list = sorted(r[0] for r in rows) # a stable order gives stable batches (see response_cache.py)
+        table_values = {r[0]: (r[1], r[2]) for r in rows} # RegTitleNumber -> (ProjectName, Comments)
 
         # TODO: pop this next bit of code out (minus SQL) as a class method for use outside of a Claimtable object
-        tenure_data = data_func(tenure_list)
-
-        for t in tenure_data:
-            try:
-                idx = tenure_list.index(t["RegTitleNumber"])
-            except ValueError:
-                logging.warning("Received unexpected RegTitleNumber <%s> from API for table <%s>, skipping",
-                                t["RegTitleNumber"], self.title)
+        if RegTitleNumber:
+            # targeted fetches (a few tenures, see Scheduler.run) are not checkpointed
+            size = arcweb_data.BATCH_SIZE
+            plan = [(i, tenure_list[start:start + size]) for i, start in enumerate(range(0, len(tenure_list), size))]
+            batches_total, checkpointed = len(plan), False
+        else:
+            with metrics.timer(metrics.update_phase_seconds, table=self.title, jurisdiction=jurisdiction,
+                               phase="plan"):
+                plan, batches_total, checkpointed = self._refresh_plan(jurisdiction, tenure_list, resume)
+        self.update_progress = {
+            "jurisdiction": jurisdiction,
+            "batches_done": batches_total - len(plan),
+            "batches_failed": 0,
+            "batches_total": batches_total,
+            "rows": 0,
+            "started": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "finished": None
+        }
+        if fetch is None:
+            # with geometry enabled the tenure cache is always written, its ChangedAt dates drive geometry refetches
+            fetch = tenure_cache.read_through(self.db, jurisdiction, data_func.fetch, max_age) \
+                    if tenure_cache.max_age or geometry_cache.enabled else data_func.fetch
+        batch_ids = dict(plan) # batch -> tenure IDs, to report the IDs of failed batches
+        failed = []
+        fetched = arcweb_data.prefetch(fetch(plan))
+        while True:
+            # fetch is the time spent waiting on the ArcGIS batches that the prefetch thread hasn't delivered yet
+            with metrics.timer(metrics.update_phase_seconds, table=self.title, jurisdiction=jurisdiction,
+                               phase="fetch"):
+                item = next(fetched, None)
+            if item is None:
+                break
+            batch, tenure_data, error = item
+            rows_written = None
+            if error is not None:
+                logging.error("Failed to retrieve batch %d of %d for <%s> (%s)", batch + 1, batches_total, self.title,
+                              jurisdiction)
+                logging.error(error)
+            else:
+                with metrics.timer(metrics.update_phase_seconds, table=self.title, jurisdiction=jurisdiction,
+                                   phase="upsert"):
+                    rows_written = self._upsert_tenures(jurisdiction, tenure_data, table_values,
+                                                        batch if checkpointed else None)
+            if rows_written is None:
+                failed += batch_ids.get(batch, [])
+                self.update_progress["batches_failed"] += 1
+                if checkpointed:
+                    self._checkpoint(jurisdiction, batch, "failed", error=str(error) if error else "database error")
                 continue
+            self.update_progress["batches_done"] += 1
+            self.update_progress["rows"] += rows_written
+            metrics.update_rows.inc(rows_written, table=self.title, jurisdiction=jurisdiction)
+            logging.debug("Updated batch %d of %d for <%s> (%s): %d rows", batch + 1, batches_total, self.title,
+                          jurisdiction, rows_written)
+            if progress:
+                progress(jurisdiction, self.update_progress["batches_done"], batches_total,
+                         self.update_progress["rows"])
+        if geometry_cache.enabled:
+            with metrics.timer(metrics.update_phase_seconds, table=self.title, jurisdiction=jurisdiction,
+                               phase="geometry"):
+                geometry_cache.refresh(self.db, jurisdiction, tenure_list)
+        self.update_progress["finished"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.update_progress["batches_failed"]:
+            logging.warning("Refresh of <%s> (%s) left %d of %d batches failed", self.title, jurisdiction,
+                            self.update_progress["batches_failed"], batches_total)
+        return failed
 
-            t["ProjectName"] = project_list[idx]
-            t["Jurisdiction"] = jurisdiction
-            t["Comments"] = comment_list[idx]
-            t["UpdateDate"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            df = pd.DataFrame([t])
-
-            self.conn_lock.acquire()
-            try:
-                with self.engine.connect() as conn:
-                    if self.prune:
-                        for index, row in df.iterrows():
-                            if row["NextDueDate"] < datetime.now():
-                                logging.debug("Drop parcel <%s> where NextDueDate < datetime.now", \
-                                              row["RegTitleNumber"])
-                                conn.execute(text("DELETE FROM " + self.title + " WHERE RegTitleNumber=\"" + \
-                                             row["RegTitleNumber"] + "\""))
-                                df = df.drop(index)
-                    if not df.empty:
-                        df.to_sql(self.title, conn, index=False, if_exists="append", method=mysql_replace_into)
-            except exc.SQLAlchemyError as e:
-                logging.error("Error updating expiry dates for table <%s>", self.title)
-                logging.error(e)
-            finally:
-                self.conn_lock.release()
+    def _ordered(self, df):
+        """ re-order dataframe columns to match the primary worksheet """
+        return df[self.column_order + [c for c in df.columns if c not in self.column_order]]
 
     def modify_parcel(self, df_before, df_after):
-        """ modify a row in the claimtable """
-        cell = self.sheet1.find(str(df_before.to_dict()["RegTitleNumber"][0]))
-        address = (cell[0].address[0], 0)
-        # re-order columns
-        df_after = df_after[self.column_order + [c for c in df_after.columns if c not in self.column_order]]
-        self._write_dataframe(self.sheet1, df_after, start=address, fit=False, copy_head=False)
+        """ modify rows in the claimtable; row i of df_before is replaced by row i of df_after, and all of the rows are
+            addressed through the row index and written in a single batch update """
+        df_after = self._ordered(df_after)
+        values = sheets.dataframe_values(df_after, header=False)
+        ranges = []
+        batch = []
+        with self.row_index_lock:
+            for before, after, row_values in zip(df_before["RegTitleNumber"].astype(str),
+                                                 df_after["RegTitleNumber"].astype(str), values):
+                row = self.row_index.get(before)
+                if row is None:
+                    logging.warning("RegTitleNumber <%s> not found on the worksheet for <%s>, skipping", before,
+                                    self.title)
+                    continue
+                ranges.append(((row, 1), (row, len(row_values))))
+                batch.append([row_values])
+                if after != before:
+                    del self.row_index[before]
+                    self.row_index[after] = row
+        if ranges:
+            with self._sheets_call("update_values_batch"):
+                self.sheet1.update_values_batch(ranges, batch)
 
     def del_parcel(self, df):
-        """ delete a row in the claimtable """
-        row = self.sheet1.find(str(df.to_dict()["RegTitleNumber"][0]))[0].row
-        self.sheet1.delete_rows(row)
+        """ delete rows from the claimtable; contiguous rows are deleted together, bottom-up so that row numbers
+            remain valid, in a single batch request """
+        with self.row_index_lock:
+            rows = sorted({self.row_index[t] for t in df["RegTitleNumber"].astype(str) if t in self.row_index})
+            if not rows:
+                return
+            runs = [] # (first row, number of rows)
+            for row in rows:
+                if runs and runs[-1][0] + runs[-1][1] == row:
+                    runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+                else:
+                    runs.append((row, 1))
+            requests = [{"deleteDimension": {"range": {"sheetId": self.sheet1.id, "dimension": "ROWS",
+                                                       "startIndex": first - 1, "endIndex": first - 1 + number}}}
+                        for first, number in reversed(runs)]
+            with self._sheets_call("batch_update"):
+                self.client.sheet.batch_update(self.id, requests)
+            self.sheet1.jsonSheet["properties"]["gridProperties"]["rowCount"] = self.sheet1.rows - len(rows)
+            # shift every remaining row up by the number of deleted rows above it
+            deleted = set(rows)
+            self.row_index = {t: r - bisect_left(rows, r) for t, r in self.row_index.items() if r not in deleted}
 
     def add_parcel(self, df):
-        """ add a row to the claimtable """
-        df = df[self.column_order + [c for c in df.columns if c not in self.column_order]]
-        self.sheet1.append_table(df.values.tolist(), start="A1", end=None, dimension="ROWS", overwrite=False)
+        """ add rows to the end of the claimtable in a single append """
+        df = self._ordered(df)
+        values = sheets.dataframe_values(df, header=False)
+        if not values:
+            return
+        with self.row_index_lock:
+            with self._sheets_call("append_table"):
+                response = self.sheet1.append_table(values, start="A1", end=None, dimension="ROWS", overwrite=False)
+            first = response["updates"]["updatedRange"].start[0]
+            self.row_index.update(zip(df["RegTitleNumber"].astype(str), range(first, first + len(values))))
 
+    @tracing.traced("bulk_sync")
     def bulk_sync(self):
-        """ pulls the current SQL table and pushes the whole thing to GSheets in one call """
-        df = pd.DataFrame()
-
-        self.conn_lock.acquire()
+        """ pulls the current SQL table and pushes the whole thing to GSheets, one chunk at a time """
         try:
-            with self.engine.connect() as conn:
-                query = "SELECT * FROM " + self.title
-                df = pd.read_sql(text(query), con=conn)
+            with metrics.timer(metrics.bulk_sync_seconds, table=self.title):
+                self._stream_table(self.sheet1, self.title, self.column_order, index=True)
         except exc.SQLAlchemyError as e:
             logging.error("Database read failed during bulk sync for <%s>", self.title)
             logging.error(e)
-            return
-        finally:
-            self.conn_lock.release()
-
-        if not df.empty:
-            df = df[self.column_order + [c for c in df.columns if c not in self.column_order]]
-            self._write_dataframe(self.sheet1, df)
 
+    @tracing.traced("load")
     def load(self):
         """ update expiry dates, load MySQL table into ClaimTable object, run compaction, link with cloud """
-        df = pd.DataFrame()
         # load MySQL table into first worksheet
-        self.conn_lock.acquire()
         try:
-            with self.engine.connect() as conn:
-                query = "SELECT * FROM " + self.title
-                df = pd.read_sql(text(query), con=conn)
+            self._stream_table(self.sheet1, self.title, self.column_order, index=True)
         except exc.SQLAlchemyError as e:
             logging.critical("FATAL: unable to read table <%s> into dataframe", self.title)
             logging.critical(e)
             sys.exit(1)
-        finally:
-            self.conn_lock.release()
-
-        # re-order columns
-        df = df[self.column_order + [c for c in df.columns if c not in self.column_order]]
-        self._write_dataframe(self.sheet1, df)
         self.sheet1.frozen_rows = 1
         self.sheet1.link()
 
         self.compaction()
 
+    @tracing.traced("compaction")
     def compaction(self):
         """ a sort function to group tenures that match in both name and expiry date - in many jurisdictions tenures are
             of a fixed size and are numbered sequentially, and can be lumped together for better legibility """
+        with metrics.timer(metrics.compaction_seconds, table=self.title):
+            self._compaction()
+
+    def _compaction(self):
         if self.compact:
             logging.info("Performing tenure compaction on table <%s>", self.title)
-            if self.compact_wks is not None:
-                self.del_worksheet(self.compact_wks)
-            self.compact_wks = self.add_worksheet(self.title + self.suffix["compact"])
-            df = pd.DataFrame()
+            with self._sheets_call("replace_worksheet"):
+                if self.compact_wks is not None:
+                    self.del_worksheet(self.compact_wks)
+                self.compact_wks = self.add_worksheet(self.title + self.suffix["compact"])
             with open("compaction_new.sql", "r") as file:
                 query = file.read()
                 query = query.replace("<!TableName>", self.title)
                 query = query.replace("<!Suffix>", self.suffix["compact"])
 
-            self.conn_lock.acquire()
             try:
-                with self.engine.connect() as conn:
+                with self.db.write() as conn:
                     conn.execute(text("DROP TABLE IF EXISTS " + self.title + self.suffix["compact"]))
                     query = query.split(";")
                     for q in query:
                         conn.execute(text(q))
-                    df = pd.read_sql(text("SELECT * FROM " + self.title + self.suffix["compact"]), con=conn)
             except exc.SQLAlchemyError as e:
                 logging.error("Unable to generate table compaction for <%s>", self.title)
                 logging.error(e)
+                return
             finally:
-                self.conn_lock.release()
+                schema_catalog.refresh(self.title + self.suffix["compact"])
 
             # drop and re-order google sheet
             try:
-                df = df.drop(columns=["TitleNumberDistance"])
-                df = df[self.compact_order + [c for c in df.columns if c not in self.compact_order]]
-                self._write_dataframe(self.compact_wks, df)
+                self._stream_table(self.compact_wks, self.title + self.suffix["compact"], self.compact_order,
+                                   drop_columns=["TitleNumberDistance"])
                 self.compact_wks.frozen_rows = 1
             except Exception as e:
                 logging.error("Unable to update compaction worksheet for <%s>", self.title)
                 logging.error(e)
+
+@tracing.traced("shared_refresh")
+def shared_refresh(tables, jurisdiction, resume=False):
+    """ refresh a jurisdiction in several claimtables at once: every table records (or, with resume, resumes) its
+        refresh run, the distinct tenures of the batches the runs still need are fetched from ArcGIS once, and each
+        table's update, in its own thread, upserts its batches as soon as all of their tenures have arrived. only the
+        records of table batches still waiting for tenures are held in memory. a tenure whose batch failed fails the
+        batches containing it in every table, which are checkpointed and retried as usual """
+    plans = {} # table -> outstanding [(batch, tenure IDs)] of its run
+    for table in tables:
+        try:
+            tenure_list = sorted(table.tenure_ids(jurisdiction))
+        except exc.SQLAlchemyError as e:
+            logging.error("Error retrieving tenure data from table <%s>", table.title)
+            logging.error(e)
+            continue
+        if tenure_list:
+            plans[table] = table._refresh_plan(jurisdiction, tenure_list, resume)[0]
+            metrics.shared_refresh_tenures.inc(sum(len(ids) for _, ids in plans[table]), jurisdiction=jurisdiction,
+                                               kind="requested")
+    # the tables' batches round-robin, so that every table gets its first batches early
+    needs = {} # RegTitleNumber -> [(table, batch)] waiting for it
+    remaining = {} # (table, batch) -> tenure IDs not fetched yet
+    for i in range(max((len(p) for p in plans.values()), default=0)):
+        for table, table_plan in plans.items():
+            if i < len(table_plan):
+                batch, ids = table_plan[i]
+                remaining[(table, batch)] = set(ids)
+                for t in ids:
+                    needs.setdefault(t, []).append((table, batch))
+    if not needs:
+        return
+    wanted = list(needs) # in the order the table batches need them
+    metrics.shared_refresh_tenures.inc(len(wanted), jurisdiction=jurisdiction, kind="fetched")
+    logging.info("Fetching %d distinct tenures (%s) for %d tables", len(wanted), jurisdiction, len(plans))
+
+    size = arcweb_data.BATCH_SIZE
+    plan = [(i, wanted[start:start + size]) for i, start in enumerate(range(0, len(wanted), size))]
+    fetch = arcweb_data.jurisdictions[jurisdiction].fetch
+    if tenure_cache.max_age or geometry_cache.enabled:
+        fetch = tenure_cache.read_through(next(iter(plans)).db, jurisdiction, fetch)
+
+    queues = {table: queue.Queue() for table in plans}
+    failures = []
+    span = tracing.tracer.current()
+
+    def run(table):
+        tracing.tracer.attach(span)
+        try:
+            # the run was recorded above, so update resumes it and takes its batches from the queue
+            table.update(TableDefinition(), jurisdiction, resume=True, fetch=lambda batches: iter(queues[table].get,
+                                                                                                   None))
+        except exc.SQLAlchemyError as e:
+            failures.append(e)
+        except Exception as e:
+            logging.error("Refresh of <%s> (%s) failed", table.title, jurisdiction)
+            logging.error(e)
+
+    threads = [Thread(target=run, args=(table,), daemon=True) for table in plans]
+    for thread in threads:
+        thread.start()
+    collected = {} # (table, batch) -> records received so far
+    errors = {} # (table, batch) -> error of a batch of tenures it needed
+    try:
+        for batch, tenure_data, error in fetch(plan):
+            records = {str(r["RegTitleNumber"]): r for r in tenure_data} if error is None else {}
+            for t in plan[batch][1]:
+                for key in needs.pop(t, ()):
+                    if error is not None:
+                        errors.setdefault(key, error)
+                    elif t in records:
+                        collected.setdefault(key, []).append(dict(records[t]))
+                    remaining[key].discard(t)
+                    if not remaining[key]: # every tenure of the table's batch is in
+                        del remaining[key]
+                        table, table_batch = key
+                        failed = errors.pop(key, None)
+                        received = collected.pop(key, [])
+                        queues[table].put((table_batch, received if failed is None else None, failed))
+    finally:
+        for q in queues.values():
+            q.put(None)
+        for thread in threads:
+            thread.join()
+    if failures:
+        raise failures[0]
@@ -0,0 +1,172 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+import logging
+import sqlalchemy
+import urllib
+from contextlib import contextmanager
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+from threading import Lock
+from time import perf_counter
+import metrics
+from sqlalchemy import event
+from tracing import tracer
+
+class DbDefinition:
+    """ connection settings, and the engine URL for the selected connector: "pyodbc" goes through the ODBC driver,
+        while "mysqlclient" and "pymysql" are native drivers with server-side cursors (see Database.read) and
+        batched executemany """
+    # connector -> SQLAlchemy dialect+driver
+    connectors = {
+        "pyodbc": "mysql+pyodbc",
+        "mysqlclient": "mysql+mysqldb",
+        "pymysql": "mysql+pymysql"
+    }
+    user = ""
+    password = ""
+    address = ""
+    trusted_conn = False
+    connector = "pyodbc"
+    driver = "{MySQL ODBC 9.2 Unicode Driver}" # ODBC driver name for the pyodbc connector, modify as neccessary
+    database = ""
+    port = "3306" # default port
+
+    def connection_string(self):
+        if self.connector not in self.connectors:
+            raise NotImplementedError("unsupported database connector <" + self.connector + ">")
+        if self.connector != "pyodbc":
+            return "{}://{}:{}@{}:{}/{}?charset=utf8mb4".format(self.connectors[self.connector],
+                                                              urllib.parse.quote_plus(self.user),
+                                                              urllib.parse.quote_plus(self.password),
+                                                              self.address, self.port, self.database)
+        if self.trusted_conn:
+            params = urllib.parse.quote_plus("DRIVER=" + self.driver + ";" +
+                                             "SERVER=" + self.address + ";" +
+                                             "PORT=" + self.port + ";" +
+                                             "DATABASE=" + self.database + ";" +
+                                             "Trusted_Connection=yes")
+            return "mysql+pyodbc:///?odbc_connect={}".format(params)
+        else:
+            params = urllib.parse.quote_plus("DRIVER=" + self.driver + ";" +
+                                             "SERVER=" + self.address + ";" +
+                                             "PORT=" + self.port + ";" +
+                                             "DATABASE=" + self.database + ";" +
+                                             "UID=" + self.user + ";" +
+                                             "PWD=" + self.password)
+        return "mysql+pyodbc:///?odbc_connect={}".format(params)
+
+    def connect_args(self, timeout=10):
+        """ DBAPI connect() arguments; the connection timeout keyword differs between drivers """
+        if self.connector == "pyodbc":
+            return {"timeout": timeout}
+        return {"connect_timeout": timeout}
+
+class Database:
+    """ the database access layer shared by all claimtables: one tuned connection pool, read connections that run
+        alongside writers (InnoDB gives each statement a consistent snapshot, so readers don't need to queue behind
+        writes), and transaction-scoped write connections that commit on success and roll back on error. checkout
+        counts and pool wait times are tracked so the pool can be sized for the number of tables """
+    def __init__(self, url, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=3600, connect_args=None):
+        # multi-row INSERTs are sent in pages of insertmanyvalues_page_size rows rather than one row per statement
+        self.engine = sqlalchemy.create_engine(url, poolclass=QueuePool, pool_size=pool_size,
+                                               max_overflow=max_overflow, pool_timeout=pool_timeout,
+                                               pool_recycle=pool_recycle, pool_pre_ping=True,
+                                               insertmanyvalues_page_size=1000,
+                                               connect_args=connect_args or {})
+        # statement execution time is accounted to the open tracing spans (see tracing.py)
+        event.listen(self.engine, "before_cursor_execute", self._before_execute)
+        event.listen(self.engine, "after_cursor_execute", self._after_execute)
+        # pyodbc buffers every result set on the client, the native drivers can stream rows from the server
+        self.server_side_cursors = self.engine.dialect.supports_server_side_cursors
+        self._stats_lock = Lock()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._trace_start = perf_counter()
+
+    @staticmethod
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_trace_start", None)
+        if start is not None:
+            tracer.account("db", perf_counter() - start)
+
+    def _checkout(self):
+        """ check a connection out of the pool, recording how long the caller waited for it """
+        start = perf_counter()
+        try:
+            conn = self.engine.connect()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self._timeouts += 1
+            metrics.db_pool_timeouts.inc()
+            logging.warning("Timed out waiting for a database connection, pool status: %s", self.engine.pool.status())
+            raise
+        wait = perf_counter() - start
+        metrics.db_pool_wait_seconds.observe(wait)
+        with self._stats_lock:
+            self._checkouts += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        return conn
+
+    @contextmanager
+    def read(self, stream=False):
+        """ a pooled connection for SELECT statements; anything left uncommitted is rolled back on return. with
+            stream=True results are fetched through a server-side cursor where the driver supports it """
+        conn = self._checkout()
+        try:
+            if stream and self.server_side_cursors:
+                conn = conn.execution_options(stream_results=True)
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def write(self):
+        """ a pooled connection inside a transaction, committed when the block exits cleanly """
+        conn = self._checkout()
+        try:
+            with conn.begin():
+                yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        """ pool occupancy and checkout metrics """
+        pool = self.engine.pool
+        with self._stats_lock:
+            checkouts = self._checkouts
+            wait_total = self._wait_total
+            wait_max = self._wait_max
+            timeouts = self._timeouts
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_total_s": round(wait_total, 6),
+            "wait_max_s": round(wait_max, 6),
+            "wait_avg_s": round(wait_total / checkouts, 6) if checkouts else 0.0
+        }
+
+    def dispose(self):
+        self.engine.dispose()
@@ -0,0 +1,140 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Health tracking for the ArcGIS servers queried by arcweb_data.py: a circuit breaker and a latency histogram per host.
+# A breaker opens after a number of consecutive failed requests, and while it is open requests to that host fail
+# immediately with CircuitOpen instead of waiting out timeouts and retries. Once the reset timeout has passed a single
+# probe request is let through; success closes the breaker, failure keeps it open for another timeout.
+from bisect import bisect_left
+from threading import Lock
+from time import time
+
+class CircuitOpen(Exception):
+    """ raised instead of making a request to a host whose circuit breaker is open """
+    pass
+
+class LatencyHistogram:
+    """ cumulative histogram of request durations in seconds """
+    buckets = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, buckets=None):
+        if buckets:
+            self.buckets = tuple(buckets)
+        self._lock = Lock()
+        self._counts = [0] * (len(self.buckets) + 1) # the last slot counts observations above the largest bucket
+        self._sum = 0.0
+
+    def observe(self, seconds):
+        with self._lock:
+            self._counts[bisect_left(self.buckets, seconds)] += 1
+            self._sum += seconds
+
+    def snapshot(self):
+        """ cumulative counts per upper bound ("+Inf" last), with the total count and sum """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip([str(b) for b in self.buckets] + ["+Inf"], counts):
+            running += count
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "count": running, "sum": round(total, 6)}
+
+class CircuitBreaker:
+    """ closed -> open after failure_threshold consecutive failures -> half-open (one probe) after reset_timeout """
+    def __init__(self, host, failure_threshold=3, reset_timeout=300):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency = LatencyHistogram()
+        self._lock = Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._last_error = None
+        self._trips = 0
+
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or time() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        """ check before a request: raises CircuitOpen while the breaker is open, and lets one probe through once
+            the reset timeout has passed """
+        with self._lock:
+            state = self._state()
+            if state == "open":
+                raise CircuitOpen("circuit open for <%s> after %d consecutive failures" % (self.host, self._failures))
+            if state == "half-open":
+                self._probing = True
+
+    def success(self, seconds=None):
+        if seconds is not None:
+            self.latency.observe(seconds)
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self, error=None, seconds=None):
+        """ record a failed request; returns True if the breaker is (now) open """
+        if seconds is not None:
+            self.latency.observe(seconds)
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error) if error is not None else None
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    self._trips += 1
+                self._opened_at = time()
+            self._probing = False
+            return self._opened_at is not None
+
+    def status(self):
+        with self._lock:
+            status = {
+                "state": self._state(),
+                "consecutive_failures": self._failures,
+                "trips": self._trips,
+                "opened_at": self._opened_at,
+                "last_error": self._last_error
+            }
+        status["latency"] = self.latency.snapshot()
+        return status
+
+class BreakerRegistry:
+    """ one circuit breaker per host, created on first use """
+    def __init__(self, failure_threshold=3, reset_timeout=300):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = Lock()
+        self._breakers = {}
+
+    def get(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._breakers.values()))
@@ -0,0 +1,179 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# In-process metrics (counters, gauges and latency histograms, labeled by table, jurisdiction, etc.) for the hot paths
+# of the application, rendered in the Prometheus text exposition format by the /metrics route. Nothing is pushed
+# anywhere: the endpoint can be scraped by a Prometheus server or simply read with curl.
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from health import LatencyHistogram
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (n, _escape(v)) for n, v in pairs) + "}"
+
+class Metric:
+    """ a metric family: one value per combination of label values """
+    kind = "untyped"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = Lock()
+        self._children = {}
+        registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError("metric <%s> takes labels %s" % (self.name, self.labels))
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.description), "# TYPE %s %s" % (self.name, self.kind)]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, value in children:
+            lines += self._render_child(key, value)
+        return lines
+
+    def _render_child(self, key, value):
+        return ["%s%s %s" % (self.name, _labels(self.labels, key), _number(value))]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=None):
+        Metric.__init__(self, name, description, labels)
+        self.buckets = buckets
+
+    def observe(self, seconds, **labels):
+        key = self._key(labels)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = LatencyHistogram(self.buckets)
+        child.observe(seconds)
+
+    def _render_child(self, key, value):
+        snapshot = value.snapshot()
+        lines = ["%s_bucket%s %d" % (self.name, _labels(self.labels, key, ("le", bound)), count)
+                 for bound, count in snapshot["buckets"]]
+        lines.append("%s_sum%s %s" % (self.name, _labels(self.labels, key), _number(snapshot["sum"])))
+        lines.append("%s_count%s %d" % (self.name, _labels(self.labels, key), snapshot["count"]))
+        return lines
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+@contextmanager
+def timer(histogram, counter=None, **labels):
+    """ time a block into a histogram; with a counter, also count the block by outcome ("ok" or "error") """
+    start = perf_counter()
+    try:
+        yield
+    except BaseException:
+        if counter is not None:
+            counter.inc(outcome="error", **labels)
+        raise
+    finally:
+        histogram.observe(perf_counter() - start, **labels)
+    if counter is not None:
+        counter.inc(outcome="ok", **labels)
+
+def render():
+    """ every metric in the Prometheus text exposition format """
+    lines = []
+    for metric in registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+registry = []
+
+# ArcGIS REST queries (arcweb_data.py)
+arcgis_requests = Counter("claimtracker_arcgis_requests_total", "ArcGIS query requests by host and outcome",
+                          ["host", "outcome"])
+arcgis_request_seconds = Histogram("claimtracker_arcgis_request_seconds", "ArcGIS query request duration", ["host"])
+arcgis_response_bytes = Counter("claimtracker_arcgis_response_bytes_total", "ArcGIS query response bytes as "
+                                "transferred (after compression), by host and format (json or pbf)", ["host", "format"])
+arcgis_decode_seconds = Histogram("claimtracker_arcgis_decode_seconds", "time decoding ArcGIS query responses, by "
+                                  "host and format", ["host", "format"])
+arcgis_batches = Counter("claimtracker_arcgis_batches_total", "tenure batches fetched by jurisdiction and outcome",
+                         ["jurisdiction", "outcome"])
+arcgis_batch_seconds = Histogram("claimtracker_arcgis_batch_seconds",
+                                 "time to fetch and normalize a tenure batch, including retries", ["jurisdiction"])
+arcgis_snapshots = Counter("claimtracker_arcgis_snapshots_total", "whole-layer snapshots used in place of keyed "
+                           "queries, by jurisdiction", ["jurisdiction"])
+
+# claimtable refreshes, synchronization and compaction (claimtable.py)
+update_phase_seconds = Histogram("claimtracker_update_phase_seconds",
+                                 "ClaimTable.update time by phase (select, plan, fetch wait, upsert, geometry)",
+                                 ["table", "jurisdiction", "phase"])
+update_rows = Counter("claimtracker_update_rows_total", "rows upserted by ClaimTable.update", ["table", "jurisdiction"])
+shared_refresh_tenures = Counter("claimtracker_shared_refresh_tenures_total", "tenures in shared refreshes, requested "
+                                 "by all the tables and fetched once", ["jurisdiction", "kind"])
+tenure_cache_tenures = Counter("claimtracker_tenure_cache_tenures_total", "tenures looked up in the shared tenure "
+                               "cache, by outcome (hit or miss)", ["jurisdiction", "outcome"])
+tier_refresh_tenures = Counter("claimtracker_tier_refresh_tenures_total", "tenures refreshed between full updates "
+                               "because of their NextDueDate, by refresh tier", ["table", "tier"])
+tenure_geometries = Counter("claimtracker_tenure_geometries_total", "tenure polygons checked against the geometry "
+                            "cache, by outcome (fresh, fetched, missing or failed)", ["jurisdiction", "outcome"])
+sync_seconds = Histogram("claimtracker_sync_seconds", "time streaming a SQL table to a worksheet, by phase (read, "
+                         "write)", ["table", "phase"])
+bulk_sync_seconds = Histogram("claimtracker_bulk_sync_seconds", "ClaimTable.bulk_sync duration", ["table"])
+compaction_seconds = Histogram("claimtracker_compaction_seconds", "ClaimTable.compaction duration", ["table"])
+sheets_api_calls = Counter("claimtracker_sheets_api_calls_total", "Google Sheets API calls by call and outcome",
+                           ["table", "call", "outcome"])
+sheets_api_seconds = Histogram("claimtracker_sheets_api_seconds", "Google Sheets API call duration", ["table", "call"])
+
+# database connection pool (database.py)
+db_pool_wait_seconds = Histogram("claimtracker_db_pool_wait_seconds", "time waiting to check a connection out of "
+                                 "the pool", buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+db_pool_timeouts = Counter("claimtracker_db_pool_timeouts_total", "pool checkouts that timed out")
+db_pool_checked_out = Gauge("claimtracker_db_pool_checked_out", "connections currently checked out of the pool")
+
+# scheduler (scheduler.py)
+binlog_lag_seconds = Gauge("claimtracker_binlog_lag_seconds", "age of the last binlog event when it was read")
+binlog_events = Counter("claimtracker_binlog_events_total", "binlog events read, by table and event type",
+                        ["table", "event"])
+scheduler_pending_syncs = Gauge("claimtracker_scheduler_pending_syncs", "tables waiting for a bulk synchronization")
+email_seconds = Histogram("claimtracker_email_seconds", "time preparing and sending a table's expiry email",
+                          ["table"])
@@ -0,0 +1,173 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Decoder for the protocol buffer (f=pbf) responses of ArcGIS FeatureServer queries, Esri's FeatureCollection
+# format (esriPBuffer.FeatureCollectionPBuffer). Only the parts arcweb_data.py asks for are decoded: feature
+# attributes (no geometry), the exceededTransferLimit flag, counts and object IDs. The result has the shape of the
+# f=json response, so callers don't need to know which format was requested.
+#
+# The wire format is read directly rather than through the protobuf package, which would need the .proto schema
+# compiled into the application.
+import struct
+
+# FeatureCollectionPBuffer: 2 = queryResult; QueryResult: 1 = featureResult, 2 = countResult, 3 = idsResult
+# FeatureResult: 1 = objectIdFieldName, 9 = exceededTransferLimit, 13 = fields, 15 = features
+# Field: 1 = name; Feature: 1 = attributes (Value); CountResult: 1 = count
+# ObjectIdsResult: 1 = objectIdFieldName, 3 = objectIds (packed uint64)
+# Value: 1 string, 2 float, 3 double, 4 sint32, 5 uint32, 6 int64, 7 uint64, 8 sint64, 9 bool
+
+class Unsupported(ValueError):
+    """ the server didn't answer an f=pbf query with a protocol buffer """
+
+_float = struct.Struct("<f").unpack_from
+_double = struct.Struct("<d").unpack_from
+
+def _varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+def _fields(buf, pos, end):
+    """ the fields of the message in buf[pos:end] as (number, wire type, value); length-delimited values are
+        (start, end) offsets into buf, fixed-size ones the offset of their bytes """
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        wire = key & 7
+        if wire == 0:
+            value, pos = _varint(buf, pos)
+        elif wire == 2:
+            length, pos = _varint(buf, pos)
+            value = (pos, pos + length)
+            pos += length
+        elif wire == 1:
+            value = pos
+            pos += 8
+        elif wire == 5:
+            value = pos
+            pos += 4
+        else:
+            raise ValueError("unsupported protobuf wire type %d" % wire)
+        yield key >> 3, wire, value
+    if pos != end:
+        raise ValueError("truncated protobuf message")
+
+def _string(buf, span):
+    return buf[span[0]:span[1]].decode("utf-8")
+
+def _value(buf, start, end):
+    """ an esriPBuffer Value, None when no member is set """
+    for number, wire, value in _fields(buf, start, end):
+        if number == 1:
+            return _string(buf, value)
+        if number == 2:
+            return _float(buf, value)[0]
+        if number == 3:
+            return _double(buf, value)[0]
+        if number in (4, 8): # zigzag
+            return (value >> 1) ^ -(value & 1)
+        if number == 6: # two's complement
+            return value - (1 << 64) if value >= 1 << 63 else value
+        if number == 9:
+            return bool(value)
+        return value
+    return None
+
+def _attributes(buf, pos, end):
+    """ the attribute values of a Feature; the common case of one-byte keys and lengths (every Value member set,
+        strings under 128 bytes) is decoded inline, anything else through _value """
+    values = []
+    append = values.append
+    while pos < end:
+        key = buf[pos]
+        if key != 0x0a: # not attributes (1, length-delimited): geometry, centroid
+            for number, wire, value in _fields(buf, pos, end):
+                if number == 1:
+                    append(_value(buf, *value))
+            return values
+        length = buf[pos + 1]
+        if length >= 0x80:
+            length, start = _varint(buf, pos + 1)
+        else:
+            start = pos + 2
+        pos = start + length
+        if length == 0:
+            append(None)
+            continue
+        tag = buf[start]
+        if tag == 0x0a and buf[start + 1] < 0x80 and start + 2 + buf[start + 1] == pos: # string
+            append(buf[start + 2:pos].decode("utf-8"))
+        elif tag == 0x19 and length == 9: # double
+            append(_double(buf, start + 1)[0])
+        elif tag == 0x40: # sint64, dates among them
+            value = _varint(buf, start + 1)[0]
+            append((value >> 1) ^ -(value & 1))
+        else:
+            append(_value(buf, start, pos))
+    if pos != end:
+        raise ValueError("truncated protobuf message")
+    return values
+
+def _feature_result(buf, start, end):
+    result = {"features": []}
+    names = []
+    features = result["features"]
+    for number, wire, value in _fields(buf, start, end):
+        if number == 1:
+            result["objectIdFieldName"] = _string(buf, value)
+        elif number == 9:
+            result["exceededTransferLimit"] = bool(value)
+        elif number == 13:
+            names.append(next((_string(buf, v) for n, w, v in _fields(buf, *value) if n == 1), ""))
+        elif number == 15:
+            features.append({"attributes": dict(zip(names, _attributes(buf, *value)))})
+    return result
+
+def _ids_result(buf, start, end):
+    result = {"objectIds": []}
+    for number, wire, value in _fields(buf, start, end):
+        if number == 1:
+            result["objectIdFieldName"] = _string(buf, value)
+        elif number == 3 and wire == 2: # packed
+            pos, stop = value
+            while pos < stop:
+                oid, pos = _varint(buf, pos)
+                result["objectIds"].append(oid)
+        elif number == 3:
+            result["objectIds"].append(value)
+    return result
+
+def decode(content):
+    """ a FeatureCollectionPBuffer query response as the equivalent f=json dict ("features", "count" or
+        "objectIds"); raises ValueError if the content isn't one """
+    buf = bytes(content)
+    try:
+        for number, wire, value in _fields(buf, 0, len(buf)):
+            if number != 2 or wire != 2:
+                continue
+            for kind, w, span in _fields(buf, *value):
+                if kind == 1:
+                    return _feature_result(buf, *span)
+                if kind == 2:
+                    return {"count": next((v for n, w, v in _fields(buf, *span) if n == 1), 0)}
+                if kind == 3:
+                    return _ids_result(buf, *span)
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise ValueError("malformed protobuf response: %s" % e)
+    raise ValueError("protobuf response without a query result")
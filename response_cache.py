@@ -0,0 +1,185 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Content-addressed on-disk cache of ArcGIS responses (see arcweb_data.py). Entries are JSON files named by the sha256
+# of the request (layer URL, sorted IN-list and output fields), so the same batch of tenures always maps to the same
+# file no matter the order the tenures were listed in. Entries older than the TTL are ignored and removed, and the
+# oldest entries are evicted once the cache grows past its size limit. The cache's size is tracked as entries are
+# written, so the directory is only scanned when the limit is crossed and every EVICT_EVERY writes (for expired
+# entries), not on every write.
+#
+# Modes:
+#   off: no caching
+#   use: fresh entries are served from the cache, misses are fetched and stored, so a refresh that fails partway
+#        resumes from the batches it already retrieved
+#   record: every request goes to the server and the response is stored
+#   replay: responses only come from the cache (regardless of age) and a miss raises CacheMiss; no network access
+#
+# A server override (e.g. http://127.0.0.1:8000) sends every request that does reach the network to a local stand-in
+# server in place of the jurisdiction's host, keeping the path and query.
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from threading import Lock
+from time import time
+from urllib.parse import urlsplit, urlunsplit
+
+class CacheMiss(KeyError):
+    """ raised in replay mode when a response is not in the cache """
+    pass
+
+class ResponseCache:
+    """ on-disk ArcGIS response cache with TTL and size-based eviction """
+    modes = ("off", "use", "record", "replay")
+    EVICT_EVERY = 500 # writes between scans for expired entries
+    LOW_WATER = 0.9 # eviction frees space down to this share of max_bytes, so that scans stay infrequent
+
+    def __init__(self, directory="cache", mode="use", ttl=86400, max_bytes=256 * 2**20, server=""):
+        if mode not in self.modes:
+            raise ValueError("unsupported cache mode <" + mode + ">")
+        self.directory = directory
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.server = server.rstrip("/")
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self._bytes = None # total size of the entries, None until the first scan
+        self._puts = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(url, params=None):
+        """ the content address of a request; IN-lists in the where clause are sorted first """
+        params = dict(params or {})
+        where = params.get("where", "")
+        if " IN (" in where and where.endswith(")"):
+            col, values = where[:-1].split(" IN (", 1)
+            params["where"] = col + " IN (" + ",".join(sorted(values.split(","))) + ")"
+        payload = json.dumps({"url": url, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def reads(self):
+        """ whether cached entries are served """
+        return self.mode in ("use", "replay")
+
+    def writes(self):
+        """ whether fetched responses are stored """
+        return self.mode in ("use", "record")
+
+    def rewrite(self, url):
+        """ point a URL at the stand-in server, if one is set """
+        if not self.server:
+            return url
+        server = urlsplit(self.server)
+        parts = urlsplit(url)
+        return urlunsplit((server.scheme, server.netloc, parts.path, parts.query, parts.fragment))
+
+    def get(self, url, params=None):
+        """ the cached value for a request, or None; in replay mode a miss raises CacheMiss """
+        if not self.reads():
+            return None
+        path = self._path(self.key(url, params))
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            if self.mode != "replay" and time() - entry["created"] > self.ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            if self.mode == "replay":
+                raise CacheMiss(url)
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry["value"]
+
+    def put(self, url, params, value):
+        """ store the value for a request, then evict down to the size limit if it has been crossed """
+        if not self.writes():
+            return
+        path = self._path(self.key(url, params))
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        tmp = None
+        try:
+            # a unique temporary file per write, the prefetch and snapshot threads can store the same entry at once
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=directory)
+            with os.fdopen(fd, "w") as f:
+                json.dump({"url": url, "params": params, "created": time(), "value": value}, f)
+                size = f.tell()
+            os.replace(tmp, path) # readers never see a partial entry
+        except OSError as e:
+            logging.error("Failed to write the ArcGIS response cache entry <%s>", path)
+            logging.error(e)
+            if tmp is not None:
+                self._remove(tmp)
+            return
+        with self._lock:
+            self._puts += 1
+            if self._bytes is not None:
+                self._bytes += size - replaced
+            scan = self._bytes is None or self._bytes > self.max_bytes or self._puts % self.EVICT_EVERY == 0
+        if scan:
+            self.evict()
+
+    def evict(self):
+        """ remove expired entries, then, if the cache is over max_bytes, the oldest entries until it is back under
+            LOW_WATER of it """
+        with self._lock:
+            now = time()
+            entries = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".json"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    if self.mode != "replay" and now - st.st_mtime > self.ttl:
+                        self._remove(path)
+                    else:
+                        entries.append((st.st_mtime, st.st_size, path))
+            total = sum(e[1] for e in entries)
+            target = self.max_bytes if total <= self.max_bytes else self.max_bytes * self.LOW_WATER
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                self._remove(path)
+                total -= size
+            self._bytes = total
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
@@ -13,7 +13,9 @@
 # COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from claimtable import TableDefinition
+from claimtable import TableDefinition, shared_refresh
+import metrics
+import tracing
 import configparser
 import logging
 import os
@@ -23,6 +25,7 @@ from datetime import datetime, timedelta
 import pandas as pd
 from time import time, sleep
 from pymysqlreplication import BinLogStreamReader
+from pymysqlreplication.event import QueryEvent
 from pymysqlreplication.row_event import DeleteRowsEvent, UpdateRowsEvent, WriteRowsEvent
 from sqlalchemy import exc
 import smtplib
@@ -31,6 +34,51 @@ from email.mime.multipart import MIMEMultipart
 
 email_template_path = "templates/__email.html"
 
+class RefreshTiers:
+    """ refresh cadence by NextDueDate between a table's full updates: each tier is (horizon in days, interval in
+        seconds), and tenures due within a tier's horizon (and not within a nearer tier's) are refreshed every
+        interval, overdue tenures with the nearest tier. tenures beyond the last horizon, and those without a
+        NextDueDate, only follow the table's UpdateSched. spec is "days:seconds, ...", e.g. "28:3600, 182:86400" """
+    CHUNK = 1000 # tenure IDs per targeted update, as in the tenure cache lookups
+
+    def __init__(self, spec=""):
+        self.tiers = self.parse(spec)
+        self.last = {} # (table title, tier) -> time the tier was last refreshed
+
+    @staticmethod
+    def parse(spec):
+        tiers = []
+        for item in (spec or "").split(","):
+            if not item.strip():
+                continue
+            horizon, interval = (int(v) for v in item.split(":"))
+            if horizon <= 0 or interval <= 0:
+                raise ValueError("refresh tier <%s> must have a positive horizon and interval" % item.strip())
+            tiers.append((horizon, interval))
+        return sorted(tiers)
+
+    def due(self, table, now):
+        """ (tier, NextDueDate lower bound or None, upper bound, interval) of the table's tiers that are due; a table
+            seen for the first time starts its intervals now """
+        due = []
+        today = datetime.now()
+        after = None
+        for tier, (horizon, interval) in enumerate(self.tiers):
+            before = today + timedelta(days=horizon)
+            last = self.last.setdefault((table.title, tier), now)
+            if now - last >= interval:
+                due.append((tier, after, before, interval))
+            after = before
+        return due
+
+    def done(self, table, tier, now):
+        self.last[(table.title, tier)] = now
+
+    def reset(self, table, now):
+        """ after a full update every tier of the table is fresh """
+        for tier in range(len(self.tiers)):
+            self.done(table, tier, now)
+
 class Scheduler(threading.Thread):
     """ the Scheduler thread performs three tasks:
         1) connects to the MySQL binlog stream and monitors changes to the claimtable SQL tables, synchronizing with
@@ -43,7 +91,9 @@ class Scheduler(threading.Thread):
         super(Scheduler, self).__init__(daemon=True)
         self.stream = None
         self.configuration = configuration
+        self.tiers = RefreshTiers(configuration.get("Tables", "refresh_tiers", fallback=""))
 
+    @tracing.traced("prepare_email")
     def prepare_email(self, claimtable):
         """ prepares the body of an email with a table of tenures that have anniversary dates < 4 weeks from today """
         today = datetime.now()
@@ -124,10 +174,17 @@ class Scheduler(threading.Thread):
                 "password": self.configuration.get("Database", "root_password")
         }
         self.stream = BinLogStreamReader(connection_settings=db, server_id=100, resume_stream=True, \
-                                    only_events=[DeleteRowsEvent, WriteRowsEvent, UpdateRowsEvent], \
+                                    only_events=[DeleteRowsEvent, WriteRowsEvent, UpdateRowsEvent, QueryEvent], \
                                     enable_logging=False)
         pending_syncs = {}
         SYNC_DELAY = 2 # batch MySQL table changes and synchronize with google sheets every 2 seconds
+        pending_fetches = {} # table -> (time the fetch is due, {jurisdiction: {RegTitleNumber, ...}})
+        FETCH_DELAY = 5 # collect newly added tenures for 5 seconds, then fetch them from ArcGIS in one go
+        FETCH_ATTEMPTS = 8 # failed fetches of new tenures are retried with exponential backoff this many times
+        fetch_failures = {} # (table, jurisdiction) -> consecutive failed fetches of its new tenures
+        RETRY_INTERVAL = 900 # resume refresh runs with pending or failed batches every 15 minutes (and at startup)
+                             # scheduled and manual updates start new runs, only this pass resumes
+        last_retry = 0
 
         # first synchronize changes to the sql table with google sheets
         try:
@@ -143,19 +200,39 @@ class Scheduler(threading.Thread):
                     logging.error(e)
                     binlogevent = None
 
+                from claimtable import claimtables, schema_catalog
                 if binlogevent:
+                    metrics.binlog_lag_seconds.set(max(time() - binlogevent.timestamp, 0))
+                if isinstance(binlogevent, QueryEvent):
+                    # DDL statements change the shape of tables, so the cached schema has to be reloaded
+                    ddl_tables = schema_catalog.ddl_tables(binlogevent.query)
+                    if ddl_tables:
+                        logging.debug("DDL on %s seen in binlog - refreshing schema catalog", ddl_tables)
+                        schema_catalog.invalidate(*ddl_tables)
+                        schema_catalog.refresh(*ddl_tables)
+                elif binlogevent:
                     t_name = binlogevent.table
                     # any event (delete, update or write) makes the table out of sync
                     if isinstance(binlogevent, (DeleteRowsEvent, UpdateRowsEvent, WriteRowsEvent)):
+                        metrics.binlog_events.inc(table=t_name, event=type(binlogevent).__name__)
                         pending_syncs[t_name] = time()
+                    # tenures added without their API data (e.g. by the QGIS tools) are fetched right away
+                    if isinstance(binlogevent, (WriteRowsEvent, UpdateRowsEvent)) and t_name in claimtables:
+                        new_tenures = self.missing_api_data(binlogevent)
+                        if new_tenures:
+                            due_at, tenures = pending_fetches.get(t_name, (0, {}))
+                            for jurisdiction, tenure_id in new_tenures:
+                                tenures.setdefault(jurisdiction, set()).add(tenure_id)
+                            # a retry waiting out its backoff is not brought forward
+                            pending_fetches[t_name] = (max(due_at, time() + FETCH_DELAY), tenures)
 
-                from claimtable import claimtables
                 now = time()
                 ready_to_finalize = [t for t, last_change_time in pending_syncs.items() \
                                      if (now - last_change_time) >= SYNC_DELAY]
+                metrics.scheduler_pending_syncs.set(len(pending_syncs))
                 for t_name in ready_to_finalize:
                     del pending_syncs[t_name]
-                    table_obj = next((t for t in claimtables if t.title == t_name), None)
+                    table_obj = claimtables.get(t_name)
                     if table_obj:
                         try:
                             logging.info("Executing bulk synchronization for table <%s>", t_name)
@@ -164,27 +241,73 @@ class Scheduler(threading.Thread):
                             logging.error("Synchronization cycle failed for <%s>", t_name)
                             logging.error(e)
 
+                ready_to_fetch = [t for t, (due_at, _) in pending_fetches.items() if time() >= due_at]
+                for t_name in ready_to_fetch:
+                    _, tenures = pending_fetches.pop(t_name)
+                    table_obj = claimtables.get(t_name)
+                    if not table_obj:
+                        continue
+                    for jurisdiction, tenure_ids in tenures.items():
+                        if jurisdiction not in table_obj.supported_jurisdictions:
+                            continue
+                        logging.info("Fetching %d new tenures for <%s> (%s)", len(tenure_ids), t_name, jurisdiction)
+                        failed = self.refresh(table_obj, jurisdiction, sorted(tenure_ids))
+                        if not failed:
+                            fetch_failures.pop((t_name, jurisdiction), None)
+                            continue
+                        # queue the tenures of the failed batches again, e.g. while ArcGIS is down
+                        attempts = fetch_failures.get((t_name, jurisdiction), 0) + 1
+                        if attempts >= FETCH_ATTEMPTS:
+                            logging.warning("Giving up on %d new tenures of <%s> (%s) after %d attempts, they are "
+                                            "left to the next scheduled update", len(failed), t_name, jurisdiction,
+                                            attempts)
+                            fetch_failures.pop((t_name, jurisdiction), None)
+                            continue
+                        fetch_failures[(t_name, jurisdiction)] = attempts
+                        backoff = min(FETCH_DELAY * 2 ** attempts, RETRY_INTERVAL)
+                        due_at, queued = pending_fetches.get(t_name, (0, {}))
+                        queued.setdefault(jurisdiction, set()).update(failed)
+                        pending_fetches[t_name] = (max(due_at, time() + backoff), queued)
+
+                # retry only the incomplete batches of interrupted or partially failed refresh runs
+                if time() - last_retry >= RETRY_INTERVAL:
+                    last_retry = time()
+                    for table in claimtables:
+                        # runs started before the latest scheduled update have been superseded by it
+                        incomplete = table.incomplete_refreshes(since=table.last_scheduled_update())
+                        for jurisdiction in incomplete:
+                            logging.info("Resuming incomplete refresh of <%s> (%s)", table.title, jurisdiction)
+                            self.refresh(table, jurisdiction, resume=True)
+                        if incomplete:
+                            table.compaction()
+
                 # then check the time and date for the update process, email process
                 # these functions are blocking; MySQL binlog changes will be backlogged while the process runs below
                 # this could present a race condition - for now it's up to the user to not schedule everything at once
                 now = datetime.now()
-                for table in claimtables:
-                    if not table.update_schedule_iter:
-                        continue
-                    if table.update_schedule_iter <= now:
-                        logging.info("Launching scheduled updater for <%s>", table.title)
-                        for jurisdiction in table.supported_jurisdictions:
-                            table.update(TableDefinition(), jurisdiction)
+                due = [t for t in claimtables if t.update_schedule_iter and t.update_schedule_iter <= now]
+                if due:
+                    logging.info("Launching scheduled updater for %s", ", ".join("<" + t.title + ">" for t in due))
+                    self.refresh_tables(due)
+                    for table in due:
                         table.compaction()
                         table.update_schedule_iter = table.update_schedule.next()
+                        self.tiers.reset(table, time())
+                # between full updates, tenures that are due soon are refreshed more often (see RefreshTiers); the
+                # compaction worksheet is only rebuilt when rows were written
+                for table in claimtables:
+                    if self.refresh_tiers(table):
+                        table.compaction()
+                for table in claimtables:
                     if not table.email_schedule_iter:
                         continue
                     if table.email_schedule_iter <= now:
                         logging.info("Launching scheduled emailer for <%s>", table.title)
                         try:
                             recipients = table.access_list
-                            email_html = self.prepare_email(table)
-                            self.send_email(recipients, str(table.title), email_html)
+                            with metrics.timer(metrics.email_seconds, table=table.title):
+                                email_html = self.prepare_email(table)
+                                self.send_email(recipients, str(table.title), email_html)
                         except Exception as e:
                             logging.error("Error emailing table expiries for <%s>", table.title)
                             logging.error(e)
@@ -202,6 +325,86 @@ class Scheduler(threading.Thread):
             os.kill(os.getpid(), signal.SIGTERM)
             self.stop()
 
+    def refresh_tables(self, tables):
+        """ refresh every jurisdiction of the due tables; a jurisdiction shared by several tables is fetched once
+            for all of them (see claimtable.shared_refresh) """
+        jurisdictions = {}
+        for table in tables:
+            for jurisdiction in table.supported_jurisdictions:
+                jurisdictions.setdefault(jurisdiction, []).append(table)
+        for jurisdiction, sharing in jurisdictions.items():
+            if len(sharing) == 1:
+                self.refresh(sharing[0], jurisdiction)
+                continue
+            try:
+                shared_refresh(sharing, jurisdiction)
+            except exc.SQLAlchemyError:
+                raise
+            except Exception as e:
+                logging.error("Shared refresh of %s failed", jurisdiction)
+                logging.error(e)
+
+    def refresh_tiers(self, table):
+        """ refresh the tenures of the table's due tiers, RefreshTiers.CHUNK IDs per update; returns whether any row
+            was written. the tenure cache serves a tier only what was fetched within its interval, so tables sharing
+            tenures fetch them once """
+        rows_written = 0
+        for tier, after, before, interval in self.tiers.due(table, time()):
+            try:
+                tenures = table.due_tenures(before, after)
+            except exc.SQLAlchemyError as e:
+                logging.error("Error retrieving due tenures from table <%s>", table.title)
+                logging.error(e)
+                continue
+            for jurisdiction, tenure_ids in tenures.items():
+                if jurisdiction not in table.supported_jurisdictions:
+                    continue
+                logging.info("Refreshing %d tenures of <%s> (%s) due before %s", len(tenure_ids), table.title,
+                             jurisdiction, before.strftime("%Y-%m-%d"))
+                for start in range(0, len(tenure_ids), self.tiers.CHUNK):
+                    progress = table.update_progress
+                    self.refresh(table, jurisdiction, tenure_ids[start:start + self.tiers.CHUNK], max_age=interval)
+                    if table.update_progress is not progress: # update() didn't return before starting
+                        rows_written += table.update_progress.get("rows", 0)
+                metrics.tier_refresh_tenures.inc(len(tenure_ids), table=table.title, tier=str(tier))
+            self.tiers.done(table, tier, time())
+        return rows_written > 0
+
+    @staticmethod
+    def missing_api_data(binlogevent, definition=None):
+        """ (jurisdiction, tenure ID) of the rows of a write event, or of an update event that sets the jurisdiction,
+            that have none of the data fetched from ArcGIS yet; the key and jurisdiction columns are those of the
+            TableDefinition """
+        definition = definition or TableDefinition()
+        key_col, jurisdiction_col = definition.keyCol, definition.jurisdictionCol
+        tenures = []
+        for row in binlogevent.rows:
+            if "after_values" in row:
+                if row["before_values"].get(jurisdiction_col) is not None:
+                    continue # only rows that were given a jurisdiction (see the QGIS Add tool)
+                values = row["after_values"]
+            else:
+                values = row["values"]
+            if values.get(jurisdiction_col) and values.get(key_col) is not None and \
+                    all(values.get(c) is None for c in ("RegDate", "NextDueDate", "Owner")):
+                tenures.append((values[jurisdiction_col], str(values[key_col])))
+        return tenures
+
+    def refresh(self, table, jurisdiction, RegTitleNumber=None, max_age=None, resume=False):
+        """ run (or, with resume, resume) the refresh of one jurisdiction, or fetch only the tenures in
+            RegTitleNumber; an error here is logged rather than stopping the scheduler. returns the tenure IDs that
+            weren't refreshed: failed batches of a full run are also checkpointed by ClaimTable.update and resumed by
+            the retry pass, targeted fetches are queued again by the caller """
+        try:
+            return table.update(TableDefinition(), jurisdiction, RegTitleNumber=RegTitleNumber, max_age=max_age,
+                                resume=resume) or []
+        except exc.SQLAlchemyError:
+            raise
+        except Exception as e:
+            logging.error("Refresh of <%s> (%s) failed", table.title, jurisdiction)
+            logging.error(e)
+            return [str(t) for t in RegTitleNumber] if isinstance(RegTitleNumber, list) else []
+
     def stop(self):
         try:
             self.stream.close()
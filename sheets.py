@@ -0,0 +1,55 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Serialization of dataframes into the row-major values payload of the Google Sheets API. Each column is converted
+# once, according to its dtype, into an array of strings (the same text pygsheets' set_dataframe would send), with
+# missing values (NaN, NaT, None) written as empty cells. Dates use pandas' vectorized formatting, which drops the
+# time of day when every value in the column falls on midnight.
+import numpy as np
+import pandas as pd
+import pygsheets
+
+def column_values(series):
+    """ convert one column to an object array of strings, with empty strings where values are missing """
+    missing = series.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = series.astype(str).to_numpy(dtype=object)
+    elif isinstance(series.dtype, np.dtype) and series.dtype.kind in "biuf":
+        # plain numpy numbers and booleans format straight to fixed-width strings
+        values = series.to_numpy().astype(str).astype(object)
+    else:
+        values = series.to_numpy(dtype=object).astype(str).astype(object)
+    if missing.any():
+        values[missing] = ""
+    return values
+
+def dataframe_values(df, header=True):
+    """ the values matrix (a list of rows) for a dataframe, optionally preceded by the column names """
+    rows = []
+    if header:
+        rows.append([str(c) for c in df.columns])
+    if len(df.columns) and len(df):
+        columns = [column_values(df.iloc[:, i]) for i in range(len(df.columns))]
+        rows += np.column_stack(columns).tolist()
+    return rows
+
+def write_dataframe(wks, df, start=(1, 1), fit=True, copy_head=True):
+    """ write a dataframe to a worksheet in a single values update, resizing the worksheet to the data if fit """
+    values = dataframe_values(df, header=copy_head)
+    if not values:
+        return
+    start = pygsheets.Address(start)
+    if fit:
+        wks.resize(rows=start[0] - 1 + len(values), cols=start[1] - 1 + len(df.columns))
+    wks.update_values(crange=start.label, values=values)
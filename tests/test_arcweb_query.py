@@ -0,0 +1,93 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Format negotiation in arcweb_data.query: when an f=pbf query falls back to JSON for the rest of the session
+import json
+import pytest
+import requests
+import arcweb_data
+from fakes import encode_pbf
+
+LAYER = "https://example.com/arcgis/rest/services/Claims/FeatureServer/0"
+
+class Response:
+    def __init__(self, status, content, content_type):
+        self.status_code = status
+        self.content = content
+        self.headers = {"Content-Type": content_type}
+        self.raw = None
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code), response=self)
+
+@pytest.fixture
+def server(monkeypatch):
+    """ replaces requests.get with the given responses to f=pbf and f=json queries """
+    answers = {}
+    calls = []
+    def get(url, params=None, **kwargs):
+        calls.append(params["f"])
+        return answers[params["f"]]
+    monkeypatch.setattr(arcweb_data.requests, "get", get)
+    monkeypatch.setattr(arcweb_data.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(arcweb_data, "cache", None)
+    arcweb_data._json_only.discard(LAYER)
+    arcweb_data.breakers.get("example.com").success()
+    yield answers, calls
+    arcweb_data._json_only.discard(LAYER)
+
+FEATURES = {"features": [{"attributes": {"ID": "1"}}]}
+
+def test_pbf(server):
+    answers, calls = server
+    answers["pbf"] = Response(200, encode_pbf(FEATURES), "application/x-protobuf")
+    assert arcweb_data.query(LAYER, {"where": "1=1", "f": "json"})["features"] == FEATURES["features"]
+    assert calls == ["pbf"]
+
+@pytest.mark.parametrize("answer", [Response(400, b"Invalid format", "text/html"),
+                                    Response(200, b"<html>not a protocol buffer</html>", "text/html")])
+def test_falls_back_to_json(server, answer):
+    answers, calls = server
+    answers["pbf"] = answer
+    answers["json"] = Response(200, json.dumps(FEATURES).encode("utf-8"), "application/json")
+    assert arcweb_data.query(LAYER, {"where": "1=1", "f": "json"})["features"] == FEATURES["features"]
+    assert LAYER in arcweb_data._json_only
+    assert calls == ["pbf", "json"]
+
+@pytest.mark.parametrize("content_type", ["application/json", "text/plain"])
+@pytest.mark.parametrize("error", [{"code": 400, "message": "Unable to complete operation.", "details": []},
+                                   {"code": 500, "message": "Invalid or missing input parameters.",
+                                    "details": ["'f' parameter: format 'pbf' not supported"]}])
+def test_json_format_error_falls_back_to_json(server, error, content_type):
+    answers, calls = server
+    answers["pbf"] = Response(200, json.dumps({"error": error}).encode("utf-8"), content_type)
+    answers["json"] = Response(200, json.dumps(FEATURES).encode("utf-8"), "application/json")
+    assert arcweb_data.query(LAYER, {"where": "1=1", "f": "json"})["features"] == FEATURES["features"]
+    assert LAYER in arcweb_data._json_only
+    assert calls == ["pbf", "json"]
+    assert arcweb_data.breakers.get("example.com").state() == "closed"
+
+def test_json_error_reply_is_a_query_error(server):
+    answers, calls = server
+    answers["pbf"] = Response(200, b'{"error": {"code": 500, "message": "Unable to complete operation"}}',
+                              "application/json")
+    with pytest.raises(ValueError):
+        arcweb_data.query(LAYER, {"where": "1=1", "f": "json"}, max_retries=2)
+    assert LAYER not in arcweb_data._json_only
+    assert calls == ["pbf", "pbf"]
+    assert arcweb_data.breakers.get("example.com").state() == "closed"
@@ -0,0 +1,44 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Round trips of query results through the benchmark encoder (fakes.encode_pbf) and pbf.decode
+import pytest
+import pbf
+from fakes import encode_pbf
+
+def test_features():
+    result = {"features": [{"attributes": {"SERIALNUMB": "NMC%07d" % i, "CLAIMANT": "Owner é %d" % i,
+                                           "LOCDATE": 1500000000000 + i, "DELTA": -i, "AREA": 20.5 + i,
+                                           "ACTIVE": i % 2 == 0, "NOTE": None}} for i in range(200)],
+              "exceededTransferLimit": True}
+    decoded = pbf.decode(encode_pbf(result))
+    assert decoded["features"] == result["features"]
+    assert decoded["exceededTransferLimit"] is True
+    assert decoded["objectIdFieldName"] == "OBJECTID"
+
+def test_long_strings_and_empty_result():
+    result = {"features": [{"attributes": {"NAME": "x" * 300}}]}
+    assert pbf.decode(encode_pbf(result))["features"] == result["features"]
+    assert pbf.decode(encode_pbf({"features": []}))["features"] == []
+
+def test_count_and_ids():
+    assert pbf.decode(encode_pbf({"count": 123456})) == {"count": 123456}
+    ids = {"objectIdFieldName": "FID", "objectIds": [1, 2, 127, 128, 300000, 2**40]}
+    assert pbf.decode(encode_pbf(ids)) == ids
+
+@pytest.mark.parametrize("content", [b"", b'{"error": {"code": 400}}', encode_pbf({"count": 5})[:-1],
+                                     b"\x0a\xff\xff\xff\xff\x0f"])
+def test_not_a_query_result(content):
+    with pytest.raises(ValueError):
+        pbf.decode(content)
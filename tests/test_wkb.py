@@ -0,0 +1,48 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Grouping of ArcGIS rings into polygons, and the WKB <-> GeoJSON round trip of polygons and points
+import wkb
+
+SQUARE = [[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]] # clockwise, an outer ring
+HOLE = [[2, 2], [4, 2], [4, 4], [2, 4], [2, 2]] # counter-clockwise
+OTHER = [[20, 0], [20, 5], [25, 5], [25, 0], [20, 0]]
+OTHER_HOLE = [[21, 1], [22, 1], [22, 2], [21, 2], [21, 1]]
+
+def test_single_ring():
+    assert wkb.polygons([SQUARE]) == [[SQUARE]]
+
+def test_holes_go_to_the_ring_containing_them():
+    # the hole of the first polygon is listed after the second polygon
+    assert wkb.polygons([SQUARE, OTHER, OTHER_HOLE, HOLE]) == [[SQUARE, HOLE], [OTHER, OTHER_HOLE]]
+
+def test_counter_clockwise_outer_rings():
+    ccw = SQUARE[::-1]
+    assert wkb.polygons([ccw]) == [[ccw]]
+
+def test_degenerate_rings_are_dropped():
+    assert wkb.polygons([[[0, 0], [1, 1], [0, 0]], SQUARE]) == [[SQUARE]]
+
+def test_round_trip():
+    geometry = wkb.to_geojson(wkb.from_esri({"rings": [SQUARE, HOLE, OTHER]}))
+    assert geometry == {"type": "MultiPolygon", "coordinates": [[SQUARE, HOLE], [OTHER]]}
+
+def test_point():
+    assert wkb.to_geojson(wkb.from_esri({"x": -117.5, "y": 39.25})) == {"type": "Point", "coordinates": [-117.5, 39.25]}
+
+def test_no_geometry():
+    assert wkb.from_esri(None) is None
+    assert wkb.from_esri({"rings": []}) is None
+    assert wkb.from_esri({"x": None, "y": None}) is None
+    assert wkb.from_esri({"paths": [[[0, 0], [1, 1]]]}) is None
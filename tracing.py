@@ -0,0 +1,249 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Opt-in tracing of individual runs (updates, compactions, bulk synchronizations, emails and the startup load). Each
+# traced call opens a span; spans nest, and the time spent in the database, in ArcGIS HTTP requests and in Google
+# Sheets API calls is accumulated on every open span (the categories can overlap, since ArcGIS batches are fetched on
+# a prefetch thread while the previous batch is written). When the outermost span of a run closes, a JSON timing
+# report is written to the reports directory, where the /reports routes serve it. For one selected table, runs are
+# also profiled with cProfile and the top functions are included in the report.
+#
+# With tracing disabled (the default) spans cost a thread-local lookup and nothing is recorded.
+import cProfile
+import functools
+import inspect
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+from datetime import datetime
+from time import perf_counter
+
+CATEGORIES = ("db", "http", "sheets")
+
+class Span:
+    def __init__(self, name, attrs, parent=None):
+        self.name = name
+        self.attrs = {k: v for k, v in attrs.items() if v is not None}
+        self.parent = parent
+        self.children = []
+        self.started = datetime.now()
+        self.start = perf_counter()
+        self.duration = None
+        self.times = dict.fromkeys(CATEGORIES, 0.0)
+        self.counts = dict.fromkeys(CATEGORIES, 0)
+        self.error = None
+        self._lock = threading.Lock() # categories can be accounted from the prefetch thread
+
+    def account(self, category, seconds):
+        with self._lock:
+            self.times[category] += seconds
+            self.counts[category] += 1
+
+    def report(self):
+        return {
+            "name": self.name,
+            "attrs": self.attrs,
+            "started": self.started.strftime("%Y-%m-%d %H:%M:%S.%f"),
+            "duration_s": round(self.duration or 0.0, 6),
+            "time_s": {c: round(t, 6) for c, t in self.times.items()},
+            "calls": dict(self.counts),
+            "error": self.error,
+            "children": [c.report() for c in self.children]
+        }
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.directory = "reports"
+        self.profile_table = ""
+        self.max_reports = 100
+        self._local = threading.local()
+        self._profile_lock = threading.Lock()
+
+    def configure(self, enabled=False, directory="reports", profile_table="", max_reports=100):
+        self.enabled = enabled
+        self.directory = directory
+        self.profile_table = profile_table
+        self.max_reports = max_reports
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        """ the innermost open span of this thread, to attach to another thread (see arcweb_data.prefetch) """
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def attach(self, span):
+        """ make span (and its parents) the open spans of this thread """
+        stack = []
+        while span is not None:
+            stack.insert(0, span)
+            span = span.parent
+        self._local.stack = stack
+
+    def account(self, category, seconds):
+        """ add time spent in a category to every open span of this thread """
+        if category in getattr(self._local, "measuring", ()):
+            return # already timed by an enclosing measure() block
+        for span in self._stack():
+            span.account(category, seconds)
+
+    def measure(self, category):
+        """ time a block into a category; finer-grained accounting of the same category inside it is ignored """
+        return _Measure(self, category)
+
+    def span(self, name, **attrs):
+        return _SpanContext(self, name, attrs)
+
+    def _profiled(self, span):
+        return self.profile_table and span.attrs.get("table") == self.profile_table
+
+    def _write_report(self, span, profile_text=None):
+        report = span.report()
+        if profile_text:
+            report["profile"] = profile_text
+        filename = "%s_%s%s.json" % (span.started.strftime("%Y%m%d-%H%M%S-%f"), span.name,
+                                     "_" + span.attrs["table"] if "table" in span.attrs else "")
+        try:
+            with open(os.path.join(self.directory, filename), "w") as f:
+                json.dump(report, f, indent=1, default=str)
+        except OSError as e:
+            logging.error("Unable to write the timing report <%s>", filename)
+            logging.error(e)
+            return
+        self._prune()
+
+    def _prune(self):
+        reports = sorted(f for f in os.listdir(self.directory) if f.endswith(".json"))
+        for name in reports[:max(len(reports) - self.max_reports, 0)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def reports(self):
+        """ summaries of the stored reports, newest first """
+        summaries = []
+        if not os.path.isdir(self.directory):
+            return summaries
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r") as f:
+                    report = json.load(f)
+            except (OSError, ValueError):
+                continue
+            summaries.append({"report": name[:-5], "name": report["name"], "attrs": report["attrs"],
+                              "started": report["started"], "duration_s": report["duration_s"],
+                              "time_s": report["time_s"], "error": report["error"]})
+        return summaries
+
+    def report(self, name):
+        """ a stored report by name, or None """
+        if os.path.basename(name) != name:
+            return None
+        try:
+            with open(os.path.join(self.directory, name + ".json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+class _Measure:
+    def __init__(self, tracer, category):
+        self.tracer = tracer
+        self.category = category
+
+    def __enter__(self):
+        self.outer = getattr(self.tracer._local, "measuring", ())
+        self.tracer._local.measuring = self.outer + (self.category,)
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.tracer._local.measuring = self.outer
+        if self.category not in self.outer:
+            self.tracer.account(self.category, perf_counter() - self.start)
+        return False
+
+class _SpanContext:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.span = None
+        self.profiler = None
+
+    def __enter__(self):
+        if not self.tracer.enabled:
+            return None
+        stack = self.tracer._stack()
+        parent = stack[-1] if stack else None
+        self.span = Span(self.name, self.attrs, parent)
+        if parent is not None:
+            parent.children.append(self.span)
+        elif self.tracer._profiled(self.span) and self.tracer._profile_lock.acquire(blocking=False):
+            # one profiler at a time; a run that starts while another is being profiled is only timed
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        stack.append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is None:
+            return False
+        span = self.span
+        span.duration = perf_counter() - span.start
+        if exc is not None:
+            span.error = repr(exc)
+        stack = self.tracer._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        if span.parent is None:
+            profile_text = None
+            if self.profiler is not None:
+                self.profiler.disable()
+                out = io.StringIO()
+                pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(30)
+                profile_text = out.getvalue()
+                self.tracer._profile_lock.release()
+            self.tracer._write_report(span, profile_text)
+        return False
+
+def traced(name):
+    """ decorator running a function in a span; the table is taken from self.title (or a claimtable argument) and
+        the jurisdiction from a jurisdiction argument, when the function has them """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            bound = signature.bind_partial(*args, **kwargs).arguments
+            owner = bound.get("claimtable", bound.get("self"))
+            with tracer.span(name, table=getattr(owner, "title", None), jurisdiction=bound.get("jurisdiction")):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+tracer = Tracer()
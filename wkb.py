@@ -0,0 +1,111 @@
+# Copyright (c) 2026 Welcome North Capital Corp.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# Conversions between ArcGIS JSON geometries, well-known binary (WKB) and GeoJSON, for the tenure geometries kept in
+# the _Tenure_Geometry table (see claimtable.GeometryCache). Polygons are stored as little-endian 2D WKB
+# MultiPolygons, which MySQL reads with ST_GeomFromWKB and QGIS reads directly; layers of claim points (NV) give
+# WKB Points.
+#
+# ArcGIS polygons are a flat list of rings, outer rings clockwise and holes counter-clockwise; each hole is given
+# to the outer ring that contains it.
+import struct
+
+POINT = 1
+POLYGON = 3
+MULTIPOLYGON = 6
+_header = struct.Struct("<BI")
+_count = struct.Struct("<I")
+_point = struct.Struct("<dd")
+
+def _signed_area(ring):
+    return sum(x1 * y2 - x2 * y1 for (x1, y1, *_), (x2, y2, *_) in zip(ring, ring[1:] + ring[:1])) / 2
+
+def _contains(ring, x, y):
+    """ whether the point is inside the ring (even-odd rule) """
+    inside = False
+    for (x1, y1, *_), (x2, y2, *_) in zip(ring, ring[1:] + ring[:1]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+def polygons(rings):
+    """ group ArcGIS rings into polygons, [outer ring, holes...] each """
+    shells = []
+    holes = []
+    for ring in rings:
+        if len(ring) < 4:
+            continue
+        (shells if _signed_area(ring) <= 0 else holes).append(ring)
+    if not shells: # counter-clockwise outer rings, as some services return them
+        shells, holes = holes, []
+    result = [[shell] for shell in shells]
+    for hole in holes:
+        x, y = hole[0][:2]
+        owner = next((p for p in result if _contains(p[0], x, y)), result[-1])
+        owner.append(hole)
+    return result
+
+def from_esri(geometry):
+    """ an ArcGIS JSON polygon ({"rings": [...]}) or point ({"x": ..., "y": ...}) as WKB, None if it is empty or of
+        another type """
+    geometry = geometry or {}
+    if geometry.get("x") is not None and geometry.get("y") is not None:
+        return _header.pack(1, POINT) + _point.pack(geometry["x"], geometry["y"])
+    parts = polygons(geometry.get("rings") or [])
+    if not parts:
+        return None
+    out = [_header.pack(1, MULTIPOLYGON), _count.pack(len(parts))]
+    for rings in parts:
+        out += [_header.pack(1, POLYGON), _count.pack(len(rings))]
+        for ring in rings:
+            out.append(_count.pack(len(ring)))
+            out += [_point.pack(p[0], p[1]) for p in ring]
+    return b"".join(out)
+
+def to_geojson(wkb):
+    """ a WKB Point, Polygon or MultiPolygon, as written by from_esri, as a GeoJSON geometry """
+    buf = bytes(wkb)
+    pos = 0
+
+    def read(fmt):
+        nonlocal pos
+        values = struct.unpack_from(fmt, buf, pos)
+        pos += struct.calcsize(fmt)
+        return values
+
+    def polygon():
+        rings = []
+        for _ in range(read(order + "I")[0]):
+            n = read(order + "I")[0]
+            coords = read(order + "%dd" % (2 * n))
+            rings.append([[coords[i], coords[i + 1]] for i in range(0, 2 * n, 2)])
+        return rings
+
+    order = "<" if buf[0] == 1 else ">"
+    pos = 1
+    kind = read(order + "I")[0]
+    if kind == POINT:
+        return {"type": "Point", "coordinates": list(read(order + "dd"))}
+    if kind == POLYGON:
+        return {"type": "Polygon", "coordinates": polygon()}
+    if kind != MULTIPOLYGON:
+        raise ValueError("unsupported WKB geometry type %d" % kind)
+    parts = []
+    for _ in range(read(order + "I")[0]):
+        order = "<" if buf[pos] == 1 else ">"
+        pos += 1
+        if read(order + "I")[0] != POLYGON:
+            raise ValueError("MultiPolygon member is not a Polygon")
+        parts.append(polygon())
+    return {"type": "MultiPolygon", "coordinates": parts}